@@ -23,16 +23,35 @@ if not os.getenv("GOOGLE_GEMINI_API_KEY"):
 # --- Helpers Drive (après bootstrap ENV !) ---
 
 from data_access_local import (
-    load_activities_local as load_activities_from_drive,
+    load_activity_summaries as load_activities_from_drive,
+    load_activity_points,
     load_profile_local as load_profile_from_drive,
     save_profile_local,
-    save_activities_local as save_activities_to_drive,
     read_output_json_local as read_output_json,
     write_output_json_local as write_output_json,
+    load_points,
+    points_to_columns,
+    find_activity_by_date,
+    find_activity_by_id,
+    patch_activities_local,
+    upsert_activities_local,
+    kv_get,
+    kv_get_many,
+    kv_items,
+    kv_keys,
+    kv_put,
+    kv_delete,
+    invalidate_cache,
+    cache_stats,
 )
 
 # Import des fonctions de calcul des statistiques par type de run
-from calculate_running_stats import calculate_stats_by_type, save_running_stats
+from calculate_running_stats import RunningStatsAggregator
+import shared_snapshot
+import weather_jobs
+import enrichment_cache
+import serializers
+import migrations
 
 # Pour compatibilité (si jamais utilisé ailleurs)
 class DriveUnavailableError(RuntimeError):
@@ -500,20 +519,19 @@ def generer_dossier_analyse(week_runs: list, weekly_plan: dict, week_objectives:
     return dossier
 
 
+running_stats_aggregator = RunningStatsAggregator(n_last=15)
+
+
 def update_running_stats_after_webhook():
     """
     Met à jour les statistiques de running après un nouveau run
     À appeler après avoir traité un nouveau run (webhook ou index)
     """
     try:
-        # Charger les activités
-        activities = load_activities_from_drive()
-
-        # Calculer les stats par type (15 dernières courses)
-        stats_by_type = calculate_stats_by_type(activities, n_last=15)
-
-        # Sauvegarder dans running_stats.json
-        save_running_stats(stats_by_type, 'running_stats.json')
+        # Fenêtres des 15 dernières courses par type (points relus pour celles-ci
+        # seulement), puis running_stats.json ; les ingestions suivantes ne
+        # mettent à jour que la catégorie touchée
+        stats_by_type = running_stats_aggregator.rebuild()
 
         print("✅ Running stats mises à jour après traitement")
         return stats_by_type
@@ -613,10 +631,13 @@ def generate_ai_coaching(prompt_content, max_tokens=500, temperature=0.3):
         return f"⚠️ Erreur lors de la génération du coaching IA. Veuillez réessayer plus tard."
 
 
-def load_ai_comments():
-    """Charge les commentaires IA principaux sauvegardés depuis outputs/ai_comments.json"""
+def load_ai_comments(dates=None):
+    """
+    Charge les commentaires IA principaux (store outputs/kv/ai_comments, clé = date).
+    Si `dates` est fourni, seuls ces commentaires sont lus.
+    """
     try:
-        comments = read_output_json('ai_comments.json') or {}
+        comments = kv_items('ai_comments') if dates is None else kv_get_many('ai_comments', dates)
         return comments
     except Exception as e:
         print(f"⚠️ Erreur chargement ai_comments: {e}")
@@ -624,26 +645,26 @@ def load_ai_comments():
 
 
 def save_ai_comment(activity_date, comment, segments_count, patterns_count):
-    """Sauvegarde un commentaire IA principal dans outputs/ai_comments.json"""
+    """Sauvegarde un commentaire IA principal (une seule clé réécrite)"""
     try:
-        comments = load_ai_comments()
-        comments[activity_date] = {
+        kv_put('ai_comments', activity_date, {
             'comment': comment,
             'segments_count': segments_count,
             'patterns_count': patterns_count,
             'generated_at': datetime.now().isoformat()
-        }
-        write_output_json('ai_comments.json', comments)
+        })
         print(f"💾 Commentaire IA sauvegardé pour {activity_date}")
     except Exception as e:
         print(f"⚠️ Erreur sauvegarde ai_comment: {e}")
 
 
-def load_zones_comments():
-    """Charge les commentaires IA zones FC depuis outputs/zones_fc_comments.json"""
+def load_zones_comments(dates=None):
+    """
+    Charge les commentaires IA zones FC (store outputs/kv/zones_fc_comments, clé = date).
+    Si `dates` est fourni, seuls ces commentaires sont lus.
+    """
     try:
-        comments = read_output_json('zones_fc_comments.json')
-        return comments if comments is not None else {}
+        return kv_items('zones_fc_comments') if dates is None else kv_get_many('zones_fc_comments', dates)
     except FileNotFoundError:
         return {}
     except Exception:
@@ -651,14 +672,12 @@ def load_zones_comments():
 
 
 def save_zones_comment(activity_date, zones_comment):
-    """Sauvegarde un commentaire IA zones FC dans outputs/zones_fc_comments.json"""
+    """Sauvegarde un commentaire IA zones FC (une seule clé réécrite)"""
     try:
-        comments = load_zones_comments()
-        comments[activity_date] = {
+        kv_put('zones_fc_comments', activity_date, {
             'comment': zones_comment,
             'generated_at': datetime.now().isoformat()
-        }
-        write_output_json('zones_fc_comments.json', comments)
+        })
         print(f"💾 Commentaire zones FC sauvegardé pour {activity_date}")
     except Exception as e:
         print(f"⚠️ Erreur sauvegarde zones_comment: {e}")
@@ -801,7 +820,7 @@ def classify_run_type(activity):
 
     # Si pas de distance_km, essayer depuis points
     if not dist_km or dist_km == 0:
-        pts = activity.get("points", [])
+        pts = load_activity_points(activity)
         if pts and len(pts) > 0:
             dist_km = pts[-1].get("distance", 0) / 1000.0
 
@@ -812,27 +831,12 @@ def classify_run_type(activity):
     # Calcul allure moyenne en min/km
     duree_sec = activity.get('duree_sec', 0)
     if not duree_sec or duree_sec == 0:
-        pts = activity.get("points", [])
+        pts = load_activity_points(activity)
         if pts and len(pts) > 0:
             duree_sec = pts[-1].get("time", 0)
 
-    if duree_sec > 0 and dist_km > 0:
-        pace_min_per_km = (duree_sec / 60.0) / dist_km
-    else:
-        pace_min_per_km = 999  # Pas de données → considéré comme lent
-
-    # Classification par distance
-    if dist_km > 11:
-        return "long_run"
-
-    if dist_km >= 7:
-        return "endurance"
-
-    # < 7 km : distinction selon allure (seuil 5:20/km = 5.333 min/km)
-    if pace_min_per_km <= 5.333:
-        return "tempo_rapide"
-    else:
-        return "tempo_recup"
+    # Classification par distance, puis allure sous 7 km (seuil 5:20/km)
+    return migrations.classify_from_scalars(dist_km, duree_sec)
 
 
 def calculate_type_averages(activities, target_run_type, limit=10):
@@ -1702,13 +1706,14 @@ def calculate_shoe_kilometers(activities, profile):
                 # Essayer d'obtenir la distance
                 distance_m = act.get('distance', 0) or 0
 
-                # Si pas de distance, essayer d'obtenir depuis les points
+                # Sinon distance_km (index), puis dernier point du stream
+                if not distance_m and isinstance(act.get('distance_km'), (int, float)):
+                    distance_m = act['distance_km'] * 1000.0
                 if not distance_m:
-                    points = act.get('points', [])
-                    if points and len(points) > 0:
+                    dists = _activity_columns(act).get('distance')
+                    if dists is not None and len(dists) > 0 and not np.isnan(dists[-1]):
                         # La distance totale est dans le dernier point
-                        last_point = points[-1]
-                        distance_m = last_point.get('distance', 0) or 0
+                        distance_m = float(dists[-1])
 
                 total_km += distance_m / 1000.0
 
@@ -1727,154 +1732,54 @@ def calculate_shoe_kilometers(activities, profile):
         return (0.0, 'unknown')
 
 
-# -------------------
-# Fonction météo (Open-Meteo)
-# -------------------
-
-from collections import Counter
-
-def get_temperature_for_run(lat, lon, start_datetime_str, duration_minutes):
-    try:
-        # ✅ Parse ISO 8601 (Z ou +02:00)
-        start_dt = parser.isoparse(start_datetime_str)
-        end_dt = start_dt + timedelta(minutes=duration_minutes)
-
-        # ✅ Supprime le fuseau pour comparer avec les données naïves de l'API
-        start_dt = start_dt.replace(tzinfo=None)
-        end_dt = end_dt.replace(tzinfo=None)
-
-        print(f"🕒 Heure début (start_dt): {start_dt}, fin (end_dt): {end_dt}")
-    except Exception as e:
-        print("❌ Erreur parsing datetime pour météo:", e, start_datetime_str)
-        return None, None, None, None
-
-    today = date.today()
-    yesterday = today - timedelta(days=1)
-    is_today = start_dt.date() == today
-    is_yesterday = start_dt.date() == yesterday
-
-   # ✅ Utilise forecast pour aujourd'hui et hier
-    if is_today or is_yesterday:
-        query_type = "forecast"
-        url = (
-            f"https://api.open-meteo.com/v1/forecast?"
-            f"latitude={lat}&longitude={lon}"
-            f"&hourly=temperature_2m,weathercode"
-            f"&timezone=auto"
-        )
-    else:
-        query_type = "archive"
-        # Archive pour avant-hier et plus
-        date_str = start_dt.strftime("%Y-%m-%d")
-        url = (
-            f"https://archive-api.open-meteo.com/v1/archive?"
-            f"latitude={lat}&longitude={lon}"
-            f"&start_date={date_str}&end_date={date_str}"
-            f"&hourly=temperature_2m,weathercode"
-            f"&timezone=auto"
-        )
-
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-
-        hours = data.get("hourly", {}).get("time", [])
-        temps = data.get("hourly", {}).get("temperature_2m", [])
-        weathercodes = data.get("hourly", {}).get("weathercode", [])
-
-        if not hours or not temps:
-            print("⚠️ Aucune donnée horaire trouvée.")
-            return None, None, None, None
-
-        # Convertit toutes les heures en datetime (naïves) pour comparaison
-        hours_dt = [datetime.fromisoformat(h) for h in hours]
-
-        # Trouver la température la plus proche pour début et fin
-        def closest_temp(target_dt):
-            diffs = [abs((dt - target_dt).total_seconds()) for dt in hours_dt]
-            idx = diffs.index(min(diffs))
-            return temps[idx] if temps[idx] is not None else None
-
-        temp_debut = closest_temp(start_dt)
-        temp_fin = closest_temp(end_dt)
-
-        # Moyenne sur la fenêtre de course
-        temp_values = [
-            temp for dt, temp in zip(hours_dt, temps)
-            if start_dt <= dt <= end_dt and temp is not None
-        ]
-
-        # ✅ Si pas de moyenne, utiliser au moins temp_debut ou temp_fin
-        avg_temp = (
-            round(sum(temp_values) / len(temp_values), 1)
-            if temp_values else temp_debut or temp_fin
-        )
-
-        # Code météo le plus fréquent pendant la course
-# ✅ Trouver le code météo dominant avec une marge de 30 min
-
-        margin = timedelta(minutes=30)
-        weather_in_window = [
-            wc for dt, wc in zip(hours_dt, weathercodes)
-            if (start_dt - margin) <= dt <= (end_dt + margin) and wc is not None
-        ]
-
-        if weather_in_window:
-            # Si on a trouvé des codes météo dans la fenêtre élargie, on prend le plus fréquent
-            most_common_code = Counter(weather_in_window).most_common(1)[0][0]
-        else:
-            # Sinon, on prend le code météo le plus proche du début de la course
-            diffs = [abs((dt - start_dt).total_seconds()) for dt in hours_dt]
-            most_common_code = weathercodes[diffs.index(min(diffs))] if diffs else None
-
-        return avg_temp, temp_debut, temp_fin, most_common_code
-
-    except Exception as e:
-        print("❌ Erreur lors de la requête ou du traitement météo:", e)
-        return None, None, None, None
-
-
-
 # -------------------
 # Loaders (Drive-only via helpers.data_access)
 # -------------------
-# Cache simple pour le profil (réinitialis é à chaque redémarrage worker)
-_profile_cache = {'data': None, 'timestamp': 0}
-_PROFILE_CACHE_TTL = 60  # secondes
+# Le profil est mis en cache par data_access_local (validé par mtime/taille/inode)
 
 def invalidate_profile_cache():
     """Invalide le cache du profil après modification"""
-    _profile_cache['data'] = None
-    _profile_cache['timestamp'] = 0
+    invalidate_cache('profile')
 
 def load_profile():
-    """Charge le profil avec cache de 60 secondes"""
-    current_time = time.time()
-
-    # Vérifier le cache
-    if _profile_cache['data'] and (current_time - _profile_cache['timestamp']) < _PROFILE_CACHE_TTL:
-        return _profile_cache['data']
-
-    # Charger depuis Drive
+    """Charge le profil (cache mémoire de data_access_local, copie modifiable)"""
     try:
-        profile = load_profile_from_drive()
-        _profile_cache['data'] = profile
-        _profile_cache['timestamp'] = current_time
-        return profile
+        return load_profile_from_drive()
     except DriveUnavailableError:
         return {"birth_date": "", "weight": 0, "events": []}
 
-def load_feedbacks():
-    """Charge les feedbacks depuis outputs/run_feedbacks.json"""
+def load_feedbacks(activity_ids=None):
+    """
+    Charge les feedbacks (store outputs/kv/run_feedbacks, clé = activity_id).
+    Si `activity_ids` est fourni, seuls ces feedbacks sont lus.
+    """
     try:
-        feedbacks = read_output_json('run_feedbacks.json') or {}
+        if activity_ids is None:
+            feedbacks = kv_items('run_feedbacks')
+        else:
+            feedbacks = kv_get_many('run_feedbacks', activity_ids)
         print(f"✅ {len(feedbacks)} feedbacks chargés")
         return feedbacks
     except Exception as e:
         print(f"⚠️ Erreur chargement feedbacks: {e}")
         return {}
 
+
+def load_weekly_scores():
+    """Historique des scores hebdomadaires, du plus ancien au plus récent (clé = début de semaine)"""
+    try:
+        return [score for _, score in sorted(kv_items('weekly_scores').items())]
+    except Exception as e:
+        print(f"⚠️ Erreur chargement scores: {e}")
+        return []
+
+
+def save_weekly_score(score, keep=12):
+    """Ajoute/remplace le score d'une semaine et ne garde que les `keep` dernières"""
+    kv_put('weekly_scores', score['week_start'], score)
+    for week_start in kv_keys('weekly_scores')[:-keep]:
+        kv_delete('weekly_scores', week_start)
+
 def calculate_personalized_targets(profile, activities):
     """
     Calcule les objectifs personnalisés de k et drift basés sur :
@@ -2004,10 +1909,9 @@ def get_fcmax_from_fractionnes(activities):
     fcmax = 0
     for act in activities:
         if act.get("type_sortie") == "fractionné" or act.get("is_fractionne") is True:
-            for point in act.get("points", []):
-                hr = point.get("hr")
-                if hr is not None and hr > fcmax:
-                    fcmax = hr
+            hrs = _activity_columns(act).get("hr")
+            if hrs is not None and len(hrs) and not np.all(np.isnan(hrs)):
+                fcmax = max(fcmax, float(np.nanmax(hrs)))
     return fcmax
 
 def _compute_denivele_pos(points):
@@ -2015,35 +1919,93 @@ def _compute_denivele_pos(points):
     if not points:
         return 0.0
     alts = np.array([p.get("alt", 0) for p in points], dtype=float)
+    return _denivele_from_alts(alts)
+
+
+def _denivele_from_alts(alts):
+    """D+ (m) depuis un tableau d'altitudes (NaN ignorés)."""
+    if len(alts) == 0:
+        return 0.0
     delta = np.diff(alts, prepend=alts[0])
     denivele = float(np.sum(delta[delta > 0]))
     return round(denivele, 1)
 
 
+def _activity_columns(activity):
+    """
+    Colonnes NumPy des points d'une activité.
+    Lit le store colonnaire (mmap, sans copie) quand il est à jour,
+    sinon convertit les points en mémoire.
+    """
+    points = activity.get("points") or []
+    columns = load_points(activity.get("activity_id"))
+    if columns is not None and "time" in columns and (not points or len(columns["time"]) == len(points)):
+        return columns
+    return points_to_columns(points)
+
+
+def _nan_to_none(column):
+    """Colonne NumPy -> liste Python (JSON des graphiques), NaN -> None."""
+    return [None if v != v else v for v in column.tolist()]
+
+
+def _present(column):
+    """Masque des valeurs renseignées et non nulles (équivalent de `if p.get(canal)`)."""
+    return ~np.isnan(column) & (column != 0)
+
+
+# Version des calculs de enrich_single_activity / analyze_cardiac_health :
+# l'incrémenter quand un calcul change (empreintes invalidées, résultats recalculés)
+ENRICH_VERSION = 1
+CARDIAC_ANALYSIS_VERSION = 1
+
+
+def enrich_if_changed(activity, fc_max_fractionnes):
+    """
+    enrich_single_activity seulement si ses entrées ont changé depuis le dernier
+    calcul (empreinte enrich_fingerprint : points, FC max des fractionnés, ENRICH_VERSION).
+    Le profil n'y entre pas : le modifier ne recalcule pas la dérive.
+    """
+    fp = enrichment_cache.fingerprint(
+        enrichment_cache.points_fingerprint(activity, ("time", "distance", "hr", "vel", "alt")),
+        {"fc_max_fractionnes": fc_max_fractionnes}, ENRICH_VERSION)
+    if fp is not None and activity.get("enrich_fingerprint") == fp and isinstance(activity.get("k_moy"), (int, float)):
+        return activity
+    activity = enrich_single_activity(activity, fc_max_fractionnes)
+    if fp is not None:
+        activity["enrich_fingerprint"] = fp
+    return activity
+
+
 def enrich_single_activity(activity, fc_max_fractionnes):
-    points = activity.get("points", [])
-    if not points or len(points) < 5:
+    cols = _activity_columns(activity)
+    n = len(cols["distance"]) if "distance" in cols else 0
+    if n < 5:
         return activity
 
-    distances = np.array([p["distance"]/1000 for p in points])
-    fcs = np.array([p.get("hr") if p.get("hr") is not None else np.nan for p in points])
-    vels = np.array([p.get("vel", 0) for p in points])
-    alts = np.array([p.get("alt", 0) for p in points])
+    def _col(name):
+        return cols[name] if name in cols else np.zeros(n)
+
+    distances = cols["distance"] / 1000
+    fcs = cols["hr"] if "hr" in cols else np.full(n, np.nan)
+    vels = _col("vel")
+    alts = _col("alt")
 
     delta_dist = np.diff(distances, prepend=distances[0]) * 1000
     delta_alt = np.diff(alts, prepend=alts[0])
     delta_dist[delta_dist == 0] = 0.001
 
     pentes = (delta_alt / delta_dist) * 100
-    allures_brutes = np.where(vels > 0, (1 / vels) * 16.6667, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        allures_brutes = np.where(vels > 0, (1 / vels) * 16.6667, np.nan)
     allures_corrigees = np.where((allures_brutes - 0.2 * pentes) < 0, np.nan, allures_brutes - 0.2 * pentes)
 
     ratios = np.where(allures_corrigees > 0, fcs / allures_corrigees, np.nan)
     valid = (~np.isnan(allures_corrigees)) & (~np.isnan(fcs))
 
     # Extraire aussi les temps pour le calcul temporel de la dérive
-    times = np.array([p.get("time", 0) for p in points])
-    times = times[valid]
+    all_times = _col("time")
+    times = all_times[valid]
     distances, fcs, allures_corrigees, ratios, vels = distances[valid], fcs[valid], allures_corrigees[valid], ratios[valid], vels[valid]
 
     if len(distances) < 5:
@@ -2080,7 +2042,7 @@ def enrich_single_activity(activity, fc_max_fractionnes):
         ratios_analysis = ratios[mask_after_300m]
         vels_analysis = vels[mask_after_300m]
 
-    total_duration = points[-1]["time"] - points[0]["time"]
+    total_duration = all_times[-1] - all_times[0]
     slope, _ = np.polyfit(distances_analysis, ratios_analysis, 1)
     r_squared = np.corrcoef(distances_analysis, ratios_analysis)[0,1]**2
     collapse_threshold = np.mean(allures_corrigees_analysis[:max(1,len(allures_corrigees_analysis)//3)]) * 1.10
@@ -2127,11 +2089,12 @@ def enrich_single_activity(activity, fc_max_fractionnes):
     zone2_count = sum(1 for hr in fcs_full if seuil_bas < hr < seuil_haut)  # Sur données complètes
     pourcentage_zone2 = (zone2_count / len(fcs_full)) * 100 if len(fcs_full) else 0
     ratio_fc_allure_global = np.mean(ratios_analysis)  # Sur données après 300m
-    gain_alt = _compute_denivele_pos(points)
+    gain_alt = _denivele_from_alts(alts)
 
     # 🆕 Calculer distance et allure pour l'activité
-    total_dist_km = points[-1].get("distance", 0) / 1000.0
-    total_time_min = (points[-1].get("time", 0) - points[0].get("time", 0)) / 60.0
+    last_dist = cols["distance"][-1]
+    total_dist_km = (0.0 if np.isnan(last_dist) else float(last_dist)) / 1000.0
+    total_time_min = float(all_times[-1] - all_times[0]) / 60.0
     allure_moy = total_time_min / total_dist_km if total_dist_km > 0 else None
     allure_formatted = f"{int(allure_moy)}:{int((allure_moy - int(allure_moy)) * 60):02d}" if allure_moy else "-"
 
@@ -2156,96 +2119,39 @@ def enrich_single_activity(activity, fc_max_fractionnes):
     
 def normalize_cadence_in_place(activities):
     """
-    Convertit une cadence brute (cad_raw / cadence / cad) en 'cad_spm' (steps/min, deux pieds).
-    - Aucun appel réseau
-    - Heuristique one-foot: médiane < 120 => x2
-    - N'écrase pas si 'cad_spm' existe déjà
+    Convertit une cadence brute (cad_raw / cadence / cad) en 'cad_spm' (steps/min, deux pieds)
+    pour chaque activité dont les points sont rattachés (voir migrations.normalize_cadence).
     Retourne (activities, modified:bool)
     """
     modified = False
     for act in activities or []:
-        pts = act.get("points") or []
-        if not pts:
-            continue
-
-        # Si déjà normalisé quelque part, on ne touche à rien
-        if any(isinstance(p.get("cad_spm"), (int, float)) for p in pts):
-            continue
-
-        # Série brute par point (ordre de priorité)
-        raw = []
-        for p in pts:
-            v = (p.get("cad_raw") if p.get("cad_raw") is not None else
-                 p.get("cadence")  if p.get("cadence")  is not None else
-                 p.get("cad")      if p.get("cad")      is not None else
-                 None)
-            raw.append(v)
-
-        vals = [v for v in raw if isinstance(v, (int, float))]
-        if not vals:
-            # pas de cadence dispo
-            act.setdefault("cadence_meta", {
-                "present": False, "units": "spm", "source": "none",
-                "coverage_pct": 0.0, "normalized": False, "one_foot_detected": False
-            })
-            continue
-
-        # Détection "one-foot"
-        median_val = sorted(vals)[len(vals)//2]
-        one_foot = median_val < 120.0
-        factor = 2.0 if one_foot else 1.0
-
-        filled = 0
-        for i, p in enumerate(pts):
-            v = raw[i]
-            if isinstance(v, (int, float)):
-                p["cad_spm"] = float(v) * factor
-                filled += 1
-            else:
-                p.setdefault("cad_spm", None)
-
-        act["cadence_meta"] = {
-            "present": True, "units": "spm", "source": "stream|raw",
-            "coverage_pct": round(100.0*filled/max(1,len(pts)), 1),
-            "normalized": bool(factor == 2.0),
-            "one_foot_detected": bool(one_foot),
-        }
-        modified = True
-
+        modified = migrations.normalize_cadence(act) or modified
     return activities, modified
 
 
-def _cadence_kpis(points):
+def _cadence_kpis(columns):
     """
-    KPIs de cadence à partir de 'cad_spm' :
+    KPIs de cadence à partir des colonnes 'cad_spm' / 'time' :
       - cad_mean_spm (moyenne, spm)
       - cad_cv_pct   (coefficient de variation, %)
       - cad_drift_spm_per_h (pente vs temps, spm/heure)
     Renvoie des '-' si données insuffisantes.
     """
-    if not points:
+    cad, times = columns.get("cad_spm"), columns.get("time")
+    if cad is None or times is None:
         return {"cad_mean_spm": "-", "cad_cv_pct": "-", "cad_drift_spm_per_h": "-"}
 
-    vals, times = [], []
-    t0 = None
-    for p in points:
-        c = p.get("cad_spm")
-        t = p.get("time")
-        if isinstance(c, (int, float)) and isinstance(t, (int, float)):
-            vals.append(float(c))
-            if t0 is None:
-                t0 = t
-            times.append(float(t - t0))
-
-    if len(vals) < 20:
+    valid = ~np.isnan(cad) & ~np.isnan(times)
+    if np.count_nonzero(valid) < 20:
         return {"cad_mean_spm": "-", "cad_cv_pct": "-", "cad_drift_spm_per_h": "-"}
 
-    v = np.array(vals, dtype=float)
+    v = np.asarray(cad[valid], dtype=float)
     m = float(np.nanmean(v))
     s = float(np.nanstd(v))
     cv_pct = round((s / m) * 100.0, 1) if m > 0 else None
 
-    t = np.array(times, dtype=float)
+    t = np.asarray(times[valid], dtype=float)
+    t = t - t[0]
     if np.nanvar(t) > 0 and len(t) == len(v):
         slope_per_sec = float(np.polyfit(t, v, 1)[0])
         drift_spm_per_h = round(slope_per_sec * 3600.0, 2)
@@ -2268,11 +2174,11 @@ def enrich_activities(activities, profile=None):
         if activity.get("type_sortie") in (None, "-", "inconnue") or activity.get("force_recompute", False):
             activity["type_sortie"] = classify_run_type(activity)
 
-        # 2) Enrichissements numériques (k, dérive cardio, etc.)
-        activity = enrich_single_activity(activity, fc_max_fractionnes)
+        # 2) Enrichissements numériques (k, dérive cardio, etc.) si points / FC max ont changé
+        activity = enrich_if_changed(activity, fc_max_fractionnes)
 
-        # 3) Recalculer cardiac_analysis avec les valeurs actuelles du profil (hr_rest, hr_max)
-        # TOUJOURS recalculer pour tenir compte des changements du profil
+        # 3) cardiac_analysis avec les valeurs actuelles du profil (hr_rest, hr_max) :
+        # relue depuis le cache tant que points et profil sont inchangés
         if profile:
             cardiac_analysis = analyze_cardiac_health(activity, profile)
             if cardiac_analysis:
@@ -2282,106 +2188,11 @@ def enrich_activities(activities, profile=None):
         activity.pop("force_recompute", None)
 
     # 4) Ajouter moyennes 10 dernières séances et tendance
-    activities = add_historical_context(activities)
+    activities = shared_snapshot.add_historical_context(activities)
 
     return activities
 
 
-def add_historical_context(activities):
-    """
-    Ajoute pour chaque activité:
-    - k_avg_10: moyenne k des 10 dernières séances du même type
-    - drift_avg_10: moyenne drift des 10 dernières séances du même type
-    - k_trend: tendance (+1 si amélioration, -1 si dégradation, 0 si stable)
-    - drift_trend: tendance (-1 si amélioration, +1 si dégradation, 0 si stable)
-    """
-    # Mapper les types réels vers catégories d'entraînement
-    def get_session_category(act):
-        """
-        Retourne la catégorie de session.
-        Utilise session_category si déjà défini (après reclassification),
-        sinon applique l'ancienne logique pour compatibilité.
-        """
-        # Si session_category est déjà défini, l'utiliser directement
-        if act.get('session_category'):
-            return act.get('session_category')
-
-        # Sinon, utiliser l'ancienne logique (pour compatibilité avec anciennes données)
-        type_sortie = act.get('type_sortie', '')
-        is_fractionne = act.get('is_fractionne', False)
-
-        if is_fractionne:
-            return 'fractionné'
-        elif type_sortie in ['long_run', 'endurance', 'tempo_rapide', 'tempo_recup']:
-            return type_sortie
-        elif type_sortie in ['normal_5k', 'normal_10k']:
-            # Ces types obsolètes ont dû être reclassifiés dans index()
-            # On ne devrait plus les voir ici (OPTIMISATION)
-            return type_sortie  # Retourner tel quel au lieu de reclassifier
-        return None
-
-    for idx, activity in enumerate(activities):
-        current_category = get_session_category(activity)
-
-        # Ajouter la catégorie pour utilisation dans le template
-        activity['session_category'] = current_category
-
-        if not current_category:
-            activity['k_avg_10'] = None
-            activity['drift_avg_10'] = None
-            activity['k_trend'] = 0
-            activity['drift_trend'] = 0
-            continue
-
-        # Récupérer les 10 dernières séances du même type AVANT celle-ci
-        previous_same_type = [
-            act for i, act in enumerate(activities[idx+1:])
-            if get_session_category(act) == current_category
-            and isinstance(act.get('k_moy'), (int, float))
-            and isinstance(act.get('deriv_cardio'), (int, float))
-        ][:10]  # Limiter aux 10 premières trouvées
-
-        if previous_same_type:
-            # Moyennes des 10 dernières
-            k_values = [act['k_moy'] for act in previous_same_type]
-            drift_values = [act['deriv_cardio'] for act in previous_same_type]
-
-            activity['k_avg_10'] = np.mean(k_values)
-            activity['drift_avg_10'] = np.mean(drift_values)
-
-            # Intervalles 80% (P10 et P90)
-            activity['k_p10'] = np.percentile(k_values, 10)
-            activity['k_p90'] = np.percentile(k_values, 90)
-            activity['drift_p10'] = np.percentile(drift_values, 10)
-            activity['drift_p90'] = np.percentile(drift_values, 90)
-
-            # Calculer tendance (comparer première moitié vs deuxième moitié)
-            if len(k_values) >= 6:
-                mid = len(k_values) // 2
-                k_recent_avg = np.mean(k_values[:mid])  # Plus récentes
-                k_older_avg = np.mean(k_values[mid:])   # Plus anciennes
-
-                drift_recent_avg = np.mean(drift_values[:mid])
-                drift_older_avg = np.mean(drift_values[mid:])
-
-                # Pour k: augmentation = amélioration (+1)
-                k_diff = k_recent_avg - k_older_avg
-                activity['k_trend'] = 1 if k_diff > 0.15 else (-1 if k_diff < -0.15 else 0)
-
-                # Pour drift: diminution = amélioration (-1)
-                drift_diff = drift_recent_avg - drift_older_avg
-                activity['drift_trend'] = -1 if drift_diff < -0.03 else (1 if drift_diff > 0.03 else 0)
-            else:
-                activity['k_trend'] = 0
-                activity['drift_trend'] = 0
-        else:
-            activity['k_avg_10'] = None
-            activity['drift_avg_10'] = None
-            activity['k_trend'] = 0
-            activity['drift_trend'] = 0
-
-    return activities
-
 print("✅ Activities OK")
 
 # --- Helper : payload vide mais JS valide (et clés attendues présentes) ---
@@ -2410,6 +2221,7 @@ def _empty_dashboard_payload():
         "temperature": None,
         "weather_code": None,
         "weather_emoji": "❓",
+        "weather_pending": False,
         "labels": "[]",
         "allure_curve": "[]",
         "points_fc": "[]",
@@ -2423,7 +2235,11 @@ def _empty_dashboard_payload():
 # -------------------
 # Dashboard principal
 # -------------------
-def compute_dashboard_data(activities):
+def compute_dashboard_data(activities, history=None):
+    """
+    Dashboard de la dernière activité. `history` : séries k / dérive déjà
+    calculées (instantané partagé), sinon recalculées depuis `activities`.
+    """
     print(f"➡ compute_dashboard_data: activities={len(activities) if activities else 0}")
 
     # 1) Pas d'activités -> payload vide mais JS valide
@@ -2432,14 +2248,14 @@ def compute_dashboard_data(activities):
 
     # 2) Prendre la plus récente activité QUI A DES POINTS (et ne plus l'écraser ensuite)
     last = max(
-        (a for a in activities if isinstance(a.get("points"), list) and a["points"]),
+        (a for a in activities if (isinstance(a.get("points"), list) and a["points"]) or a.get("points_count")),
         key=_date_key,
         default=None
     )
     if last is None:
         return _empty_dashboard_payload()
 
-    points = last["points"]
+    points = load_activity_points(last)
     if not points:
         return _empty_dashboard_payload()
 
@@ -2465,30 +2281,18 @@ def compute_dashboard_data(activities):
         except Exception:
             lat, lon = None, None
 
-    # --- Météo : utiliser si déjà stockée, sinon calcul + sauvegarde sur Drive
+    # --- Météo : lue si déjà stockée, sinon calculée en tâche de fond (weather_jobs) :
+    # aucun appel réseau ici, la page affiche un badge "en cours"
     avg_temperature = last.get("avg_temperature")
     weather_code = last.get("weather_code")
-    temp_debut = avg_temperature
-    temp_fin = avg_temperature
+    temp_debut = last.get("temp_debut", avg_temperature)
+    temp_fin = last.get("temp_fin", avg_temperature)
 
+    weather_pending = False
     if lat is not None and lon is not None and date_str:
-        if avg_temperature is None or weather_code is None:
-            start_datetime_str = last.get("date")  # "2025-07-18T19:45:57Z" par ex.
-            duration_minutes = (points[-1]["time"] - points[0]["time"]) / 60 if points else 0
-            try:
-                avg_temperature, temp_debut, temp_fin, weather_code = get_temperature_for_run(
-                    lat, lon, start_datetime_str, duration_minutes
-                )
-                # Sauvegarde dans l'activité
-                last["avg_temperature"] = avg_temperature
-                last["weather_code"] = weather_code
-                # Mise à jour du fichier Drive pour éviter un recalcul futur
-                save_activities_to_drive(activities)
-                print(f"🌡️ Température calculée et sauvegardée : {avg_temperature}°C")
-            except Exception as e:
-                print("⚠️ get_temperature_for_run a échoué :", e)
-        else:
-            print(f"🌡️ Température lue depuis activities.json : {avg_temperature}°C")
+        weather_status = weather_jobs.request_weather(last)
+        weather_pending = weather_status == weather_jobs.PENDING
+        print(f"🌡️ Météo ({weather_status}) : {avg_temperature}°C")
     else:
         print("⚠️ Impossible d’appeler météo: coordonnées ou date manquantes.")
 
@@ -2534,7 +2338,7 @@ def compute_dashboard_data(activities):
 
     # Historique k / dérive cardiaque (uniquement si numériques)
     history_dates, history_k, history_drift = [], [], []
-    for act in activities:
+    for act in (activities if history is None else []):
         k = act.get("k_moy")
         d = act.get("deriv_cardio")
         if not isinstance(k, (int, float)) or not isinstance(d, (int, float)):
@@ -2554,6 +2358,10 @@ def compute_dashboard_data(activities):
         history_dates  = history_dates[-MAXH:]
         history_k      = history_k[-MAXH:]
         history_drift  = history_drift[-MAXH:]
+    if history is not None:
+        history_dates = history["history_dates"]
+        history_k = history["history_k"]
+        history_drift = history["history_drift"]
 
     print("📊 Dashboard calculé")
 
@@ -2585,6 +2393,7 @@ def compute_dashboard_data(activities):
         "temperature": avg_temperature,
         "weather_code": weather_code,
         "weather_emoji": weather_emoji,
+        "weather_pending": weather_pending,
 
         # Séries pour les graphiques (JSON strings)
         "labels": json.dumps(labels, ensure_ascii=False),
@@ -2606,11 +2415,13 @@ def compute_segments(activity):
     Returns:
         list: Liste de dicts avec métriques par segment
     """
-    points = activity.get('points', [])
-    if not points or len(points) < 2:
+    columns = _activity_columns(activity)
+    distances = columns.get('distance')
+    if distances is None or len(distances) < 2:
         return []
+    hrs, speeds = columns.get('hr'), columns.get('vel')
 
-    distance_totale_m = points[-1].get('distance', 0)
+    distance_totale_m = float(distances[-1])
     distance_totale_km = distance_totale_m / 1000
     if distance_totale_km < 1:
         return []
@@ -2643,13 +2454,13 @@ def compute_segments(activity):
         start_dist_m = skip_distance_m + (seg_num - 1) * segment_distance_m
         end_dist_m = skip_distance_m + seg_num * segment_distance_m
 
-        segment_points = [p for p in points if start_dist_m <= p.get('distance', 0) <= end_dist_m]
-        if len(segment_points) < 2:
+        in_segment = (distances >= start_dist_m) & (distances <= end_dist_m)
+        if np.count_nonzero(in_segment) < 2:
             continue
 
-        # Calculs métriques
-        fcs = [p.get('hr', 0) for p in segment_points if p.get('hr')]
-        speeds_ms = [p.get('vel', 0) for p in segment_points if p.get('vel')]
+        # Calculs métriques (sommes en Python sur les seules valeurs du segment)
+        fcs = hrs[in_segment & _present(hrs)].tolist() if hrs is not None else []
+        speeds_ms = speeds[in_segment & _present(speeds)].tolist() if speeds is not None else []
 
         if not fcs or not speeds_ms:
             continue
@@ -2965,13 +2776,33 @@ def calculate_lthr(activities, profile):
 def analyze_cardiac_health(activity, profile):
     """
     Analyse santé cardiaque avec 5 zones FC et alertes.
+    Mémorisée par activité : recalculée seulement si la FC / le temps des points,
+    hr_rest / hr_max du profil ou CARDIAC_ANALYSIS_VERSION changent.
 
     Returns:
         dict: Analyse complète santé cardiaque
     """
-    points = activity.get('points', [])
-    if not points:
+    params = {"hr_rest": profile.get('hr_rest', 59), "hr_max": profile.get('hr_max', 170)}
+    fp = enrichment_cache.fingerprint(
+        enrichment_cache.points_fingerprint(activity, ("hr", "time")), params, CARDIAC_ANALYSIS_VERSION)
+    analysis = enrichment_cache.cached("cardiac_analysis", activity.get("activity_id"), fp,
+                                       lambda: _analyze_cardiac_health(activity, profile))
+    if not analysis or "hr_zones" not in analysis:
+        return analysis
+    # Relue depuis le kv (JSON) : zones en clés entières, comme au calcul
+    hr_zones = dict(analysis["hr_zones"])
+    for field in ("zone_times", "zone_percentages"):
+        hr_zones[field] = {int(z): v for z, v in hr_zones.get(field, {}).items()}
+    return dict(analysis, hr_zones=hr_zones)
+
+
+def _analyze_cardiac_health(activity, profile):
+    columns = _activity_columns(activity)
+    times = columns.get('time')
+    if times is None or not len(times):
         return {'status': 'no_data', 'alerts': [], 'observations': [], 'recommendations': []}
+    hrs = columns.get('hr')
+    hr_mask = _present(hrs) if hrs is not None else np.zeros(len(times), dtype=bool)
 
     # Méthode Karvonen (basée sur FC repos et FC max réelles)
     hr_rest = profile.get('hr_rest', 59)
@@ -2988,28 +2819,22 @@ def analyze_cardiac_health(activity, profile):
         5: (hr_reserve * 0.90 + hr_rest, hr_reserve * 1.00 + hr_rest),  # VO2 max (90-100%)
     }
 
-    # Calculer temps dans chaque zone
-    zone_times = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-
-    for i, p in enumerate(points):
-        hr = p.get('hr')
-        if hr is None or hr == 0:
-            continue
-
-        # Déterminer zone
-        for zone_num, (min_hr, max_hr) in zones.items():
-            if min_hr is not None and max_hr is not None and min_hr <= hr < max_hr:
-                # Estimer durée (temps entre 2 points)
-                if i < len(points) - 1:
-                    duration = points[i+1].get('time', 0) - p.get('time', 0)
-                    zone_times[zone_num] += duration
-                break
+    # Calculer temps dans chaque zone : durée d'un point = temps jusqu'au suivant
+    # (zones disjointes [min, max[ ; le dernier point ne compte pas)
+    durations = np.zeros(len(times))
+    durations[:-1] = np.diff(times)
+    zone_times = {}
+    for zone_num, (min_hr, max_hr) in zones.items():
+        in_zone = hr_mask & (hrs >= min_hr) & (hrs < max_hr) if hrs is not None else hr_mask
+        total = float(durations[in_zone].sum())
+        # Temps entiers (secondes) : gardés en int comme dans les points
+        zone_times[zone_num] = int(total) if total.is_integer() else total
 
     total_time = sum(zone_times.values())
     zone_percentages = {z: (t / total_time * 100) if total_time > 0 else 0 for z, t in zone_times.items()}
 
     # Métriques FC
-    all_hrs = [p.get('hr', 0) for p in points if p.get('hr')]
+    all_hrs = hrs[hr_mask].tolist() if hrs is not None else []
     fc_avg = sum(all_hrs) / len(all_hrs) if all_hrs else 0
     fc_max = max(all_hrs) if all_hrs else 0
     fc_start = all_hrs[0] if all_hrs else 0
@@ -3403,7 +3228,8 @@ def generate_weekly_program(profile, activities, week_summary_text=""):
 
     if recent_activities:
         distances = [act.get('distance_km', 10) for act in recent_activities if act.get('distance_km')]
-        paces = [act.get('pace_min_per_km', avg_pace_sec) for act in recent_activities if act.get('pace_min_per_km')]
+        # pace_min_per_km est stocké en min/km (migrations) : converti en sec/km
+        paces = [act['pace_min_per_km'] * 60 for act in recent_activities if act.get('pace_min_per_km')]
         fcs = [act.get('fc_moy', 140) for act in recent_activities if act.get('fc_moy')]
 
         if distances:
@@ -3431,7 +3257,7 @@ def generate_weekly_program(profile, activities, week_summary_text=""):
         type_count = 0
         for act in activities:
             if (act.get('session_category') == run_type or act.get('type_sortie') == run_type):
-                pace_val = act.get('pace_min_per_km')
+                pace_val = (act.get('pace_min_per_km') or 0) * 60  # min/km -> sec/km
 
                 # Si pace_min_per_km absent ou 0, essayer de parser depuis 'allure'
                 if not pace_val or pace_val == 0:
@@ -3460,7 +3286,7 @@ def generate_weekly_program(profile, activities, week_summary_text=""):
         # Prendre les 20 derniers runs, calculer P75 (75e percentile = tempo réaliste)
         all_recent_paces = []
         for act in activities[:20]:
-            pace_val = act.get('pace_min_per_km')
+            pace_val = (act.get('pace_min_per_km') or 0) * 60  # min/km -> sec/km
             if not pace_val or pace_val == 0:
                 allure_str = act.get('allure', '')
                 if allure_str and ':' in allure_str:
@@ -3812,7 +3638,7 @@ def generate_weekly_program(profile, activities, week_summary_text=""):
     best_distance = 0
     for act in activities[:20]:  # 20 derniers runs
         dist = act.get('distance_km', 0)
-        pace = act.get('pace_min_per_km', 0)
+        pace = (act.get('pace_min_per_km') or 0) * 60  # min/km -> sec/km
         if dist > best_distance:
             best_distance = dist
             if pace and pace > 0:
@@ -3866,8 +3692,7 @@ def check_and_recalibrate_objectives(profile, activities, past_week_analysis):
     # Charger historique des scores (dernières 8 semaines)
     scores_history = []
     try:
-        scores_data = read_output_json('weekly_scores.json') or {}
-        scores_history = scores_data.get('scores', [])[-8:]  # 8 dernières semaines
+        scores_history = load_weekly_scores()[-8:]  # 8 dernières semaines
     except:
         pass
 
@@ -4124,81 +3949,118 @@ def analyze_progression(activities, weeks=4):
     }
 
 
-@app.route("/")
-def index():
-    start_time = time.time()
-    log_step("Début index()", start_time)
-    print("➡ index(): start")
+def prepare_activities(activities):
+    """
+    Migre les activités qui n'ont pas encore leurs champs dérivés (seules
+    celles-ci sont réécrites), puis ajoute le contexte historique. Retourne
+    (activités dans l'ordre chargé, activités triées par date décroissante) —
+    les mêmes objets dans les deux listes.
+    """
+    # ⚡ Les champs dérivés (cadence, distance, allure, type, k_moy, dérive...) sont
+    # calculés une fois puis stockés avec leur version (migrations.SCHEMA_VERSION) :
+    # seules les activités jamais migrées sont traitées ici
+    pending = [i for i, a in enumerate(activities) if migrations.needs_migration(a)]
+    if pending:
+        fc_max_fractionnes = get_fcmax_from_fractionnes(activities)
+        enrich = lambda act: enrich_if_changed(act, fc_max_fractionnes)
+        for i in pending:
+            activities[i] = migrations.migrate_activity(activities[i], enrich=enrich)
+        migrated = [activities[i] for i in pending]
+        print(f"📊 {len(migrated)} activités migrées (schéma v{migrations.SCHEMA_VERSION})")
+
+        # Seules les activités migrées sont écrites (journal). Une activité sans id
+        # ne peut pas être ciblée : migrée en mémoire à chaque chargement seulement
+        with_id = [a for a in migrated if a.get("activity_id") is not None]
+        if with_id:
+            upsert_activities_local(with_id)
+            print(f"💾 {len(with_id)} activités mises à jour (journal)")
+        if len(with_id) < len(migrated):
+            print(f"⚠️ {len(migrated) - len(with_id)} activités sans activity_id : migration non enregistrée")
 
-    # --- Drive-only guard ---
-    try:
-        activities = load_activities_from_drive()
-        print(f"➡ activities loaded: {len(activities)}")
-    except DriveUnavailableError as e:
-        print("❌ load_activities_from_drive failed:", e)
-        return render_template(
-            "index.html",
-            dashboard={},
-            activities_for_carousel=[],
-            drive_error=f"⚠️ Données indisponibles (Drive) : {e}",
-        )
+    # 🔽 Tri décroissant par date pour fiabiliser dashboard + carrousel
+    activities_sorted = sorted(activities, key=_date_key, reverse=True)
 
-    # ⚡ OPTIMISATION : Désactiver les traitements lourds au chargement de la page
-    # Ces traitements peuvent être lancés manuellement via /refresh
+    # 📊 Ajouter contexte historique (moyennes 10 dernières, tendances) - APRÈS le tri!
+    stored_categories = {id(a): a.get("session_category") for a in activities_sorted}
+    activities_sorted = shared_snapshot.add_historical_context(activities_sorted)
+    print("📊 Contexte historique ajouté (k_avg_10, drift_avg_10, tendances)")
 
-    modified = False
+    # Persister session_category (lue par /stats et les objectifs) quand elle change
+    category_patches = {
+        a["activity_id"]: {"session_category": a.get("session_category")}
+        for a in activities_sorted
+        if a.get("activity_id") is not None and a.get("session_category") != stored_categories.get(id(a))
+    }
+    if category_patches:
+        patch_activities_local(category_patches)
+        print(f"💾 session_category mise à jour pour {len(category_patches)} activités")
+
+    # Stats par type : seules les catégories des activités migrées / reclassées
+    changed = [a for a in activities_sorted if a.get("activity_id") in category_patches]
+    if pending:
+        changed += [activities[i] for i in pending if activities[i].get("activity_id") not in category_patches]
+    if changed and os.path.exists(running_stats_aggregator.output_file):
+        try:
+            running_stats_aggregator.update(changed)
+        except Exception as e:
+            print(f"⚠️ Erreur mise à jour running stats: {e}")
 
-    # 👣 Normalisation cadence (rapide, local)
-    activities, changed_norm = normalize_cadence_in_place(activities)
-    modified = modified or changed_norm
+    return activities, activities_sorted
 
-    # 📊 Enrichissement intelligent : calculer type_sortie, k_moy et deriv_cardio SEULEMENT pour les activités manquantes
-    fc_max_fractionnes = get_fcmax_from_fractionnes(activities)
-    enriched_count = 0
-    type_count = 0
-    for idx, activity in enumerate(activities):
-        # 1) Classifier uniquement si type manquant ou invalide (OPTIMISATION)
-        old_type = activity.get("type_sortie")
-        needs_classification = not old_type or old_type in ['-', 'inconnue', 'normal_5k', 'normal_10k']
-
-        if needs_classification:
-            new_type = classify_run_type(activity)
-            if old_type != new_type:
-                activity["type_sortie"] = new_type
-                print(f"🔄 Reclassification {activity.get('date')}: {old_type} → {new_type} (dist: {activity.get('distance_km')}km)")
-                type_count += 1
-                modified = True
-                # Effacer session_category uniquement si le type a changé
-                if 'session_category' in activity:
-                    del activity['session_category']
-
-        # 2) Enrichir si k_moy ou deriv_cardio manquants
-        if (not isinstance(activity.get("k_moy"), (int, float)) or
-            not isinstance(activity.get("deriv_cardio"), (int, float))):
-            activities[idx] = enrich_single_activity(activity, fc_max_fractionnes)
-            enriched_count += 1
-            modified = True
-
-    if enriched_count > 0 or type_count > 0:
-        print(f"📊 {enriched_count} activités enrichies (k_moy, deriv_cardio), {type_count} types définis")
-
-    if modified:
-        save_activities_to_drive(activities)
-        print("💾 activities.json mis à jour")
 
-    # 🔽 Tri décroissant par date pour fiabiliser dashboard + carrousel
-    activities_sorted = sorted(activities, key=_date_key, reverse=True)
+def _publish_snapshot(activities, activities_sorted):
+    """Publie l'instantané partagé ; un échec n'empêche pas d'afficher la page."""
+    try:
+        return shared_snapshot.publish(activities, activities_sorted)
+    except Exception as e:
+        print(f"⚠️ Instantané partagé non publié: {e}")
+        return None
 
-    # 📊 Ajouter contexte historique (moyennes 10 dernières, tendances) - APRÈS le tri!
-    activities_sorted = add_historical_context(activities_sorted)
-    print("📊 Contexte historique ajouté (k_avg_10, drift_avg_10, tendances)")
 
+def refresh_shared_snapshot():
+    """Construit l'instantané partagé si les données ont changé (hook gunicorn when_ready)."""
+    snapshot = shared_snapshot.fresh()
+    if snapshot is not None:
+        return snapshot
+    activities, activities_sorted = prepare_activities(load_activities_from_drive())
+    return _publish_snapshot(activities, activities_sorted)
+
+
+@app.route("/")
+def index():
+    start_time = time.time()
+    log_step("Début index()", start_time)
+    print("➡ index(): start")
+
+    # ⚡ Instantané partagé entre workers : enrichissement + contexte historique
+    # déjà calculés pour cette version des données
+    snapshot = shared_snapshot.fresh()
+    if snapshot is not None:
+        activities, activities_sorted = snapshot.activities()
+        print(f"⚡ Instantané partagé {snapshot.version} utilisé ({len(activities)} activités)")
+    else:
+        # --- Drive-only guard ---
+        try:
+            activities = load_activities_from_drive()
+            print(f"➡ activities loaded: {len(activities)}")
+        except DriveUnavailableError as e:
+            print("❌ load_activities_from_drive failed:", e)
+            return render_template(
+                "index.html",
+                dashboard={},
+                activities_for_carousel=[],
+                drive_error=f"⚠️ Données indisponibles (Drive) : {e}",
+            )
+        activities, activities_sorted = prepare_activities(activities)
+        snapshot = _publish_snapshot(activities, activities_sorted)
+        if snapshot is not None and len(snapshot) != len(activities_sorted):
+            snapshot = None  # publié entre-temps par un autre process sur d'autres données
 
     log_step("Activities chargées et complétées", start_time)
     print(f"📂 {len(activities)} activités prêtes")
 
     # Calcul du dashboard
-    dashboard = compute_dashboard_data(activities_sorted)
+    dashboard = compute_dashboard_data(activities_sorted, history=snapshot.series if snapshot else None)
     log_step("Dashboard calculé", start_time)
 
     # Charger le profil (nécessaire pour analyse cardiaque et commentaires IA)
@@ -4229,51 +4091,56 @@ def index():
     personalized_targets = profile.get('personalized_targets', {})
     print(f"🎯 Objectifs chargés: {personalized_targets}")
 
-    # Charger les feedbacks
-    feedbacks = load_feedbacks()
+    # Charger les feedbacks et commentaires IA des seules activités du carrousel
+    carousel_dates = [a.get("date") for a in activities_sorted[:10]]
+    feedbacks = load_feedbacks([str(a.get("activity_id", "")) for a in activities_sorted[:10]])
 
     # 🆕 Charger les commentaires IA sauvegardés
-    ai_comments = load_ai_comments()
-    zones_comments = load_zones_comments()
+    ai_comments = load_ai_comments(carousel_dates)
+    zones_comments = load_zones_comments(carousel_dates)
 
     # Construction du carrousel
     activities_for_carousel = []
     print("➡ building carousel from most recent", min(10, len(activities_sorted)), "activities")
-    for act in activities_sorted[:10]:  # 10 plus récentes par date
+    for current_idx, act in enumerate(activities_sorted[:10]):  # 10 plus récentes par date
         log_step(f"Début carrousel activité {act.get('date')}", start_time)
         print("   slide candidate:", act.get('date'))
-        points = act.get("points", [])
-        print("   -> points:", len(points))
-        if not points:
+        # Colonnes NumPy (store mmap) : listes Python pour les seules séries des graphiques
+        columns = _activity_columns(act)
+        distances, times = columns.get("distance"), columns.get("time")
+        n_points = len(times) if distances is not None and times is not None else 0
+        print("   -> points:", n_points)
+        if not n_points:
             print("   -> skipped (no points)")
             continue
 
-        labels = [round(p["distance"] / 1000, 3) for p in points]
-        points_fc = [p.get("hr", 0) for p in points]
-        points_alt = [p.get("alt", 0) - points[0].get("alt", 0) for p in points]
+        dist_l, time_l = distances.tolist(), times.tolist()
+        labels = [round(d, 3) for d in (distances / 1000).tolist()]
+        hrs, alts = columns.get("hr"), columns.get("alt")
+        points_fc = _nan_to_none(hrs) if hrs is not None else [0] * n_points
+        points_alt = _nan_to_none(alts - alts[0]) if alts is not None else [0] * n_points
 
         # Calcul allure_curve tous les 500m
         allure_curve = []
         bloc_start_idx, next_bloc_dist, last_allure = 0, 500, None
-        for i, p in enumerate(points):
-            if p["distance"] >= next_bloc_dist or i == len(points) - 1:
-                bloc_points = points[bloc_start_idx:i + 1]
-                bloc_dist = bloc_points[-1]["distance"] - bloc_points[0]["distance"]
-                bloc_time = bloc_points[-1]["time"] - bloc_points[0]["time"]
+        for i, d in enumerate(dist_l):
+            if d >= next_bloc_dist or i == n_points - 1:
+                bloc_dist = d - dist_l[bloc_start_idx]
+                bloc_time = time_l[i] - time_l[bloc_start_idx]
                 if bloc_dist > 0:
                     last_allure = (bloc_time / 60) / (bloc_dist / 1000)
-                allure_curve.extend([last_allure] * len(bloc_points))
+                allure_curve.extend([last_allure] * (i + 1 - bloc_start_idx))
                 bloc_start_idx = i + 1
                 next_bloc_dist += 500
-        while len(allure_curve) < len(points):
+        while len(allure_curve) < n_points:
             allure_curve.append(last_allure)
 
         # Statistiques globales
-        total_dist_km = points[-1]["distance"] / 1000
-        total_time_min = (points[-1]["time"] - points[0]["time"]) / 60
+        total_dist_km = dist_l[-1] / 1000
+        total_time_min = (time_l[-1] - time_l[0]) / 60
         allure_moy = total_time_min / total_dist_km if total_dist_km > 0 else None
         fc_max = max(points_fc) if points_fc else None
-        gain_alt = _compute_denivele_pos(points)
+        gain_alt = _denivele_from_alts(alts) if alts is not None else 0.0
 
         # 🌡️ Météo
         avg_temperature = act.get("avg_temperature")
@@ -4294,20 +4161,22 @@ def index():
             date_formatted = "-"
             
         # 👣 KPIs de cadence (à partir de cad_spm)
-        cad_kpis = _cadence_kpis(points)
+        cad_kpis = _cadence_kpis(columns)
 
         # 📊 Historiques et comparaisons (10 derniers runs du MÊME type)
         current_type = act.get("session_category") or act.get("type_sortie", "-")
-        current_idx = activities_sorted.index(act)
 
         # Filtrer les runs du même type (activités précédentes)
-        same_type_runs = []
-        for prev_act in activities_sorted[current_idx + 1:]:
-            prev_type = prev_act.get("session_category") or prev_act.get("type_sortie")
-            if prev_type == current_type:
-                same_type_runs.append(prev_act)
-            if len(same_type_runs) >= 10:
-                break
+        if snapshot is not None:
+            same_type_runs = [activities_sorted[i] for i in snapshot.same_type_history(current_idx)]
+        else:
+            same_type_runs = []
+            for prev_act in activities_sorted[current_idx + 1:]:
+                prev_type = prev_act.get("session_category") or prev_act.get("type_sortie")
+                if prev_type == current_type:
+                    same_type_runs.append(prev_act)
+                if len(same_type_runs) >= 10:
+                    break
 
         # Historique dérive cardiaque (10 derniers du même type)
         drift_history = []
@@ -4392,7 +4261,7 @@ def index():
 
             for prev_act in same_type_runs:
                 # Recalculer zones FC depuis les points HR
-                if prev_act.get('points'):
+                if _activity_columns(prev_act):
                     prev_cardiac = analyze_cardiac_health(prev_act, profile)
                     if prev_cardiac and prev_cardiac.get('hr_zones'):
                         prev_zones = prev_cardiac['hr_zones'].get('zone_percentages', {})
@@ -4465,8 +4334,10 @@ def index():
             "k_p90": act.get("k_p90"),
             "drift_p10": act.get("drift_p10"),
             "drift_p90": act.get("drift_p90"),
+            "activity_id": act.get("activity_id"),
             "temperature": avg_temperature,
             "weather_emoji": weather_emoji,
+            "weather_pending": avg_temperature is None and weather_jobs.weather_status(act) == weather_jobs.PENDING,
             "labels": json.dumps(labels),
             "points_fc": json.dumps(points_fc),
             "points_alt": json.dumps(points_alt),
@@ -4500,8 +4371,7 @@ def index():
     stats_file = 'running_stats.json'
     if os.path.exists(stats_file):
         try:
-            with open(stats_file, 'r') as f:
-                running_stats = json.load(f)
+            running_stats = serializers.load_file(stats_file)
             print(f"✅ Running stats chargées depuis {stats_file}")
             print(f"🔍 Keys in running_stats: {list(running_stats.keys())}")
             if 'stats_by_type' in running_stats:
@@ -4513,8 +4383,7 @@ def index():
         print("📊 running_stats.json absent, génération...")
         update_running_stats_after_webhook()
         if os.path.exists(stats_file):
-            with open(stats_file, 'r') as f:
-                running_stats = json.load(f)
+            running_stats = serializers.load_file(stats_file)
 
     # Phase 3 Sprint 3: Programme hebdomadaire (profile déjà chargé plus haut)
     # 🔄 Logique de renouvellement hebdomadaire
@@ -4579,16 +4448,12 @@ def index():
 
                     # NOUVEAU: Sauvegarder le score dans l'historique
                     try:
-                        scores_data = read_output_json('weekly_scores.json') or {'scores': []}
-                        scores_data['scores'].append({
+                        save_weekly_score({
                             'week': past_week_analysis['week_number'],
                             'week_start': past_week_analysis['start_date'],
                             'score': past_week_analysis.get('score', 0),
                             'trend': past_week_analysis.get('trend', 'stable')
                         })
-                        # Garder seulement les 12 dernières semaines
-                        scores_data['scores'] = scores_data['scores'][-12:]
-                        write_output_json('weekly_scores.json', scores_data)
                         print(f"📊 Score {past_week_analysis.get('score', 0)}/10 sauvegardé dans l'historique")
                     except Exception as e:
                         print(f"⚠️ Erreur sauvegarde score: {e}")
@@ -4695,25 +4560,20 @@ def generate_ai_comment(activity_date):
         JSON avec le commentaire IA ou une erreur
     """
     try:
-        # Charger profil et activités
-        profile = load_profile()
-        activities = load_activities_from_drive()
-
-        # Trouver l'activité correspondante AVANT d'enrichir (OPTIMISATION)
-        activity = None
-        for act in activities:
-            if act.get('date') == activity_date:
-                activity = act
-                break
-
+        # Trouver l'activité correspondante AVANT de charger l'historique (OPTIMISATION)
+        activity = find_activity_by_date(activity_date)
         if not activity:
             return jsonify({'error': 'Activité non trouvée'}), 404
 
+        # Charger profil et activités (comparaisons historiques)
+        profile = load_profile()
+        activities = load_activities_from_drive()
+
         # ✅ VALIDATION : Vérifier que l'activité a des données GPS valides
         # Support des 2 formats : ancien (lat_stream/lon_stream) et nouveau (points array)
         lat_stream = activity.get('lat_stream', [])
         lon_stream = activity.get('lon_stream', [])
-        points = activity.get('points', [])
+        points = load_activity_points(activity)
 
         # Vérifier l'ancien format (streams) OU le nouveau format (points)
         has_old_format = lat_stream and lon_stream and len(lat_stream) >= 10 and len(lon_stream) >= 10
@@ -4753,8 +4613,8 @@ def generate_ai_comment(activity_date):
         cardiac_analysis = analyze_cardiac_health(activity, profile)
 
         # Charger les feedbacks réels
-        feedbacks = load_feedbacks()
         activity_id = str(activity.get('activity_id', ''))
+        feedbacks = load_feedbacks([activity_id])
         feedback = feedbacks.get(activity_id, {
             'rating_stars': 3,
             'difficulty': 3,
@@ -4961,6 +4821,29 @@ def recalculate_objectifs():
     return jsonify({'success': True, 'message': 'Objectifs recalculés'})
 
 
+@app.route('/api/weather/<int:activity_id>', methods=['GET'])
+def api_weather(activity_id):
+    """Météo de sortie d'une activité et statut du calcul en tâche de fond (badge du dashboard)"""
+    # Recherche indexée sur les résumés (champs météo stockés, points inutiles)
+    act = find_activity_by_id(activity_id)
+    if act is None:
+        return jsonify({"error": "Activité introuvable"}), 404
+    return jsonify({
+        "status": weather_jobs.weather_status(act),
+        "temperature": act.get("avg_temperature"),
+        "temp_debut": act.get("temp_debut"),
+        "temp_fin": act.get("temp_fin"),
+        "weather_code": act.get("weather_code"),
+        "weather_emoji": WEATHER_CODE_MAP.get(act.get("weather_code"), "❓"),
+    })
+
+
+@app.route('/api/cache-stats', methods=['GET'])
+def api_cache_stats():
+    """Compteurs hit / miss du cache mémoire des données (activités, profil, outputs)"""
+    return jsonify(cache_stats())
+
+
 @app.route('/zones-entrainement', methods=['GET'])
 def zones_entrainement():
     """Page de documentation des zones d'entraînement"""
@@ -5166,23 +5049,15 @@ def convert_pace_to_seconds(pace_str):
 def feedback_form(activity_date):
     """Affiche le formulaire de feedback pour une activité"""
     try:
-        # Charger les activités pour récupérer les infos
-        activities = load_activities_from_drive()
-
-        # Trouver l'activité par date
-        activity = None
-        for act in activities:
-            if act.get('date') == activity_date:
-                activity = act
-                break
+        # Trouver l'activité par date (recherche indexée)
+        activity = find_activity_by_date(activity_date)
 
         if not activity:
             return "Activité non trouvée", 404
 
         # Charger le feedback existant
-        feedbacks = load_feedbacks()
         activity_id = str(activity.get('activity_id', ''))
-        existing_feedback = feedbacks.get(activity_id, {})
+        existing_feedback = kv_get('run_feedbacks', activity_id, {})
 
         # Infos de l'activité
         distance_km = activity.get('distance_km', 0)
@@ -5216,25 +5091,17 @@ def save_feedback(activity_date):
         enjoyment = int(request.form.get('enjoyment', 3))
         notes = request.form.get('notes', '').strip()
 
-        # Charger les activités pour récupérer l'activity_id
-        activities = load_activities_from_drive()
-        activity = None
-        for act in activities:
-            if act.get('date') == activity_date:
-                activity = act
-                break
+        # Retrouver l'activité pour récupérer l'activity_id
+        activity = find_activity_by_date(activity_date)
 
         if not activity:
             return "Activité non trouvée", 404
 
         activity_id = str(activity.get('activity_id', ''))
 
-        # Charger les feedbacks existants
-        feedbacks = load_feedbacks()
-
-        # Créer/Mettre à jour le feedback
+        # Créer/Mettre à jour le feedback (seule cette clé est réécrite)
         from datetime import datetime
-        feedbacks[activity_id] = {
+        kv_put('run_feedbacks', activity_id, {
             'activity_id': activity_id,
             'date': activity_date,
             'mode_run': mode_run,
@@ -5246,12 +5113,7 @@ def save_feedback(activity_date):
             'enjoyment': enjoyment,
             'notes': notes,
             'timestamp': datetime.now().isoformat()
-        }
-
-        # Sauvegarder dans le fichier
-        feedback_file = Path(__file__).parent / 'outputs' / 'run_feedbacks.json'
-        with open(feedback_file, 'w', encoding='utf-8') as f:
-            json.dump(feedbacks, f, indent=2, ensure_ascii=False)
+        })
 
         print(f"✅ Feedback sauvegardé pour {activity_id}")
 
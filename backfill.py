@@ -0,0 +1,186 @@
+# backfill.py — Import de l'historique Strava sur une période, avec reprise
+#
+# get_streams.py ne traite qu'un id + les 30 dernières activités. Ici on
+# parcourt athlete/activities page par page (PER_PAGE = maximum Strava) :
+#
+#   - plusieurs pages de résumés demandées en parallèle (PAGE_WORKERS)
+#   - par page : activités déjà complètes ignorées, streams déjà archivés
+#     (raw_archive) relus sans réseau, les autres téléchargés en parallèle au
+#     rythme du budget Strava (le résumé tient lieu de détail : 1 requête / activité)
+#   - une écriture de l'index par page (upsert), puis point de reprise
+#     (.backfill_state.json : page suivante + ids en échec)
+#
+# Après un crash ou un budget journalier épuisé, relancer la même commande
+# reprend à la page suivante et réessaie d'abord les activités en échec.
+#
+#   python backfill.py --after 2020-01-01 [--before 2025-01-01] [--restart]
+from __future__ import annotations
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import requests
+
+import data_access_local as dal
+import drive_backup
+import get_streams
+import raw_archive
+import serializers
+from strava_client import default_client
+
+BACKFILL_STATE_FILE = dal.BASE_DIR / ".backfill_state.json"
+# Maximum accepté par Strava pour athlete/activities
+PER_PAGE = 200
+PAGE_WORKERS = int(os.getenv("T2T_BACKFILL_PAGE_WORKERS", "3"))
+
+
+def _epoch(date_str: Optional[str]) -> Optional[int]:
+    """'YYYY-MM-DD' (UTC) -> epoch ; None si vide."""
+    if not date_str:
+        return None
+    return int(datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+
+
+# ========== POINT DE REPRISE ==========
+
+def load_state(after: Optional[int], before: Optional[int], per_page: int = PER_PAGE,
+               state_file=BACKFILL_STATE_FILE, restart: bool = False) -> Dict[str, Any]:
+    """Reprend l'import en cours sur la même période, sinon en démarre un nouveau."""
+    state = None if restart else serializers.load_optional(state_file)
+    if (state and not state.get("finished") and state.get("after") == after
+            and state.get("before") == before and state.get("per_page") == per_page):
+        return state
+    return {"after": after, "before": before, "per_page": per_page, "next_page": 1,
+            "activities": 0, "failed": [], "finished": False, "started_at": datetime.now().isoformat()}
+
+
+def save_state(state: Dict[str, Any], state_file=BACKFILL_STATE_FILE) -> None:
+    state["updated_at"] = datetime.now().isoformat()
+    serializers.dump_file(state_file, state, "json")
+
+
+# ========== IMPORT ==========
+
+def fetch_pages(client, first_page: int, count: int, per_page: int,
+                after: Optional[int], before: Optional[int]) -> tuple:
+    """
+    Pages first_page .. first_page + count - 1 de athlete/activities, en parallèle.
+    Retourne (pages obtenues, erreur ou None) : les pages sont consécutives,
+    celles qui suivent une page en échec sont écartées (reprise à la page en échec).
+    """
+    pages: List[List[Dict[str, Any]]] = []
+    with ThreadPoolExecutor(max_workers=max(1, count)) as pool:
+        futures = [pool.submit(client.athlete_activities, per_page, page, after, before)
+                   for page in range(first_page, first_page + count)]
+        for f in futures:
+            try:
+                pages.append(f.result())
+            except requests.RequestException as e:  # RateLimitExceeded, HTTPError, réseau
+                return pages, e
+    return pages, None
+
+
+def ingest_summaries(summaries: List[Dict[str, Any]], activities: List[Dict[str, Any]],
+                     by_id: Dict[str, Dict[str, Any]], client, max_workers: int) -> tuple:
+    """
+    Intègre une page de résumés à `activities` et l'écrit en une fois.
+    Retourne (nombre d'activités écrites, ids en échec).
+    """
+    todo = {int(s["id"]): s for s in summaries if not get_streams.is_complete(s, by_id)}
+    touched = []
+    # Streams déjà archivés (import interrompu, base reconstruite) : pas de réseau
+    for activity_id in [i for i in todo if raw_archive.has_raw_streams(i)]:
+        act = get_streams.apply_activity(activity_id, todo.pop(activity_id),
+                                         raw_archive.load_raw_streams(activity_id), activities)
+        if act is not None:
+            touched.append(act)
+    fetched, failed = get_streams.process_activities(list(todo), activities, client, max_workers, summaries=todo)
+    touched.extend(fetched)
+    if touched:
+        dal.upsert_activities_local(touched)
+        for act in touched:
+            by_id[str(act["activity_id"])] = act
+    return len(touched), failed
+
+
+def backfill(after: Optional[int] = None, before: Optional[int] = None, client=None,
+             per_page: int = PER_PAGE, page_workers: int = PAGE_WORKERS,
+             max_workers: int = get_streams.FETCH_WORKERS, state_file=BACKFILL_STATE_FILE,
+             restart: bool = False) -> Dict[str, Any]:
+    """
+    Importe toutes les activités entre after et before (epoch), page par page,
+    avec un point de reprise après chaque page. S'arrête proprement (état
+    sauvegardé) si le budget Strava est épuisé. Retourne l'état final.
+    """
+    client = client or default_client()
+    state = load_state(after, before, per_page, state_file, restart)
+    activities = dal.load_activities_local()
+    by_id = {str(a.get("activity_id")): a for a in activities}
+    started = time.perf_counter()
+    if state["next_page"] > 1:
+        print(f"♻️ Reprise à la page {state['next_page']} ({state['activities']} activités déjà importées)")
+
+    def budget_exhausted(failed) -> bool:
+        if failed and client.limiter.exhausted():
+            save_state(state, state_file)
+            print(f"⏸️ Budget Strava épuisé ({client.limiter.status()}) : relancer plus tard pour reprendre")
+            return True
+        return False
+
+    # Échecs de la session précédente d'abord (détail + streams : pas de résumé conservé)
+    if state["failed"]:
+        print(f"🔁 {len(state['failed'])} activité(s) en échec à réessayer")
+        touched, failed = get_streams.process_activities(state["failed"], activities, client, max_workers)
+        if touched:
+            dal.upsert_activities_local(touched)
+            state["activities"] += len(touched)
+        state["failed"] = sorted(set(failed))
+        save_state(state, state_file)
+        if budget_exhausted(failed):
+            return state
+
+    while not state["finished"]:
+        pages, error = fetch_pages(client, state["next_page"], max(1, page_workers), per_page,
+                                   state["after"], state["before"])
+        for page in pages:
+            written, failed = ingest_summaries(page, activities, by_id, client, max_workers)
+            state["activities"] += written
+            state["failed"] = sorted(set(state["failed"]) | set(failed))
+            state["finished"] = len(page) < per_page
+            state["next_page"] += 1
+            save_state(state, state_file)
+            print(f"📄 Page {state['next_page'] - 1} : {len(page)} résumés, {written} écrites, "
+                  f"{len(failed)} en échec ({time.perf_counter() - started:.0f}s)")
+            if budget_exhausted(failed):
+                return state
+            if state["finished"]:
+                break
+        if error is not None and not state["finished"]:
+            # Page à redemander : point de reprise sur elle, rien n'est compté après
+            save_state(state, state_file)
+            print(f"⏸️ Page {state['next_page']} indisponible ({error}) : relancer plus tard pour reprendre")
+            return state
+
+    print(f"✅ Import terminé : {state['activities']} activités, {len(state['failed'])} en échec "
+          f"en {time.perf_counter() - started:.0f}s")
+    get_streams.running_stats.rebuild()
+    drive_backup.backup_in_background()
+    return state
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Import de l'historique Strava (reprise automatique)")
+    ap.add_argument("--after", help="date de début YYYY-MM-DD (défaut : tout l'historique)")
+    ap.add_argument("--before", help="date de fin YYYY-MM-DD (exclue)")
+    ap.add_argument("--restart", action="store_true", help="ignorer le point de reprise")
+    ap.add_argument("--page-workers", type=int, default=PAGE_WORKERS, help="pages de résumés en parallèle")
+    ap.add_argument("--workers", type=int, default=get_streams.FETCH_WORKERS, help="téléchargements simultanés")
+    args = ap.parse_args()
+
+    backfill(_epoch(args.after), _epoch(args.before), page_workers=args.page_workers,
+             max_workers=args.workers, restart=args.restart)
+    # Le thread de sauvegarde ne survit pas au process
+    drive_backup.wait_for_background_backup()
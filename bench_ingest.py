@@ -0,0 +1,266 @@
+# bench_ingest.py — Débit de l'ingestion (Strava + Open-Meteo) sans appeler les API
+#
+#   python bench_ingest.py --synthetic 50                  # fixtures générées, rejeu local
+#   python bench_ingest.py --latency 0.08 --jitter 0.04 --error-rate 0.02
+#   python bench_ingest.py --record 20                     # enregistre les 20 dernières activités (API réelles)
+#
+# Chaque activité passe par les étapes de get_streams, chronométrées à part :
+#   fetch     détail + streams (HTTP, archive brute)
+#   resample  stream_ops.resample
+#   derive    reste de apply_activity (cadence, deriv_cardio, migrations)
+#   weather   fetch_open_meteo (weather_service, cache vide au départ)
+#   save      upsert dans l'index + streams/
+# Les requêtes passent par http_replay (ReplayServer) ; les données sont écrites
+# dans un répertoire temporaire : ni l'index ni les caches du projet ne sont touchés.
+import argparse
+import contextlib
+import io
+import random
+import re
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+
+import data_access_local as dal
+import get_streams
+import http_replay
+import raw_archive
+import stream_ops
+import weather_service
+from strava_client import API_BASE, RateLimiter, StravaClient, STREAM_KEYS, default_client
+
+STAGES = ("fetch", "resample", "derive", "weather", "save")
+STREAMS_URL = re.compile(r"/activities/(\d+)/streams")
+# Lieux des activités synthétiques (centres de cellules météo)
+PLACES = [(45.76, 4.84), (48.85, 2.35), (43.30, 5.37), (44.84, -0.58), (47.22, -1.55),
+          (50.63, 3.06), (43.60, 1.44), (48.58, 7.75)]
+
+
+@contextlib.contextmanager
+def isolated_data(workdir: Path):
+    """Index, streams, kv et archive brute redirigés vers workdir le temps du bench."""
+    names = ("ACTIVITIES_FILE", "ACTIVITIES_WAL_FILE", "ACTIVITIES_LOCK_FILE", "SQLITE_FILE",
+             "STREAMS_DIR", "OUTPUTS_DIR", "KV_DIR")
+    saved = {name: getattr(dal, name) for name in names}
+    saved_raw = raw_archive.RAW_DIR
+    for name in names:
+        setattr(dal, name, workdir / saved[name].relative_to(dal.BASE_DIR))
+    raw_archive.RAW_DIR = workdir / "raw_streams"
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(dal, name, value)
+        raw_archive.RAW_DIR = saved_raw
+
+
+# ========== FIXTURES SYNTHÉTIQUES ==========
+
+def synthetic_streams(n, place, rng):
+    time_data, distance, heartrate, cadence, velocity, altitude, latlng = [], [], [], [], [], [], []
+    d, alt = 0.0, rng.uniform(50, 300)
+    for i in range(n):
+        v = rng.uniform(2.6, 3.6)
+        d += v
+        alt += rng.uniform(-0.3, 0.3)
+        time_data.append(i)
+        distance.append(round(d, 1))
+        heartrate.append(round(rng.uniform(120, 175)))
+        cadence.append(round(rng.uniform(80, 92)))
+        velocity.append(round(v, 3))
+        altitude.append(round(alt, 1))
+        # Boucle de ~200 m autour du centre de la cellule : même lieu pour la météo
+        latlng.append([round(place[0] + 0.001 * np.sin(i / 60), 6), round(place[1] + 0.001 * np.cos(i / 60), 6)])
+    wrap = lambda data: {"data": data, "series_type": "distance", "original_size": n, "resolution": "high"}
+    return {"time": wrap(time_data), "distance": wrap(distance), "heartrate": wrap(heartrate),
+            "cadence": wrap(cadence), "velocity_smooth": wrap(velocity), "altitude": wrap(altitude),
+            "latlng": wrap(latlng), "moving": wrap([True] * n)}
+
+
+def synthetic_hourly(day, rng):
+    hours = [f"{day}T{h:02d}:00" for h in range(24)]
+    base = rng.uniform(0, 25)
+    return {"latitude": 0, "longitude": 0, "timezone": "Europe/Paris",
+            "hourly": {"time": hours,
+                       "temperature_2m": [round(base + 5 * np.sin((h - 9) / 24 * 2 * np.pi), 1) for h in range(24)],
+                       "weathercode": [rng.choice([0, 1, 2, 3, 61]) for _ in range(24)]}}
+
+
+def write_synthetic_fixtures(fixtures, count, points, locations, seed=42):
+    """Détail, streams et météo (archive) de `count` activités réparties sur `locations` lieux."""
+    rng = random.Random(seed)
+    weather_days = set()
+    first_day = date.today() - timedelta(days=count + 10)
+    for i in range(count):
+        activity_id = 9_000_000_000 + i
+        place = weather_service.grid_cell(*PLACES[i % min(locations, len(PLACES))])
+        day = (first_day + timedelta(days=i)).isoformat()
+        fixtures.save_json(f"{API_BASE}/activities/{activity_id}", {
+            "id": activity_id, "name": f"Sortie {i}", "type": "Run", "sport_type": "Run",
+            "private": False, "start_date_local": f"{day}T07:30:00Z", "average_cadence": 86.0,
+        })
+        fixtures.save_json(http_replay.prepared_url(f"{API_BASE}/activities/{activity_id}/streams",
+                                                    {"keys": STREAM_KEYS, "key_by_type": "true"}),
+                           synthetic_streams(points, place, rng))
+        weather_days.add((place, day))
+    for place, day in weather_days:
+        params = {"latitude": place[0], "longitude": place[1], "start_date": day, "end_date": day,
+                  "hourly": weather_service.HOURLY_FIELDS, "timezone": "auto"}
+        fixtures.save_json(http_replay.prepared_url(weather_service.ARCHIVE_URL, params),
+                           synthetic_hourly(day, rng))
+
+
+def recorded_ids(fixtures):
+    ids = []
+    for entry in fixtures.entries():
+        match = STREAMS_URL.search(entry["url"])
+        if match and entry["status"] == 200:
+            ids.append(int(match.group(1)))
+    return sorted(set(ids))
+
+
+# ========== MESURE ==========
+
+class StageTimer:
+    """Durées par étape de l'activité en cours (ingestion séquentielle)."""
+
+    def __init__(self):
+        self.current = {}
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.current[stage] = self.current.get(stage, 0.0) + time.perf_counter() - t0
+        return timed
+
+
+def ingest(activity_ids, client, verbose=False):
+    """Ingère les activités une à une ; retourne (durées par étape, totaux, échecs, secondes)."""
+    timer = StageTimer()
+    saved_resample, saved_weather = stream_ops.resample, get_streams.fetch_open_meteo
+    stream_ops.resample = timer.wrap("resample", saved_resample)
+    get_streams.fetch_open_meteo = timer.wrap("weather", saved_weather)
+    samples = {stage: [] for stage in STAGES}
+    totals, failed = [], []
+    activities = []
+    out = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    started = time.perf_counter()
+    try:
+        with out:
+            for activity_id in activity_ids:
+                timer.current = {}
+                t0 = time.perf_counter()
+                try:
+                    fetched = get_streams.fetch_activity(activity_id, client)
+                except Exception as e:
+                    failed.append((activity_id, str(e)))
+                    continue
+                t1 = time.perf_counter()
+                if fetched is None:
+                    failed.append((activity_id, "réponse HTTP en erreur"))
+                    continue
+                act = get_streams.apply_activity(activity_id, *fetched, activities)
+                t2 = time.perf_counter()
+                if act is None:
+                    failed.append((activity_id, "pas de streams time/distance"))
+                    continue
+                dal.upsert_activities_local([act])
+                t3 = time.perf_counter()
+
+                inner = timer.current.get("resample", 0.0) + timer.current.get("weather", 0.0)
+                samples["fetch"].append(t1 - t0)
+                samples["resample"].append(timer.current.get("resample", 0.0))
+                samples["derive"].append(max(0.0, t2 - t1 - inner))
+                samples["weather"].append(timer.current.get("weather", 0.0))
+                samples["save"].append(t3 - t2)
+                totals.append(t3 - t0)
+    finally:
+        stream_ops.resample, get_streams.fetch_open_meteo = saved_resample, saved_weather
+    return samples, totals, failed, time.perf_counter() - started
+
+
+def replay_client(workdir):
+    """Client Strava du rejeu : token factice, budget illimité, backoff court."""
+    tokens = workdir / "strava_tokens.json"
+    tokens.write_text('{"access_token": "replay", "refresh_token": "replay", "expires_at": 4102444800}')
+    return StravaClient(tokens_file=tokens, limiter=RateLimiter(10 ** 9, 10 ** 9, burst=10 ** 9),
+                        etag_store={}, backoff_base=0.05)
+
+
+def report(samples, totals, failed, elapsed, server_stats=None):
+    print(f"\n{'étape':<10} {'moy (ms)':>10} {'p50 (ms)':>10} {'p95 (ms)':>10} {'total (s)':>10}")
+    for stage in STAGES + ("total",):
+        values = np.array(totals if stage == "total" else samples[stage]) * 1000
+        if not len(values):
+            continue
+        print(f"{stage:<10} {values.mean():>10.1f} {np.percentile(values, 50):>10.1f} "
+              f"{np.percentile(values, 95):>10.1f} {values.sum() / 1000:>10.2f}")
+    print(f"\n⚡ {len(totals)} activités en {elapsed:.2f}s : {len(totals) / elapsed if elapsed else 0:.1f} activités/s")
+    if failed:
+        print(f"❌ {len(failed)} en échec : {failed[:5]}")
+    if server_stats:
+        print(f"📼 Rejeu : {server_stats}")
+    print(f"🌦️ Météo : {weather_service.stats()}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de l'ingestion sur réponses HTTP enregistrées")
+    ap.add_argument("--fixtures", help="répertoire des fixtures (défaut : http_fixtures/, ou temporaire avec --synthetic)")
+    ap.add_argument("--synthetic", type=int, metavar="N", help="générer N activités synthétiques")
+    ap.add_argument("--points", type=int, default=3600, help="échantillons par activité synthétique")
+    ap.add_argument("--locations", type=int, default=4, help="lieux distincts des activités synthétiques")
+    ap.add_argument("--record", type=int, metavar="N", help="enregistrer les N dernières activités (API réelles)")
+    ap.add_argument("--latency", type=float, default=0.0, help="latence injectée par requête (s)")
+    ap.add_argument("--jitter", type=float, default=0.0, help="latence aléatoire supplémentaire max (s)")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="proportion de réponses 503 injectées")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--verbose", action="store_true", help="afficher les logs de l'ingestion")
+    args = ap.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="t2t_bench_ingest_"))
+    fixtures = http_replay.Fixtures(Path(args.fixtures) if args.fixtures else
+                                    workdir / "fixtures" if args.synthetic else http_replay.FIXTURES_DIR)
+    try:
+        with isolated_data(workdir / "data"):
+            if args.record:
+                client = default_client()
+                recorders = [http_replay.install(session, http_replay.RecordingAdapter(fixtures))
+                             for session in (client.session, weather_service._session)]
+                ids = [int(s["id"]) for s in client.athlete_activities(per_page=args.record, page=1)]
+                print(f"⏺️ Enregistrement de {len(ids)} activités dans {fixtures.root}...")
+                samples, totals, failed, elapsed = ingest(ids, client, args.verbose)
+                print(f"✅ {sum(r.recorded for r in recorders)} réponses enregistrées")
+                report(samples, totals, failed, elapsed)
+                return
+
+            if args.synthetic:
+                print(f"⏳ Génération de {args.synthetic} activités x {args.points} échantillons "
+                      f"({args.locations} lieux)...")
+                write_synthetic_fixtures(fixtures, args.synthetic, args.points, args.locations, args.seed)
+            ids = recorded_ids(fixtures)
+            if not ids:
+                print(f"❌ Aucune activité enregistrée dans {fixtures.root} (--record N ou --synthetic N)")
+                return
+
+            with http_replay.ReplayServer(fixtures, latency=args.latency, jitter=args.jitter,
+                                          error_rate=args.error_rate, seed=args.seed) as server:
+                client = replay_client(workdir)
+                for session in (client.session, weather_service._session):
+                    http_replay.install(session, http_replay.ReplayAdapter(server.base_url))
+                print(f"▶️ Rejeu de {len(ids)} activités (latence {args.latency}s "
+                      f"+ {args.jitter}s, erreurs {args.error_rate:.0%})...")
+                samples, totals, failed, elapsed = ingest(ids, client, args.verbose)
+                report(samples, totals, failed, elapsed, server.stats())
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# bench_serializers.py — Compare les formats de serializers.py sur un historique synthétique
+#
+#   python bench_serializers.py                 # 2000 activités, 500 points chacune
+#   python bench_serializers.py --activities 500 --points 1000 --repeat 5
+#
+# Mesure, pour chaque format : temps d'écriture, temps de lecture et taille sur
+# disque, pour l'index des activités (résumés seuls puis avec points inline,
+# l'ancien format) et pour les streams (liste de dicts JSON vs colonnes .npy).
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+import serializers
+from data_access_local import points_to_columns
+
+
+def synthetic_activity(i, n_points, rng):
+    start = 1_700_000_000 + i * 86_400
+    speed = rng.uniform(2.6, 3.6)
+    points, dist, alt = [], 0.0, rng.uniform(50, 300)
+    for t in range(n_points):
+        dist += speed * 3
+        alt += rng.uniform(-0.5, 0.5)
+        points.append({
+            "time": t * 3,
+            "distance": round(dist, 1),
+            "hr": round(rng.uniform(120, 175), 1),
+            "vel": round(speed + rng.uniform(-0.3, 0.3), 3),
+            "alt": round(alt, 1),
+            "lat": 48.85 + rng.uniform(-0.01, 0.01),
+            "lng": 2.35 + rng.uniform(-0.01, 0.01),
+            "cad_raw": round(rng.uniform(80, 92), 1),
+            "cad_spm": round(rng.uniform(160, 184), 1),
+        })
+    summary = {
+        "activity_id": str(10_000_000_000 + i),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(start)),
+        "distance_km": round(dist / 1000, 2),
+        "duration_sec": n_points * 3,
+        "type_sortie": rng.choice(["endurance", "tempo_rapide", "tempo_recup", "long_run"]),
+        "k_moy": round(rng.uniform(5.5, 7.5), 3),
+        "deriv_cardio": round(rng.uniform(-1, 9), 1),
+        "fc_moy": round(rng.uniform(130, 160), 1),
+        "fc_max": round(rng.uniform(165, 190), 1),
+        "allure": "5:%02d" % rng.randint(0, 59),
+        "gain_alt": round(rng.uniform(0, 150), 1),
+        "drift_slope": round(rng.uniform(0, 1), 4),
+        "cv_allure": round(rng.uniform(0, 0.2), 4),
+        "cv_cardio": round(rng.uniform(0, 0.2), 4),
+        "avg_temperature": round(rng.uniform(-2, 30), 1),
+        "weather_code": rng.choice([0, 1, 2, 3, 61]),
+        "cadence_meta": {"present": True, "source": "cad_raw", "factor": 2},
+        "points_count": n_points,
+    }
+    return summary, points
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def bench_document(label, data, formats, workdir, repeat, rows):
+    for fmt in formats:
+        path = workdir / f"{label}.{fmt}"
+        dump_s, _ = timed(lambda: serializers.dump_file(path, data, fmt), repeat)
+        load_s, loaded = timed(lambda: serializers.load_file(path), repeat)
+        assert len(loaded) == len(data)
+        rows.append((label, fmt, dump_s, load_s, path.stat().st_size))
+
+
+def bench_streams(all_points, workdir, repeat, rows):
+    as_json = workdir / "streams_json"
+    as_npy = workdir / "streams_npy"
+
+    def dump_json():
+        as_json.mkdir(exist_ok=True)
+        for i, points in enumerate(all_points):
+            serializers.dump_file(as_json / f"{i}.json", points, "json", atomic=False)
+
+    def load_json():
+        return [serializers.load_file(as_json / f"{i}.json") for i in range(len(all_points))]
+
+    def dump_npy():
+        for i, points in enumerate(all_points):
+            directory = as_npy / str(i)
+            directory.mkdir(parents=True, exist_ok=True)
+            for name, column in points_to_columns(points).items():
+                np.save(directory / f"{name}.npy", column)
+
+    def load_npy():
+        return [{p.stem: np.load(p, mmap_mode="r") for p in (as_npy / str(i)).glob("*.npy")}
+                for i in range(len(all_points))]
+
+    for label, dump, load, directory in (("json", dump_json, load_json, as_json),
+                                         ("npy", dump_npy, load_npy, as_npy)):
+        dump_s, _ = timed(dump, repeat)
+        load_s, _ = timed(load, repeat)
+        size = sum(p.stat().st_size for p in directory.rglob("*") if p.is_file())
+        rows.append(("streams", label, dump_s, load_s, size))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--activities", type=int, default=2000)
+    ap.add_argument("--points", type=int, default=500, help="points par activité")
+    ap.add_argument("--repeat", type=int, default=3, help="meilleur temps sur N essais")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"⏳ Génération de {args.activities} activités x {args.points} points...")
+    summaries, all_points = [], []
+    for i in range(args.activities):
+        summary, points = synthetic_activity(i, args.points, rng)
+        summaries.append(summary)
+        all_points.append(points)
+    legacy = [dict(s, points=p) for s, p in zip(summaries, all_points)]
+
+    formats = ["json-pretty", "json"] + (["msgpack"] if serializers.MSGPACK_AVAILABLE else [])
+    if not serializers.MSGPACK_AVAILABLE:
+        print("ℹ️ msgpack non installé : format msgpack ignoré (pip install msgpack)")
+
+    rows = []
+    workdir = Path(tempfile.mkdtemp(prefix="t2t_bench_"))
+    try:
+        bench_document("summaries", summaries, formats, workdir, args.repeat, rows)
+        bench_document("with_points", legacy, formats, workdir, args.repeat, rows)
+        bench_streams(all_points, workdir, args.repeat, rows)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{'données':<12} {'format':<12} {'écriture (s)':>13} {'lecture (s)':>12} {'taille (Mo)':>12}")
+    for label, fmt, dump_s, load_s, size in rows:
+        print(f"{label:<12} {fmt:<12} {dump_s:>13.3f} {load_s:>12.3f} {size / 1e6:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,13 @@
 Calcul des statistiques de running par type de sortie
 Appelé après chaque run pour mettre à jour les moyennes
 """
-import json
 import numpy as np
 from datetime import datetime
 from pathlib import Path
 
+import data_access_local as dal
+import serializers
+
 
 def get_segments_count(run_type):
     """
@@ -83,6 +85,151 @@ def calculate_fc_by_segments(points, num_segments):
     return fc_segments if any(fc_segments) else None
 
 
+def _category(act):
+    """Catégorie d'une séance (session_category après reclassification, sinon type_sortie)."""
+    return act.get('session_category') or act.get('type_sortie', 'inconnue')
+
+
+def _run_columns(run):
+    """Canaux d'un run : depuis ses points s'ils sont chargés, sinon depuis streams/."""
+    if run.get('points'):
+        return dal.points_to_columns(run['points'])
+    if run.get('points') is None and run.get('activity_id') is not None:
+        return dal.load_points(run['activity_id']) or {}
+    return {}
+
+
+def _fc_by_segments_columns(hr, dist, num_segments):
+    """calculate_fc_by_segments sur des colonnes NumPy (NaN = absent)."""
+    has_dist = ~np.isnan(dist)
+    if not has_dist.any():
+        return None
+    total_distance = dist[has_dist].max()
+    if total_distance == 0:
+        return None
+    segment_size = total_distance / num_segments
+    valid = has_dist & ~np.isnan(hr)
+    fc_segments = []
+    for i in range(num_segments):
+        in_segment = valid & (dist >= i * segment_size) & (dist < (i + 1) * segment_size)
+        fc_segments.append(float(hr[in_segment].mean()) if in_segment.any() else None)
+    return fc_segments if any(fc_segments) else None
+
+
+def run_metrics(run, run_type):
+    """
+    Mesures d'un run pour les stats de sa catégorie (FC moyenne / max, FC par
+    segments, distance, allure, k_moy, dérive). Une mesure absente vaut None,
+    avec les mêmes règles d'exclusion que le calcul d'origine.
+    """
+    metrics = {
+        'activity_id': run.get('activity_id'),
+        'date': run.get('date', ''),
+        'fc_moy': None, 'fc_max': None, 'fc_segments': None,
+        'distance_km': None, 'allure': None, 'k_moy': None, 'deriv_cardio': None,
+    }
+    columns = _run_columns(run)
+    if not columns:
+        return metrics
+    n = max(len(c) for c in columns.values())
+    nan = np.full(n, np.nan)
+    hr = np.asarray(columns.get('hr', nan), dtype=np.float64)
+    dist = np.asarray(columns.get('distance', nan), dtype=np.float64)
+    times = np.asarray(columns.get('time', nan), dtype=np.float64)
+
+    # FC
+    hrs = hr[~np.isnan(hr)]
+    if len(hrs):
+        metrics['fc_moy'] = float(hrs.mean())
+        metrics['fc_max'] = float(hrs.max())
+
+    # FC par segments
+    metrics['fc_segments'] = _fc_by_segments_columns(hr, dist, get_segments_count(run_type))
+
+    # Distance totale
+    dists = dist[~np.isnan(dist)]
+    if not len(dists):
+        return metrics
+    total_dist_km = float(dists.max()) / 1000
+    metrics['distance_km'] = total_dist_km
+
+    # Temps total
+    valid_times = times[~np.isnan(times)]
+    if not len(valid_times):
+        return metrics
+    total_time_min = float(valid_times.max()) / 60
+
+    # Allure moyenne du run = temps total / distance totale
+    if total_dist_km > 0:
+        metrics['allure'] = total_time_min / total_dist_km
+
+    # k_moy et dérive
+    metrics['k_moy'] = run.get('k_moy')
+    metrics['deriv_cardio'] = run.get('deriv_cardio')
+    return metrics
+
+
+def _summary(values, ndigits, tendance=False):
+    summary = {
+        'moyenne': round(np.mean(values), ndigits) if values else None,
+        'min': round(min(values), ndigits) if values else None,
+        'max': round(max(values), ndigits) if values else None,
+    }
+    if tendance:
+        summary['tendance'] = 'hausse' if len(values) >= 3 and values[0] > np.mean(values[1:]) else 'baisse'
+    return summary
+
+
+def stats_from_window(run_type, window):
+    """
+    Stats d'une catégorie à partir des mesures (run_metrics) de ses dernières
+    courses, plus récente d'abord.
+    """
+    def values(key):
+        return [m[key] for m in window if m.get(key) is not None]
+
+    # Moyenne des FC par segments (transposée : [segment1_valeurs, segment2_valeurs, ...])
+    fc_segments_all_runs = values('fc_segments')
+    fc_segments_moyennes = None
+    if fc_segments_all_runs:
+        num_segs = len(fc_segments_all_runs[0])
+        fc_segments_moyennes = []
+        for i in range(num_segs):
+            segment_values = [
+                run_segs[i]
+                for run_segs in fc_segments_all_runs
+                if i < len(run_segs) and run_segs[i] is not None
+            ]
+            if segment_values:
+                fc_segments_moyennes.append(round(np.mean(segment_values), 1))
+            else:
+                fc_segments_moyennes.append(None)
+
+    return {
+        'type': run_type,
+        'nombre_courses': len(window),
+        'derniere_date': window[0].get('date', '')[:10] if window else None,
+        'distance': _summary(values('distance_km'), 2),
+        # Moyennes NumPy (np.float64) : même arrondi que les valeurs relues du kv
+        'fc_moyenne': _summary([np.float64(v) for v in values('fc_moy')], 1),
+        'fc_max': _summary(values('fc_max'), 1),
+        'fc_segments': fc_segments_moyennes,
+        'allure': _summary(values('allure'), 2),
+        'k_moy': _summary(values('k_moy'), 2, tendance=True),
+        'deriv_cardio': _summary(values('deriv_cardio'), 3),
+    }
+
+
+def _windows_by_type(activities, n_last):
+    """{catégorie: N dernières courses}, plus récentes en premier."""
+    # Trier par date (plus récentes en premier)
+    activities_sorted = sorted(activities, key=lambda x: x.get('date', ''), reverse=True)
+    by_type = {}
+    for act in activities_sorted:
+        by_type.setdefault(_category(act), []).append(act)
+    return {run_type: runs[:n_last] for run_type, runs in by_type.items()}
+
+
 def calculate_stats_by_type(activities, n_last=15):
     """
     Calcule les statistiques des N dernières courses PAR TYPE de run
@@ -94,147 +241,141 @@ def calculate_stats_by_type(activities, n_last=15):
     Returns:
         dict: Statistiques par type de run
     """
-    # Trier par date (plus récentes en premier)
-    activities_sorted = sorted(activities, key=lambda x: x.get('date', ''), reverse=True)
+    return {
+        run_type: stats_from_window(run_type, [run_metrics(run, run_type) for run in runs])
+        for run_type, runs in _windows_by_type(activities, n_last).items()
+    }
 
-    # Grouper par type de run (session_category après reclassification)
-    by_type = {}
-    for act in activities_sorted:
-        # Utiliser session_category en priorité, sinon type_sortie pour compatibilité
-        run_type = act.get('session_category') or act.get('type_sortie', 'inconnue')
-        if run_type not in by_type:
-            by_type[run_type] = []
-        by_type[run_type].append(act)
-
-    # Calculer les stats pour chaque type
-    stats_by_type = {}
-
-    for run_type, runs in by_type.items():
-        # Prendre les N dernières courses de ce type
-        recent_runs = runs[:n_last]
-
-        if not recent_runs:
-            continue
-
-        # Déterminer le nombre de segments pour ce type
-        num_segments = get_segments_count(run_type)
-
-        # Extraire les métriques
-        fc_moyennes = []
-        fc_max_values = []
-        allures = []
-        k_values = []
-        deriv_values = []
-        distances = []
-        fc_segments_all_runs = []  # Liste de listes pour chaque run
-
-        for run in recent_runs:
-            points = run.get('points', [])
-            if not points:
-                continue
-
-            # FC
-            hrs = [p.get('hr') for p in points if p.get('hr') is not None]
-            if hrs:
-                fc_moyennes.append(np.mean(hrs))
-                fc_max_values.append(max(hrs))
-
-            # FC par segments
-            fc_segs = calculate_fc_by_segments(points, num_segments)
-            if fc_segs:
-                fc_segments_all_runs.append(fc_segs)
-
-            # Distance totale
-            dists = [p.get('distance') for p in points if p.get('distance') is not None]
-            if dists:
-                total_dist_km = max(dists) / 1000
-                distances.append(total_dist_km)
-            else:
-                continue
 
-            # Temps total
-            times = [p.get('time') for p in points if p.get('time') is not None]
-            if times:
-                total_time_min = max(times) / 60
-            else:
-                continue
-
-            # Allure moyenne du run = temps total / distance totale
-            if total_dist_km > 0:
-                allure_moy = total_time_min / total_dist_km
-                allures.append(allure_moy)
-
-            # k_moy et dérive
-            if run.get('k_moy') is not None:
-                k_values.append(run.get('k_moy'))
-            if run.get('deriv_cardio') is not None:
-                deriv_values.append(run.get('deriv_cardio'))
-
-        # Calculer la moyenne des FC par segments
-        fc_segments_moyennes = None
-        if fc_segments_all_runs:
-            # Transposer pour avoir [segment1_valeurs, segment2_valeurs, ...]
-            num_segs = len(fc_segments_all_runs[0])
-            fc_segments_moyennes = []
-            for i in range(num_segs):
-                # Extraire les valeurs du segment i de tous les runs
-                segment_values = [
-                    run_segs[i]
-                    for run_segs in fc_segments_all_runs
-                    if i < len(run_segs) and run_segs[i] is not None
-                ]
-                if segment_values:
-                    fc_segments_moyennes.append(round(np.mean(segment_values), 1))
-                else:
-                    fc_segments_moyennes.append(None)
-
-        # Calculer les moyennes et ranges
-        stats = {
-            'type': run_type,
-            'nombre_courses': len(recent_runs),
-            'derniere_date': recent_runs[0].get('date', '')[:10] if recent_runs else None,
-            'distance': {
-                'moyenne': round(np.mean(distances), 2) if distances else None,
-                'min': round(min(distances), 2) if distances else None,
-                'max': round(max(distances), 2) if distances else None
-            },
-            'fc_moyenne': {
-                'moyenne': round(np.mean(fc_moyennes), 1) if fc_moyennes else None,
-                'min': round(min(fc_moyennes), 1) if fc_moyennes else None,
-                'max': round(max(fc_moyennes), 1) if fc_moyennes else None
-            },
-            'fc_max': {
-                'moyenne': round(np.mean(fc_max_values), 1) if fc_max_values else None,
-                'min': round(min(fc_max_values), 1) if fc_max_values else None,
-                'max': round(max(fc_max_values), 1) if fc_max_values else None
-            },
-            'fc_segments': fc_segments_moyennes,
-            'allure': {
-                'moyenne': round(np.mean(allures), 2) if allures else None,
-                'min': round(min(allures), 2) if allures else None,
-                'max': round(max(allures), 2) if allures else None
-            },
-            'k_moy': {
-                'moyenne': round(np.mean(k_values), 2) if k_values else None,
-                'min': round(min(k_values), 2) if k_values else None,
-                'max': round(max(k_values), 2) if k_values else None,
-                'tendance': 'hausse' if len(k_values) >= 3 and k_values[0] > np.mean(k_values[1:]) else 'baisse'
-            },
-            'deriv_cardio': {
-                'moyenne': round(np.mean(deriv_values), 3) if deriv_values else None,
-                'min': round(min(deriv_values), 3) if deriv_values else None,
-                'max': round(max(deriv_values), 3) if deriv_values else None
-            }
-        }
+# ========== AGRÉGATION INCRÉMENTALE ==========
+#
+# Recalculer toutes les catégories après chaque ingestion relisait tout
+# l'historique (tri, regroupement, FC par segments depuis les points). Les
+# mesures des N dernières courses de chaque catégorie sont gardées dans le kv
+# (une clé par catégorie) : une nouvelle course ne coûte que ses propres
+# mesures et la mise à jour de sa catégorie.
+
+STATE_NAMESPACE = "running_stats_window"
+STATE_META_KEY = "__meta__"
+
+
+class RunningStatsAggregator:
+    """Fenêtres des n_last dernières courses par catégorie, persistées, et running_stats.json."""
 
-        stats_by_type[run_type] = stats
+    def __init__(self, n_last=15, output_file='running_stats.json', namespace=STATE_NAMESPACE):
+        self.n_last = n_last
+        self.output_file = output_file
+        self.namespace = namespace
 
-    return stats_by_type
+    def _categories(self):
+        return [k for k in dal.kv_keys(self.namespace) if k != STATE_META_KEY]
+
+    def window(self, category):
+        return dal.kv_get(self.namespace, category, [])
+
+    def _save_window(self, category, window):
+        if window:
+            dal.kv_put(self.namespace, category, window)
+        else:
+            dal.kv_delete(self.namespace, category)
+
+    def initialized(self):
+        meta = dal.kv_get(self.namespace, STATE_META_KEY)
+        return bool(meta) and meta.get('n_last') == self.n_last
+
+    def rebuild(self, activities=None):
+        """Recalcule toutes les fenêtres depuis l'historique (activités avec ou sans points)."""
+        if activities is None:
+            activities = dal.load_activity_summaries()
+        windows = {
+            run_type: [run_metrics(run, run_type) for run in runs]
+            for run_type, runs in _windows_by_type(activities, self.n_last).items()
+        }
+        for category in set(self._categories()) - set(windows):
+            dal.kv_delete(self.namespace, category)
+        for category, window in windows.items():
+            self._save_window(category, window)
+        dal.kv_put(self.namespace, STATE_META_KEY, {'n_last': self.n_last, 'built_at': datetime.now().isoformat()})
+        return self.write()
+
+    def refresh_categories(self, categories):
+        """Recalcule quelques catégories depuis l'index (leurs n_last dernières courses seulement)."""
+        categories = set(categories)
+        summaries = [a for a in dal.load_activity_summaries() if _category(a) in categories]
+        windows = _windows_by_type(summaries, self.n_last)
+        for category in categories:
+            runs = windows.get(category, [])
+            self._save_window(category, [run_metrics(run, category) for run in runs])
+        return categories
+
+    def update(self, activities):
+        """
+        Prend en compte des activités nouvelles ou modifiées : seules leurs
+        catégories (et celle qu'elles quittent) sont mises à jour.
+        Retourne les catégories touchées.
+        """
+        if not self.initialized():
+            self.rebuild()
+            return set(self._categories())
+        activities = [a for a in activities if a.get('activity_id') is not None]
+        touched, refresh = set(), set()
+        windows = {c: self.window(c) for c in self._categories()}
+
+        # Reclassement : la course quitte sa fenêtre (une place se libère, à recompléter)
+        for act in activities:
+            for category, window in windows.items():
+                if category != _category(act) and any(str(m['activity_id']) == str(act['activity_id']) for m in window):
+                    refresh.add(category)
+
+        for act in activities:
+            category = _category(act)
+            window = [m for m in windows.get(category, []) if str(m['activity_id']) != str(act['activity_id'])]
+            date = act.get('date', '')
+            if len(window) >= self.n_last and date < window[-1].get('date', ''):
+                continue  # plus ancienne que les n_last dernières : sans effet
+            # Après les courses de même date déjà présentes (comme le tri stable du calcul complet)
+            pos = next((i for i, m in enumerate(window) if m.get('date', '') < date), len(window))
+            window.insert(pos, run_metrics(act, category))
+            windows[category] = window[:self.n_last]
+            touched.add(category)
+
+        for category in touched - refresh:
+            self._save_window(category, windows[category])
+        if refresh:
+            self.refresh_categories(refresh)
+        touched |= refresh
+        if touched:
+            self.write(touched)
+        return touched
+
+    def remove(self, activity_ids):
+        """Retire des activités supprimées ; leurs catégories sont recomplétées depuis l'index."""
+        ids = {str(i) for i in activity_ids}
+        categories = {c for c in self._categories()
+                      if any(str(m['activity_id']) in ids for m in self.window(c))}
+        if categories:
+            self.refresh_categories(categories)
+            self.write(categories)
+        return categories
+
+    def write(self, categories=None):
+        """Réécrit running_stats.json (seules `categories` sont recalculées, depuis leur fenêtre)."""
+        current = serializers.load_optional(Path(self.output_file)) or {}
+        stats_by_type = current.get('stats_by_type', {}) if categories is not None else {}
+        for category in (self._categories() if categories is None else categories):
+            window = self.window(category)
+            if window:
+                stats_by_type[category] = stats_from_window(category, window)
+            else:
+                stats_by_type.pop(category, None)
+        save_running_stats(stats_by_type, self.output_file)
+        return stats_by_type
 
 
 def save_running_stats(stats_by_type, output_file='running_stats.json'):
     """
-    Sauvegarde les statistiques dans un fichier JSON
+    Sauvegarde les statistiques (format serializers.FILE_FORMATS["running_stats"],
+    JSON compact par défaut)
 
     Args:
         stats_by_type: Dictionnaire des stats par type
@@ -252,8 +393,7 @@ def save_running_stats(stats_by_type, output_file='running_stats.json'):
         }
     }
 
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(output_data, f, ensure_ascii=False, indent=2)
+    serializers.dump_file(output_path, output_data, serializers.format_for("running_stats"))
 
     print(f"✅ Stats sauvegardées dans {output_path}")
     return output_path
@@ -262,14 +402,11 @@ def save_running_stats(stats_by_type, output_file='running_stats.json'):
 
 
 if __name__ == "__main__":
-    # Test : charger activities.json et calculer les stats
-    with open('activities.json', 'r') as f:
-        activities = json.load(f)
+    # Test : charger activities.json (points relus depuis streams/) et calculer les stats
+    from data_access_local import load_activities_local
+    activities = load_activities_local()
 
     print(f"📂 Chargement de {len(activities)} activités")
 
-    # Calculer les stats
-    stats = calculate_stats_by_type(activities, n_last=15)
-
-    # Sauvegarder
-    save_running_stats(stats, 'running_stats.json')
+    # Calculer les stats et initialiser les fenêtres incrémentales
+    RunningStatsAggregator(n_last=15).rebuild(activities)
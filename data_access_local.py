@@ -2,31 +2,40 @@
 from __future__ import annotations
 import json
 import os
-from typing import Any, Dict, List, Optional
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
 from pathlib import Path
-from datetime import datetime
+from urllib.parse import quote, unquote
 
-# Import de l'ancien module Drive pour backup optionnel
 try:
-    from data_access import (
-        save_activities_to_drive as _save_to_drive,
-        load_activities_from_drive as _load_from_drive,
-        DriveUnavailableError
-    )
-    DRIVE_AVAILABLE = True
-except ImportError:
-    DRIVE_AVAILABLE = False
-    DriveUnavailableError = RuntimeError
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+
+import serializers
 
 # Chemins locaux
 BASE_DIR = Path(__file__).parent
 ACTIVITIES_FILE = BASE_DIR / "activities.json"
 PROFILE_FILE = BASE_DIR / "profile.json"
+STREAMS_DIR = BASE_DIR / "streams"
+SQLITE_FILE = BASE_DIR / "activities.sqlite3"
+# Journal append-only des modifications par activité (backend JSON)
+ACTIVITIES_WAL_FILE = BASE_DIR / "activities.wal.jsonl"
+ACTIVITIES_LOCK_FILE = BASE_DIR / ".activities.lock"
+# Taille du journal au-delà de laquelle on compacte en tâche de fond
+WAL_COMPACT_BYTES = int(os.getenv("T2T_WAL_COMPACT_BYTES", str(512 * 1024)))
 OUTPUTS_DIR = BASE_DIR / "outputs"
 OUTPUTS_DIR.mkdir(exist_ok=True)
 
-# Fichier de tracking du dernier backup Drive
-LAST_BACKUP_FILE = BASE_DIR / ".last_drive_backup"
+# Backend de l'index des activités : "json" (défaut) ou "sqlite"
+STORAGE_BACKEND = os.getenv("T2T_STORAGE_BACKEND", "json").strip().lower()
+if STORAGE_BACKEND == "sqlite":
+    import data_access_sqlite as _sqlite
 
 # Debug
 DEBUG = os.getenv("SC_DEBUG") == "1"
@@ -35,81 +44,666 @@ def _dbg(msg: str) -> None:
         print(f"[DA_LOCAL] {msg}")
 
 
+# ========== VERROU FICHIER ==========
+
+_thread_lock = threading.RLock()
+
+
+@contextmanager
+def _file_lock(lock_path: Path):
+    """Verrou exclusif inter-processus (flock / msvcrt) + inter-threads."""
+    with _thread_lock:
+        with open(lock_path, "a+") as fh:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+                else:
+                    fh.seek(0)
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _write_atomic(path: Path, data: Any, kind: str) -> None:
+    """Écrit via fichier temporaire + os.replace (jamais de fichier tronqué), au format du type de fichier."""
+    serializers.dump_file(path, data, serializers.format_for(kind))
+
+
+# ========== CACHE MÉMOIRE (validé par mtime / taille / inode) ==========
+#
+# Chaque entrée garde la signature (st_mtime_ns, st_size, st_ino) des fichiers
+# dont elle dépend, relevée AVANT la lecture : une écriture concurrente rend
+# l'entrée périmée au prochain appel. Un os.replace change l'inode, un ajout au
+# journal change la taille : les écritures d'un autre process sont détectées.
+# Les writers de ce module invalident en plus explicitement leur clé.
+
+def _file_signature(path: Path) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class _FileCache:
+    def __init__(self) -> None:
+        self._entries: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, paths: Iterable[Path], loader):
+        paths = tuple(paths)
+        signature = tuple(_file_signature(p) for p in paths)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = loader()
+        with self._lock:
+            self._entries[key] = (signature, value)
+        return value
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+                "entries": sorted(self._entries),
+            }
+
+
+_cache = _FileCache()
+
+
+def _clone(data: Any) -> Any:
+    """Copie profonde d'un petit JSON (profil, outputs) : l'appelant peut la modifier."""
+    if data is None:
+        return None
+    return json.loads(json.dumps(data))
+
+
+def _copy_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copie d'un enregistrement d'activité servi depuis un cache : les valeurs
+    imbriquées (dicts, listes : cadence_meta, start_latlng...) sont copiées aussi,
+    les scalaires partagés (immuables). Modifiable sans toucher le cache.
+    """
+    return {k: _copy_nested(v) if isinstance(v, (dict, list)) else v for k, v in record.items()}
+
+
+def _copy_nested(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _copy_nested(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy_nested(v) for v in value]
+    return value
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Compteurs hit / miss du cache mémoire (activités, profil, outputs)."""
+    return _cache.stats()
+
+
+def invalidate_cache(key: Optional[str] = None) -> None:
+    """Vide une entrée du cache (ex. 'profile', 'output:weekly_plan.json') ou tout le cache."""
+    _cache.invalidate(key)
+
+
+# ========== STREAMS (stockage colonnaire des points) ==========
+#
+# Les points d'une activité ne sont plus stockés en liste de dicts dans
+# activities.json : chaque canal est un tableau NumPy float64 (NaN = valeur
+# absente) écrit dans streams/<activity_id>/<canal>.npy et relu en mmap.
+
+POINT_CHANNELS = ("time", "distance", "hr", "vel", "alt", "lat", "lng", "cad_raw", "cad_spm")
+_INT_CHANNELS = {"time"}
+
+
+def _stream_dir(activity_id: Any) -> Path:
+    return STREAMS_DIR / str(activity_id)
+
+
+def points_to_columns(points: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Convertit une liste de points (dicts) en un tableau float64 par canal."""
+    if not points:
+        return {}
+    names = [c for c in POINT_CHANNELS if any(c in p for p in points)]
+    extras = sorted({k for p in points for k in p} - set(POINT_CHANNELS))
+    columns = {}
+    for name in names + extras:
+        values = [p.get(name) for p in points]
+        columns[name] = np.array(
+            [v if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan for v in values],
+            dtype=np.float64,
+        )
+    return columns
+
+
+def columns_to_points(columns: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """Reconstruit la liste de points (dicts) à partir des colonnes (NaN -> None)."""
+    if not columns:
+        return []
+    names = [c for c in POINT_CHANNELS if c in columns] + sorted(set(columns) - set(POINT_CHANNELS))
+    series = {}
+    for name in names:
+        arr = np.asarray(columns[name], dtype=np.float64)
+        missing = np.isnan(arr).tolist()
+        vals = arr.tolist()
+        if name in _INT_CHANNELS:
+            series[name] = [None if m else (int(v) if v.is_integer() else v) for v, m in zip(vals, missing)]
+        else:
+            series[name] = [None if m else v for v, m in zip(vals, missing)]
+    n = min(len(v) for v in series.values())
+    return [{name: series[name][i] for name in names} for i in range(n)]
+
+
+def save_points(activity_id: Any, points: Any) -> bool:
+    """
+    Écrit les points d'une activité dans le store colonnaire.
+    Accepte une liste de dicts ou un dict {canal: tableau}.
+    Retourne True si des fichiers ont été (ré)écrits, False si inchangé.
+    """
+    columns = points if isinstance(points, dict) else points_to_columns(points)
+    if not columns:
+        return False
+
+    existing = load_points(activity_id, mmap=False)
+    if existing is not None and set(existing) == set(columns) and all(
+        existing[c].shape == np.shape(columns[c])
+        and np.array_equal(existing[c], np.asarray(columns[c], dtype=np.float64), equal_nan=True)
+        for c in columns
+    ):
+        return False
+
+    target = _stream_dir(activity_id)
+    try:
+        target.mkdir(parents=True, exist_ok=True)
+        for name, arr in columns.items():
+            tmp = target / f"{name}.npy.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(arr, dtype=np.float64))
+            os.replace(tmp, target / f"{name}.npy")
+        # Canaux disparus (rare) : supprimer pour rester cohérent
+        for stale in target.glob("*.npy"):
+            if stale.stem not in columns:
+                stale.unlink()
+        _dbg(f"streams saved for {activity_id}: {len(columns)} canaux")
+        return True
+    except Exception as e:
+        raise RuntimeError(f"Erreur écriture streams {target}: {e}") from e
+
+
+def load_points(activity_id: Any, mmap: bool = True) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Charge les canaux d'une activité depuis le store colonnaire.
+    Retourne {canal: ndarray} (mmap en lecture seule par défaut), ou None si absent.
+    """
+    if activity_id is None:
+        return None
+    target = _stream_dir(activity_id)
+    if not target.is_dir():
+        return None
+    columns = {}
+    try:
+        for f in target.glob("*.npy"):
+            columns[f.stem] = np.load(f, mmap_mode="r" if mmap else None, allow_pickle=False)
+    except Exception as e:
+        raise RuntimeError(f"Erreur lecture streams {target}: {e}") from e
+    return columns or None
+
+
+def delete_points(activity_id: Any) -> None:
+    """Supprime les streams d'une activité (si présents)."""
+    target = _stream_dir(activity_id)
+    if not target.is_dir():
+        return
+    for f in target.iterdir():
+        f.unlink()
+    target.rmdir()
+
+
 # ========== ACTIVITIES ==========
 
-def load_activities_local() -> List[Dict[str, Any]]:
-    """Charge activities.json depuis le disque local."""
-    if not ACTIVITIES_FILE.exists():
+class ActivityList(list):
+    """
+    Activités chargées depuis l'index JSON, avec la position qu'elles reflètent :
+    (signature du snapshot, octets du journal lus). save_activities_local s'en
+    sert pour replier les patchs ajoutés au journal après le chargement.
+    """
+    wal_position: Optional[tuple] = None
+
+
+def _hydrate_points(activity: Dict[str, Any]) -> Dict[str, Any]:
+    """Rattache les points (liste de dicts) depuis le store colonnaire si absents du JSON."""
+    if "points" in activity or activity.get("activity_id") is None:
+        return activity
+    columns = load_points(activity["activity_id"])
+    if columns is not None:
+        activity["points"] = columns_to_points(columns)
+    return activity
+
+
+def load_activity_summaries() -> List[Dict[str, Any]]:
+    """
+    Charge l'index des activités (champs scalaires uniquement, sans les points).
+    À utiliser par les routes qui ne lisent que distance_km, k_moy, deriv_cardio...
+    Les points se chargent ensuite à la demande via load_activity_points().
+
+    Servi depuis le cache mémoire tant que les fichiers sous-jacents n'ont pas
+    changé ; chaque appel reçoit des copies des enregistrements, valeurs
+    imbriquées comprises (modifiables sans affecter le cache).
+    """
+    if STORAGE_BACKEND == "sqlite":
+        _ensure_sqlite()
+        data = _cache.get("activities", _activities_paths(), _load_summaries_sqlite)
+    else:
+        data = _cache.get("activities", _activities_paths(), _load_summaries_json)
+    activities = ActivityList(_copy_record(a) for a in data)
+    activities.wal_position = getattr(data, "wal_position", None)
+    return activities
+
+
+def _activities_paths() -> tuple:
+    if STORAGE_BACKEND == "sqlite":
+        return (SQLITE_FILE, Path(str(SQLITE_FILE) + "-wal"))
+    return (ACTIVITIES_FILE, ACTIVITIES_WAL_FILE)
+
+
+def activities_signature() -> tuple:
+    """Signature (mtime, taille, inode) des fichiers de l'index : change à chaque écriture."""
+    return tuple(_file_signature(p) for p in _activities_paths())
+
+
+def _load_summaries_json() -> List[Dict[str, Any]]:
+    if not ACTIVITIES_FILE.exists() and not ACTIVITIES_WAL_FILE.exists():
         _dbg(f"{ACTIVITIES_FILE} inexistant, retourne []")
-        return []
+        return ActivityList()
 
     try:
-        with open(ACTIVITIES_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        if not isinstance(data, list):
-            raise ValueError(f"{ACTIVITIES_FILE} n'est pas une liste JSON")
-        _dbg(f"activities loaded from local: {len(data)}")
+        with _file_lock(ACTIVITIES_LOCK_FILE):
+            snapshot_signature = _file_signature(ACTIVITIES_FILE)
+            data = _read_snapshot_json()
+            ops, wal_size = _read_wal()
+        if ops:
+            data = _apply_wal(data, ops)
+        data = ActivityList(data)
+        data.wal_position = (snapshot_signature, wal_size)
+        _dbg(f"activity summaries loaded from local: {len(data)} ({len(ops)} patchs journal)")
         return data
     except Exception as e:
         raise RuntimeError(f"Erreur lecture {ACTIVITIES_FILE}: {e}") from e
 
 
-def save_activities_local(activities: List[Dict[str, Any]]) -> None:
-    """Sauvegarde activities.json sur le disque local."""
+def _read_snapshot_json() -> List[Dict[str, Any]]:
+    if not ACTIVITIES_FILE.exists():
+        return []
+    data = serializers.load_file(ACTIVITIES_FILE)
+    if not isinstance(data, list):
+        raise ValueError(f"{ACTIVITIES_FILE} n'est pas une liste JSON")
+    return data
+
+
+_sqlite_ready = False
+
+
+def _ensure_sqlite() -> None:
+    """Import initial de activities.json dans la base SQLite si elle est vide (une fois par process)."""
+    global _sqlite_ready
+    if _sqlite_ready:
+        return
+    try:
+        if _sqlite.count(SQLITE_FILE) == 0 and ACTIVITIES_FILE.exists():
+            data = _load_summaries_json()
+            save_activities_local(data)  # points inline éventuels -> streams/
+            _dbg(f"sqlite: {len(data)} activités importées depuis {ACTIVITIES_FILE}")
+        _sqlite_ready = True
+    except RuntimeError:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"Erreur initialisation {SQLITE_FILE}: {e}") from e
+
+
+def _load_summaries_sqlite() -> List[Dict[str, Any]]:
     try:
-        with open(ACTIVITIES_FILE, "w", encoding="utf-8") as f:
-            json.dump(activities, f, ensure_ascii=False, indent=2)
-        _dbg(f"activities saved to local: {len(activities)}")
+        data = _sqlite.load_summaries(SQLITE_FILE)
+        _dbg(f"activity summaries loaded from sqlite: {len(data)}")
+        return data
     except Exception as e:
-        raise RuntimeError(f"Erreur écriture {ACTIVITIES_FILE}: {e}") from e
+        raise RuntimeError(f"Erreur lecture {SQLITE_FILE}: {e}") from e
 
 
-def backup_activities_to_drive(activities: List[Dict[str, Any]], force: bool = False) -> bool:
+def load_activity_points(activity: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
-    Backup optionnel vers Drive (1x par jour max sauf si force=True).
-    Retourne True si backup effectué, False sinon.
+    Retourne les points d'une activité, en les chargeant depuis streams/ si besoin.
+    Les points sont rattachés au dict (un seul chargement par requête).
     """
-    if not DRIVE_AVAILABLE:
-        _dbg("Drive backup non disponible (module manquant)")
-        return False
+    return _hydrate_points(activity).get("points") or []
+
+
+def hydrate_points(activities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Charge les points d'un sous-ensemble d'activités (en place)."""
+    for act in activities:
+        _hydrate_points(act)
+    return activities
+
+
+def load_activities_local() -> List[Dict[str, Any]]:
+    """Charge activities.json depuis le disque local (points relus depuis streams/)."""
+    return hydrate_points(load_activity_summaries())
+
+
+def save_activities_local(activities: List[Dict[str, Any]]) -> None:
+    """
+    Sauvegarde activities.json sur le disque local.
+    Les points sont déportés dans le store colonnaire (seuls les streams modifiés
+    sont réécrits) ; la liste passée en argument n'est pas modifiée.
+
+    Liste issue de load_activities_local / load_activity_summaries : les patchs
+    ajoutés au journal depuis son chargement (autre process) sont repliés dans
+    le snapshot, pas perdus ; RuntimeError si le snapshot a été réécrit entre-temps
+    (compaction, autre sauvegarde complète) : recharger puis recommencer.
+    Autre liste : elle remplace tout l'index, journal compris.
+    """
+    target = SQLITE_FILE if STORAGE_BACKEND == "sqlite" else ACTIVITIES_FILE
+    try:
+        records = []
+        streams_written = 0
+        for act in activities:
+            points = act.get("points")
+            if act.get("activity_id") is not None and points:
+                if save_points(act["activity_id"], points):
+                    streams_written += 1
+            records.append(_strip_points(act))
+
+        if STORAGE_BACKEND == "sqlite":
+            _sqlite.save_summaries(SQLITE_FILE, records)
+        else:
+            # Snapshot complet : le journal, replié dedans, devient obsolète
+            position = getattr(activities, "wal_position", None)
+            with _file_lock(ACTIVITIES_LOCK_FILE):
+                if position is not None:
+                    snapshot_signature, wal_offset = position
+                    if _file_signature(ACTIVITIES_FILE) != snapshot_signature:
+                        raise RuntimeError("index réécrit depuis le chargement (compaction ou autre "
+                                           "sauvegarde) : recharger les activités puis recommencer")
+                    later_ops, _ = _read_wal(wal_offset)
+                    if later_ops:
+                        records = _apply_wal([dict(r) for r in records], later_ops)
+                        _dbg(f"{len(later_ops)} patchs journal postérieurs au chargement repliés")
+                _write_atomic(ACTIVITIES_FILE, records, "activities")
+                _truncate_wal()
+        _cache.invalidate("activities")
+        _dbg(f"activities saved to {STORAGE_BACKEND}: {len(activities)} ({streams_written} streams réécrits)")
+    except Exception as e:
+        raise RuntimeError(f"Erreur écriture {target}: {e}") from e
+
+
+def _strip_points(act: Dict[str, Any]) -> Dict[str, Any]:
+    """Résumé d'une activité : sans les points (déjà déportés dans streams/)."""
+    points = act.get("points")
+    if act.get("activity_id") is None or not points:
+        return act
+    record = {k: v for k, v in act.items() if k != "points"}
+    record["points_count"] = len(points)
+    return record
+
 
-    # Vérifier la date du dernier backup
-    if not force and LAST_BACKUP_FILE.exists():
+# ========== JOURNAL DES MODIFICATIONS (append-only) ==========
+#
+# Une ligne JSON par opération, appliquée à la lecture par-dessus le snapshot :
+#   {"op": "set", "activity_id": ..., "fields": {...}}   fusion de champs
+#   {"op": "put", "activity_id": ..., "activity": {...}} remplacement / ajout
+#   {"op": "delete", "activity_id": ...}                 suppression
+# Le coût d'écriture dépend de la taille du changement, pas de l'historique.
+# compact_activities_wal() replie le journal dans un snapshot compact.
+
+def _read_wal(offset: int = 0) -> tuple:
+    """(opérations du journal à partir de l'octet `offset`, taille lue en octets)."""
+    if not ACTIVITIES_WAL_FILE.exists():
+        return [], 0
+    ops = []
+    with open(ACTIVITIES_WAL_FILE, "rb") as f:
+        f.seek(offset)
+        raw = f.read()
+    for line in raw.decode("utf-8", errors="replace").splitlines():
+        line = line.strip()
+        if not line:
+            continue
         try:
-            with open(LAST_BACKUP_FILE, "r") as f:
-                last_backup_str = f.read().strip()
-            last_backup = datetime.fromisoformat(last_backup_str)
-            hours_since = (datetime.now() - last_backup).total_seconds() / 3600
-            if hours_since < 24:
-                _dbg(f"Drive backup skipped (dernier: il y a {hours_since:.1f}h)")
-                return False
-        except Exception:
+            ops.append(json.loads(line))
+        except ValueError:
+            # Dernière ligne incomplète (crash pendant l'écriture) : ignorée
+            _dbg(f"ligne journal illisible ignorée: {line[:80]}")
+    return ops, offset + len(raw)
+
+
+def _apply_wal(data: List[Dict[str, Any]], ops: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    index = {str(a.get("activity_id")): i for i, a in enumerate(data) if a.get("activity_id") is not None}
+    for op in ops:
+        key = str(op.get("activity_id"))
+        pos = index.get(key)
+        if op.get("op") == "set":
+            if pos is not None:
+                data[pos].update(op.get("fields") or {})
+        elif op.get("op") == "put":
+            if pos is None:
+                index[key] = len(data)
+                data.append(op["activity"])
+            else:
+                data[pos] = op["activity"]
+        elif op.get("op") == "delete" and pos is not None:
+            data[pos] = None
+            del index[key]
+    return [a for a in data if a is not None]
+
+
+def _truncate_wal() -> None:
+    if ACTIVITIES_WAL_FILE.exists():
+        with open(ACTIVITIES_WAL_FILE, "w", encoding="utf-8"):
             pass
 
-    # Effectuer le backup
+
+def _append_wal(ops: List[Dict[str, Any]]) -> None:
+    lines = "".join(json.dumps(op, ensure_ascii=False, separators=(",", ":")) + "\n" for op in ops)
+    with _file_lock(ACTIVITIES_LOCK_FILE):
+        with open(ACTIVITIES_WAL_FILE, "a+b") as f:
+            end = f.seek(0, os.SEEK_END)
+            if end:
+                # Dernière ligne tronquée (crash) : ne pas y coller la suivante
+                f.seek(end - 1)
+                if f.read(1) != b"\n":
+                    lines = "\n" + lines
+            f.write(lines.encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        size = ACTIVITIES_WAL_FILE.stat().st_size
+    if size > WAL_COMPACT_BYTES:
+        compact_activities_wal_in_background()
+
+
+def patch_activity_local(activity_id: Any, fields: Dict[str, Any]) -> None:
+    """
+    Met à jour quelques champs d'une activité sans réécrire l'historique.
+    Si 'points' fait partie des champs, le stream correspondant est réécrit.
+    """
+    patch_activities_local({activity_id: fields})
+
+
+def patch_activities_local(patches: Dict[Any, Dict[str, Any]]) -> None:
+    """Version groupée de patch_activity_local : {activity_id: champs} en une écriture."""
+    if not patches:
+        return
     try:
-        _save_to_drive(activities)
-        # Marquer la date du backup
-        with open(LAST_BACKUP_FILE, "w") as f:
-            f.write(datetime.now().isoformat())
-        _dbg(f"Drive backup effectué: {len(activities)} activités")
-        return True
+        ops = []
+        for activity_id, fields in patches.items():
+            fields = dict(fields)
+            points = fields.pop("points", None)
+            if points:
+                save_points(activity_id, points)
+                fields["points_count"] = len(points)
+            ops.append({"op": "set", "activity_id": activity_id, "fields": fields})
+        if STORAGE_BACKEND == "sqlite":
+            _ensure_sqlite()
+            _sqlite.patch_many(SQLITE_FILE, [(op["activity_id"], op["fields"]) for op in ops])
+        else:
+            _append_wal(ops)
+        _cache.invalidate("activities")
+        _dbg(f"{len(ops)} activities patched")
+    except Exception as e:
+        raise RuntimeError(f"Erreur mise à jour activités {list(patches)[:5]}: {e}") from e
+
+
+def upsert_activities_local(activities: List[Dict[str, Any]]) -> None:
+    """
+    Ajoute ou remplace quelques activités (identifiées par activity_id) en une
+    seule écriture, sans réécrire l'historique. Les streams modifiés sont réécrits.
+    """
+    if not activities:
+        return
+    try:
+        records = []
+        for act in activities:
+            if act.get("activity_id") is None:
+                raise ValueError("activity_id manquant")
+            if act.get("points"):
+                save_points(act["activity_id"], act["points"])
+            records.append(_strip_points(act))
+        if STORAGE_BACKEND == "sqlite":
+            _ensure_sqlite()
+            _sqlite.upsert(SQLITE_FILE, records)
+        else:
+            _append_wal([{"op": "put", "activity_id": r["activity_id"], "activity": r} for r in records])
+        _cache.invalidate("activities")
+        _dbg(f"{len(records)} activities upserted")
     except Exception as e:
-        _dbg(f"Drive backup échoué: {e}")
+        raise RuntimeError(f"Erreur mise à jour activités: {e}") from e
+
+
+def delete_activities_local(activity_ids: Iterable[Any]) -> None:
+    """Supprime quelques activités de l'index (et leurs streams) sans réécrire l'historique."""
+    activity_ids = list(activity_ids)
+    if not activity_ids:
+        return
+    try:
+        if STORAGE_BACKEND == "sqlite":
+            _ensure_sqlite()
+            _sqlite.delete_many(SQLITE_FILE, activity_ids)
+        else:
+            _append_wal([{"op": "delete", "activity_id": i} for i in activity_ids])
+        for activity_id in activity_ids:
+            delete_points(activity_id)
+        _cache.invalidate("activities")
+        _dbg(f"{len(activity_ids)} activities deleted")
+    except Exception as e:
+        raise RuntimeError(f"Erreur suppression activités {activity_ids[:5]}: {e}") from e
+
+
+def compact_activities_wal() -> int:
+    """
+    Replie le journal dans un nouveau snapshot compact puis vide le journal.
+    Retourne le nombre d'opérations repliées.
+    """
+    if STORAGE_BACKEND == "sqlite":
+        return 0
+    try:
+        with _file_lock(ACTIVITIES_LOCK_FILE):
+            ops, _ = _read_wal()
+            if not ops:
+                return 0
+            data = _apply_wal(_read_snapshot_json(), ops)
+            _write_atomic(ACTIVITIES_FILE, data, "activities")
+            _truncate_wal()
+        _cache.invalidate("activities")
+        _dbg(f"journal compacté: {len(ops)} opérations")
+        return len(ops)
+    except Exception as e:
+        raise RuntimeError(f"Erreur compaction {ACTIVITIES_WAL_FILE}: {e}") from e
+
+
+_compaction_running = threading.Lock()
+
+
+def compact_activities_wal_in_background() -> bool:
+    """Lance la compaction dans un thread (une seule à la fois). Retourne False si déjà en cours."""
+    if not _compaction_running.acquire(blocking=False):
         return False
 
+    def _run():
+        try:
+            compact_activities_wal()
+        except Exception as e:
+            _dbg(f"compaction échouée: {e}")
+        finally:
+            _compaction_running.release()
+
+    threading.Thread(target=_run, name="activities-wal-compaction", daemon=True).start()
+    return True
+
+
+# ========== REQUÊTES (index) ==========
+#
+# Avec le backend SQLite ces recherches passent par les index (activity_id,
+# start_ts) ; avec le JSON, simple parcours de l'index.
+
+def find_activity_by_id(activity_id: Any) -> Optional[Dict[str, Any]]:
+    """Résumé de l'activité d'id donné, ou None."""
+    if STORAGE_BACKEND == "sqlite":
+        _ensure_sqlite()
+        return _sqlite.get_by_id(SQLITE_FILE, activity_id)
+    return next((a for a in load_activity_summaries()
+                 if str(a.get("activity_id")) == str(activity_id)), None)
+
+
+def find_activity_by_date(activity_date: str) -> Optional[Dict[str, Any]]:
+    """Résumé de l'activité dont le champ 'date' vaut exactement activity_date, ou None."""
+    if STORAGE_BACKEND == "sqlite":
+        _ensure_sqlite()
+        return _sqlite.get_by_date(SQLITE_FILE, activity_date)
+    return next((a for a in load_activity_summaries() if a.get("date") == activity_date), None)
+
+
+def backup_activities_to_drive(activities: Optional[List[Dict[str, Any]]] = None, force: bool = False) -> bool:
+    """
+    Sauvegarde incrémentale en tâche de fond (voir drive_backup.py) : seuls les
+    morceaux nouveaux ou modifiés sont envoyés. `activities` et `force` sont
+    conservés pour compatibilité (l'état sur disque fait foi).
+    Retourne True si une sauvegarde a été lancée, False si aucune cible n'est configurée.
+    """
+    import drive_backup  # import tardif : drive_backup dépend de ce module
+    return drive_backup.backup_in_background()
+
 
 # ========== PROFILE ==========
 
 def load_profile_local() -> Dict[str, Any]:
-    """Charge profile.json depuis le disque local."""
+    """Charge profile.json depuis le disque local (via le cache mémoire, copie modifiable)."""
+    return _clone(_cache.get("profile", (PROFILE_FILE,), _read_profile))
+
+
+def _read_profile() -> Dict[str, Any]:
     if not PROFILE_FILE.exists():
         _dbg(f"{PROFILE_FILE} inexistant, retourne {{}}")
         return {"birth_date": "", "weight": 0, "events": []}
 
     try:
-        with open(PROFILE_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = serializers.load_file(PROFILE_FILE)
         if not isinstance(data, dict):
             raise ValueError(f"{PROFILE_FILE} n'est pas un objet JSON")
         _dbg(f"profile loaded from local")
@@ -121,8 +715,8 @@ def load_profile_local() -> Dict[str, Any]:
 def save_profile_local(profile: Dict[str, Any]) -> None:
     """Sauvegarde profile.json sur le disque local."""
     try:
-        with open(PROFILE_FILE, "w", encoding="utf-8") as f:
-            json.dump(profile, f, ensure_ascii=False, indent=2)
+        _write_atomic(PROFILE_FILE, profile, "profile")
+        _cache.invalidate("profile")
         _dbg(f"profile saved to local")
     except Exception as e:
         raise RuntimeError(f"Erreur écriture {PROFILE_FILE}: {e}") from e
@@ -131,15 +725,19 @@ def save_profile_local(profile: Dict[str, Any]) -> None:
 # ========== OUTPUTS (analysis, predictions, weekly_plan, etc.) ==========
 
 def read_output_json_local(filename: str) -> Optional[Any]:
-    """Lit un JSON de sortie depuis outputs/."""
+    """Lit un JSON de sortie depuis outputs/ (via le cache mémoire, copie modifiable)."""
+    filepath = OUTPUTS_DIR / filename
+    return _clone(_cache.get(f"output:{filename}", (filepath,), lambda: _read_output(filename)))
+
+
+def _read_output(filename: str) -> Optional[Any]:
     filepath = OUTPUTS_DIR / filename
     if not filepath.exists():
         _dbg(f"{filepath} inexistant, retourne None")
         return None
 
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = serializers.load_file(filepath)
         _dbg(f"{filename} read ok")
         return data
     except Exception as e:
@@ -150,13 +748,149 @@ def write_output_json_local(filename: str, data: Any) -> None:
     """Écrit un JSON de sortie dans outputs/."""
     filepath = OUTPUTS_DIR / filename
     try:
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        _write_atomic(filepath, data, "outputs")
+        _cache.invalidate(f"output:{filename}")
         _dbg(f"{filename} write ok")
     except Exception as e:
         raise RuntimeError(f"Erreur écriture {filepath}: {e}") from e
 
 
+# ========== STORE CLÉ-VALEUR (outputs/kv/) ==========
+#
+# Une entrée = un fichier JSON : outputs/kv/<espace>/<clé encodée>.json.
+# Écriture d'une clé = remplacement atomique de son seul fichier, sous verrou
+# de l'espace de noms ; lecture groupée de quelques clés sans charger le reste.
+# Les anciens fichiers dict (ai_comments.json...) sont importés au premier accès
+# puis laissés en place, en lecture seule.
+
+KV_DIR = OUTPUTS_DIR / "kv"
+
+# espace de noms -> (ancien fichier outputs/, conversion en {clé: valeur})
+_KV_LEGACY = {
+    "ai_comments": ("ai_comments.json", lambda d: d if isinstance(d, dict) else {}),
+    "zones_fc_comments": ("zones_fc_comments.json", lambda d: d if isinstance(d, dict) else {}),
+    "run_feedbacks": ("run_feedbacks.json", lambda d: d if isinstance(d, dict) else {}),
+    "weekly_scores": ("weekly_scores.json",
+                      lambda d: {s["week_start"]: s for s in (d or {}).get("scores", []) if s.get("week_start")}),
+}
+
+
+def _kv_dir(namespace: str) -> Path:
+    directory = KV_DIR / namespace
+    if not directory.exists():
+        _kv_migrate(namespace, directory)
+    return directory
+
+
+def _kv_path(directory: Path, key: Any) -> Path:
+    return directory / (quote(str(key), safe="-_.") + ".json")
+
+
+def _kv_migrate(namespace: str, directory: Path) -> None:
+    """
+    Crée l'espace de noms en important l'ancien fichier dict s'il existe.
+    Construit à côté puis renommé : les autres process ne voient jamais un import partiel.
+    """
+    legacy = _KV_LEGACY.get(namespace)
+    tmp = KV_DIR / f".tmp-{namespace}-{os.getpid()}-{threading.get_ident()}"
+    try:
+        tmp.mkdir(parents=True, exist_ok=True)
+        count = 0
+        if legacy is not None and (OUTPUTS_DIR / legacy[0]).exists():
+            for key, value in legacy[1](_read_output(legacy[0])).items():
+                _write_atomic(_kv_path(tmp, key), value, "kv")
+                count += 1
+        try:
+            os.replace(tmp, directory)
+            if count:
+                _dbg(f"kv {namespace}: {count} entrées importées depuis {legacy[0]}")
+        except OSError:
+            if not directory.exists():
+                raise
+            # Un autre process a créé l'espace de noms entre-temps
+            for leftover in tmp.iterdir():
+                leftover.unlink()
+            tmp.rmdir()
+    except Exception as e:
+        raise RuntimeError(f"Erreur création {directory}: {e}") from e
+
+
+def _kv_read(path: Path) -> Optional[Any]:
+    def _load():
+        if not path.exists():
+            return None
+        return serializers.load_file(path)
+    try:
+        return _clone(_cache.get(f"kv:{path}", (path,), _load))
+    except Exception as e:
+        raise RuntimeError(f"Erreur lecture {path}: {e}") from e
+
+
+def kv_get(namespace: str, key: Any, default: Any = None) -> Any:
+    """Valeur d'une clé, ou default si absente."""
+    value = _kv_read(_kv_path(_kv_dir(namespace), key))
+    return default if value is None else value
+
+
+def kv_get_many(namespace: str, keys: Iterable[Any]) -> Dict[str, Any]:
+    """{clé: valeur} pour les clés demandées qui existent (une lecture par clé)."""
+    directory = _kv_dir(namespace)
+    found = {}
+    for key in keys:
+        if key is None:
+            continue
+        value = _kv_read(_kv_path(directory, key))
+        if value is not None:
+            found[str(key)] = value
+    return found
+
+
+def kv_keys(namespace: str) -> List[str]:
+    return sorted(unquote(p.name[:-len(".json")]) for p in _kv_dir(namespace).glob("*.json"))
+
+
+def kv_items(namespace: str) -> Dict[str, Any]:
+    """Tout l'espace de noms (pour les traitements qui ont besoin de l'historique complet)."""
+    return kv_get_many(namespace, kv_keys(namespace))
+
+
+def kv_put(namespace: str, key: Any, value: Any) -> None:
+    """Écrit (ou remplace) une seule clé."""
+    directory = _kv_dir(namespace)
+    path = _kv_path(directory, key)
+    try:
+        with _file_lock(directory / ".lock"):
+            _write_atomic(path, value, "kv")
+        _cache.invalidate(f"kv:{path}")
+        _dbg(f"kv {namespace}[{key}] write ok")
+    except Exception as e:
+        raise RuntimeError(f"Erreur écriture {path}: {e}") from e
+
+
+def kv_update(namespace: str, key: Any, fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Fusionne des champs dans la valeur (dict) d'une clé, créée si absente. Retourne la valeur."""
+    directory = _kv_dir(namespace)
+    path = _kv_path(directory, key)
+    try:
+        with _file_lock(directory / ".lock"):
+            value = _kv_read(path) or {}
+            value.update(fields)
+            _write_atomic(path, value, "kv")
+        _cache.invalidate(f"kv:{path}")
+        return value
+    except Exception as e:
+        raise RuntimeError(f"Erreur écriture {path}: {e}") from e
+
+
+def kv_delete(namespace: str, key: Any) -> None:
+    directory = _kv_dir(namespace)
+    path = _kv_path(directory, key)
+    with _file_lock(directory / ".lock"):
+        if path.exists():
+            path.unlink()
+    _cache.invalidate(f"kv:{path}")
+
+
 # ========== HELPERS COMPATIBILITÉ ==========
 
 # Aliases pour garder la compatibilité avec l'ancien code
@@ -0,0 +1,162 @@
+# data_access_sqlite.py — Backend SQLite optionnel pour l'index des activités
+#
+# Activé par T2T_STORAGE_BACKEND=sqlite (voir data_access_local.py).
+# Chaque activité (résumé sans points) est stockée en JSON dans une ligne,
+# avec des colonnes indexées pour les recherches par id et date.
+from __future__ import annotations
+import json
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS activities (
+    pos              INTEGER PRIMARY KEY,
+    activity_id      TEXT,
+    date             TEXT,
+    start_ts         REAL,
+    session_category TEXT,
+    data             TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_activities_id ON activities(activity_id);
+CREATE INDEX IF NOT EXISTS idx_activities_start ON activities(start_ts);
+"""
+
+
+_initialized = set()
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(str(db_path), timeout=30)
+    if db_path not in _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _initialized.add(db_path)
+    return conn
+
+
+def start_ts(date_str: Optional[str]) -> Optional[float]:
+    """Timestamp epoch (s) d'une date ISO 8601 ('Z' ou offset), None si invalide."""
+    if not date_str:
+        return None
+    try:
+        return datetime.fromisoformat(date_str.replace("Z", "+00:00")).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _row(pos: int, act: Dict[str, Any]) -> tuple:
+    activity_id = act.get("activity_id")
+    category = act.get("session_category") or act.get("type_sortie")
+    return (
+        pos,
+        str(activity_id) if activity_id is not None else None,
+        act.get("date"),
+        start_ts(act.get("date")),
+        category,
+        json.dumps(act, ensure_ascii=False),
+    )
+
+
+def count(db_path: Path) -> int:
+    with closing(_connect(db_path)) as conn:
+        return conn.execute("SELECT COUNT(*) FROM activities").fetchone()[0]
+
+
+def load_summaries(db_path: Path) -> List[Dict[str, Any]]:
+    """Toutes les activités (résumés), dans l'ordre d'insertion."""
+    with closing(_connect(db_path)) as conn:
+        rows = conn.execute("SELECT data FROM activities ORDER BY pos").fetchall()
+    return [json.loads(r[0]) for r in rows]
+
+
+def save_summaries(db_path: Path, records: List[Dict[str, Any]]) -> None:
+    """Remplace le contenu de la table en une seule transaction."""
+    with closing(_connect(db_path)) as conn:
+        with conn:
+            conn.execute("DELETE FROM activities")
+            conn.executemany(
+                "INSERT INTO activities (pos, activity_id, date, start_ts, session_category, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [_row(i, act) for i, act in enumerate(records)],
+            )
+
+
+def get_by_id(db_path: Path, activity_id: Any) -> Optional[Dict[str, Any]]:
+    with closing(_connect(db_path)) as conn:
+        row = conn.execute(
+            "SELECT data FROM activities WHERE activity_id = ?", (str(activity_id),)
+        ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def get_by_date(db_path: Path, date_str: str) -> Optional[Dict[str, Any]]:
+    """Recherche par date ISO exacte (via l'index start_ts, puis égalité stricte)."""
+    ts = start_ts(date_str)
+    with closing(_connect(db_path)) as conn:
+        if ts is not None:
+            row = conn.execute(
+                "SELECT data FROM activities WHERE start_ts = ? AND date = ? ORDER BY pos LIMIT 1",
+                (ts, date_str),
+            ).fetchone()
+        else:
+            row = conn.execute(
+                "SELECT data FROM activities WHERE date = ? ORDER BY pos LIMIT 1", (date_str,)
+            ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def patch_many(db_path: Path, patches: List[tuple]) -> int:
+    """
+    Fusionne des champs dans des activités existantes : [(activity_id, champs), ...]
+    en une transaction. Retourne le nombre d'activités mises à jour.
+    """
+    updated = 0
+    with closing(_connect(db_path)) as conn:
+        with conn:
+            for activity_id, fields in patches:
+                row = conn.execute(
+                    "SELECT pos, data FROM activities WHERE activity_id = ?", (str(activity_id),)
+                ).fetchone()
+                if row is None:
+                    continue
+                act = json.loads(row[1])
+                act.update(fields)
+                conn.execute(
+                    "UPDATE activities SET activity_id = ?, date = ?, start_ts = ?, session_category = ?, data = ? "
+                    "WHERE pos = ?",
+                    _row(row[0], act)[1:] + (row[0],),
+                )
+                updated += 1
+    return updated
+
+
+def delete_many(db_path: Path, activity_ids: List[Any]) -> int:
+    """Supprime des activités (par activity_id) en une transaction. Retourne le nombre supprimé."""
+    with closing(_connect(db_path)) as conn:
+        with conn:
+            cur = conn.executemany("DELETE FROM activities WHERE activity_id = ?",
+                                   [(str(i),) for i in activity_ids])
+            return cur.rowcount
+
+
+def upsert(db_path: Path, records: List[Dict[str, Any]]) -> None:
+    """Remplace (par activity_id) ou ajoute en fin de table, en une transaction."""
+    with closing(_connect(db_path)) as conn:
+        with conn:
+            next_pos = conn.execute("SELECT COALESCE(MAX(pos), -1) + 1 FROM activities").fetchone()[0]
+            for act in records:
+                row = conn.execute(
+                    "SELECT pos FROM activities WHERE activity_id = ?", (str(act.get("activity_id")),)
+                ).fetchone()
+                if row is None:
+                    pos, next_pos = next_pos, next_pos + 1
+                else:
+                    pos = row[0]
+                conn.execute(
+                    "INSERT OR REPLACE INTO activities (pos, activity_id, date, start_ts, session_category, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    _row(pos, act),
+                )
@@ -0,0 +1,374 @@
+# drive_backup.py — Sauvegarde incrémentale (Google Drive ou répertoire local)
+#
+# L'ancien backup renvoyait tout l'historique (1x/jour max). Ici les données
+# sont découpées en morceaux adressés par leur contenu (sha256) :
+#
+#   - un morceau par résumé d'activité (JSON canonique, sans points)
+#   - un morceau par canal de streams/<activity_id>/<canal>.npy
+#   - le profil
+#
+# Chaque morceau est compressé (gzip) et envoyé une seule fois sous
+# chunks/<sha256>.gz ; un manifeste (manifests/<horodatage>.json.gz, pointé
+# par LATEST) décrit l'état complet. Une sauvegarde ne coûte donc que les
+# morceaux nouveaux ou modifiés (nouvelles sorties, activités patchées).
+#
+# Cible configurée par l'environnement (default_target) :
+#   T2T_BACKUP_DIR=<chemin>   répertoire local (disque externe, montage réseau, tests)
+#   FOLDER_ID + GOOGLE_APPLICATION_CREDENTIALS   dossier Google Drive (compte de service)
+from __future__ import annotations
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import data_access_local as dal
+import serializers
+
+try:
+    from google.oauth2 import service_account
+    from googleapiclient.discovery import build
+    from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
+    DRIVE_API_AVAILABLE = True
+except ImportError:
+    DRIVE_API_AVAILABLE = False
+
+# Morceaux déjà présents sur la cible + empreintes des fichiers déjà hachés
+BACKUP_STATE_FILE = dal.BASE_DIR / ".backup_state.json"
+BACKUP_LOCK_FILE = dal.BASE_DIR / ".backup.lock"
+
+MANIFEST_FORMAT = 1
+# Nouvelles tentatives d'une sauvegarde en tâche de fond (délais en secondes)
+RETRY_DELAYS = (5, 30, 120)
+DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive.file"]
+
+
+def _dbg(msg: str) -> None:
+    if dal.DEBUG:
+        print(f"[BACKUP] {msg}")
+
+
+# ========== CIBLES ==========
+
+class LocalDirectoryTarget:
+    """Cible dans un répertoire local (même disposition que sur Drive)."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+        self.name = f"local:{self.root.resolve()}"
+
+    def exists(self, name: str) -> bool:
+        return (self.root / name).exists()
+
+    def put(self, name: str, data: bytes) -> None:
+        path = self.root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def get(self, name: str) -> bytes:
+        with open(self.root / name, "rb") as f:
+            return f.read()
+
+
+class DriveTarget:
+    """Cible dans un dossier Google Drive (noms de fichiers = chemins relatifs)."""
+
+    def __init__(self, folder_id: str, credentials_file: str) -> None:
+        if not DRIVE_API_AVAILABLE:
+            raise RuntimeError("google-api-python-client non installé")
+        credentials = service_account.Credentials.from_service_account_file(
+            credentials_file, scopes=DRIVE_SCOPES)
+        self.folder_id = folder_id
+        self.name = f"drive:{folder_id}"
+        self._service = build("drive", "v3", credentials=credentials, cache_discovery=False)
+        self._ids: Dict[str, str] = {}
+
+    def _file_id(self, name: str) -> Optional[str]:
+        if name not in self._ids:
+            query = f"name = '{name}' and '{self.folder_id}' in parents and trashed = false"
+            files = self._service.files().list(q=query, fields="files(id)", pageSize=1).execute().get("files", [])
+            if not files:
+                return None
+            self._ids[name] = files[0]["id"]
+        return self._ids[name]
+
+    def exists(self, name: str) -> bool:
+        return self._file_id(name) is not None
+
+    def put(self, name: str, data: bytes) -> None:
+        media = MediaIoBaseUpload(io.BytesIO(data), mimetype="application/octet-stream", resumable=False)
+        file_id = self._file_id(name)
+        if file_id is not None:
+            self._service.files().update(fileId=file_id, media_body=media).execute()
+            return
+        created = self._service.files().create(
+            body={"name": name, "parents": [self.folder_id]}, media_body=media, fields="id").execute()
+        self._ids[name] = created["id"]
+
+    def get(self, name: str) -> bytes:
+        file_id = self._file_id(name)
+        if file_id is None:
+            raise FileNotFoundError(name)
+        buf = io.BytesIO()
+        downloader = MediaIoBaseDownload(buf, self._service.files().get_media(fileId=file_id))
+        done = False
+        while not done:
+            _, done = downloader.next_chunk()
+        return buf.getvalue()
+
+
+def default_target():
+    """Cible configurée par l'environnement, None si aucune."""
+    backup_dir = os.getenv("T2T_BACKUP_DIR")
+    if backup_dir:
+        return LocalDirectoryTarget(Path(os.path.expanduser(backup_dir)))
+    folder_id = os.getenv("FOLDER_ID")
+    credentials_file = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+    if folder_id and credentials_file and DRIVE_API_AVAILABLE:
+        try:
+            return DriveTarget(folder_id, os.path.expanduser(os.path.expandvars(credentials_file)))
+        except Exception as e:
+            print(f"⚠️ Cible Drive indisponible: {e}")
+    return None
+
+
+# ========== MORCEAUX ==========
+
+def _sha256(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _chunk_name(digest: str) -> str:
+    return f"chunks/{digest}.gz"
+
+
+def _canonical(data: Any) -> bytes:
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+                      default=serializers._default).encode("utf-8")
+
+
+def _load_state(target_name: str) -> Dict[str, Any]:
+    state = serializers.load_optional(BACKUP_STATE_FILE)
+    if not isinstance(state, dict) or state.get("target") != target_name:
+        # Nouvelle cible : on ne sait rien de ce qu'elle contient
+        return {"target": target_name, "chunks": [], "files": {}}
+    return state
+
+
+class _Upload:
+    """Envoie les morceaux absents de la cible (dédupliqués par contenu)."""
+
+    def __init__(self, target, known: set) -> None:
+        self.target = target
+        self.known = known
+        self.uploaded = 0
+        self.bytes_sent = 0
+
+    def add(self, raw: bytes) -> str:
+        digest = _sha256(raw)
+        if digest in self.known:
+            return digest
+        name = _chunk_name(digest)
+        if not self.target.exists(name):
+            payload = gzip.compress(raw, mtime=0)
+            self.target.put(name, payload)
+            self.uploaded += 1
+            self.bytes_sent += len(payload)
+        self.known.add(digest)
+        return digest
+
+
+def _stream_chunks(activity_id: Any, upload: _Upload, files: Dict[str, Any],
+                   seen: Dict[str, Any]) -> Dict[str, str]:
+    """Morceaux des canaux d'une activité ; les fichiers inchangés (mtime/taille/inode) ne sont pas relus."""
+    streams = {}
+    directory = dal._stream_dir(activity_id)
+    if not directory.is_dir():
+        return streams
+    for path in sorted(directory.glob("*.npy")):
+        rel = path.relative_to(dal.STREAMS_DIR).as_posix()
+        signature = list(dal._file_signature(path) or ())
+        cached = files.get(rel)
+        if cached and cached[0] == signature and cached[1] in upload.known:
+            digest = cached[1]
+        else:
+            digest = upload.add(path.read_bytes())
+        seen[rel] = [signature, digest]
+        streams[path.stem] = digest
+    return streams
+
+
+# ========== SAUVEGARDE ==========
+
+def run_backup(target=None, activities: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Sauvegarde incrémentale vers `target` (default_target() si None).
+    Retourne {"manifest", "activities", "chunks", "uploaded", "bytes"}.
+    """
+    target = target or default_target()
+    if target is None:
+        raise RuntimeError("Aucune cible de sauvegarde (T2T_BACKUP_DIR ou FOLDER_ID)")
+    try:
+        with dal._file_lock(BACKUP_LOCK_FILE):
+            if activities is None:
+                activities = dal.load_activity_summaries()
+            state = _load_state(target.name)
+            upload = _Upload(target, set(state["chunks"]))
+            seen_files: Dict[str, Any] = {}
+
+            entries = []
+            for act in activities:
+                summary = dal._strip_points(act)
+                entry = {"summary": upload.add(_canonical(summary))}
+                if act.get("activity_id") is not None:
+                    entry["activity_id"] = str(act["activity_id"])
+                    entry["streams"] = _stream_chunks(act["activity_id"], upload, state["files"], seen_files)
+                entries.append(entry)
+
+            profile = dal.load_profile_local()
+            manifest = {
+                "format": MANIFEST_FORMAT,
+                "created_at": datetime.now().isoformat(),
+                "activities": entries,
+                "profile": upload.add(_canonical(profile)) if profile else None,
+            }
+            manifest_name = f"manifests/{datetime.now().strftime('%Y%m%dT%H%M%S%f')}.json.gz"
+            target.put(manifest_name, gzip.compress(_canonical(manifest), mtime=0))
+            target.put("LATEST", manifest_name.encode("utf-8"))
+
+            state.update({
+                "chunks": sorted(upload.known),
+                "files": seen_files,
+                "last_manifest": manifest_name,
+                "last_backup": manifest["created_at"],
+            })
+            serializers.dump_file(BACKUP_STATE_FILE, state, "json")
+        stats = {
+            "manifest": manifest_name,
+            "activities": len(entries),
+            "chunks": len(upload.known),
+            "uploaded": upload.uploaded,
+            "bytes": upload.bytes_sent,
+        }
+        _dbg(f"sauvegarde {target.name}: {stats}")
+        return stats
+    except Exception as e:
+        raise RuntimeError(f"Erreur sauvegarde vers {target.name}: {e}") from e
+
+
+def run_backup_with_retry(target=None, activities: Optional[List[Dict[str, Any]]] = None,
+                          delays=RETRY_DELAYS) -> Optional[Dict[str, Any]]:
+    """run_backup avec nouvelles tentatives ; None si toutes ont échoué."""
+    for attempt in range(len(delays) + 1):
+        try:
+            return run_backup(target, activities)
+        except Exception as e:
+            if attempt == len(delays):
+                print(f"❌ Sauvegarde abandonnée après {attempt + 1} tentatives: {e}")
+                return None
+            print(f"⚠️ Sauvegarde échouée ({e}), nouvel essai dans {delays[attempt]}s")
+            time.sleep(delays[attempt])
+    return None
+
+
+_backup_running = threading.Lock()
+_backup_pending = threading.Event()
+
+
+def backup_in_background(target=None, delays=RETRY_DELAYS) -> bool:
+    """
+    Lance une sauvegarde dans un thread. Si une sauvegarde est déjà en cours,
+    elle refera une passe à la fin (les demandes sont regroupées).
+    Retourne False si aucune cible n'est configurée.
+    """
+    target = target or default_target()
+    if target is None:
+        return False
+    _backup_pending.set()
+    if not _backup_running.acquire(blocking=False):
+        return True
+
+    def _run():
+        while True:
+            try:
+                while _backup_pending.is_set():
+                    _backup_pending.clear()
+                    backup = run_backup_with_retry(target, delays=delays)
+                    if backup:
+                        print(f"☁️ Sauvegarde {target.name}: {backup['uploaded']} morceaux envoyés "
+                              f"({backup['bytes'] / 1024:.1f} Ko)")
+            finally:
+                _backup_running.release()
+            # Demande arrivée entre la dernière passe et la libération du verrou
+            if not _backup_pending.is_set() or not _backup_running.acquire(blocking=False):
+                return
+
+    threading.Thread(target=_run, name="incremental-backup", daemon=True).start()
+    return True
+
+
+def wait_for_background_backup(timeout: Optional[float] = None) -> bool:
+    """Attend la fin de la sauvegarde en tâche de fond (tests, arrêt propre)."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while _backup_running.locked() or _backup_pending.is_set():
+        if deadline is not None and time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+# ========== RESTAURATION ==========
+
+def _read_chunk(target, digest: str) -> bytes:
+    raw = gzip.decompress(target.get(_chunk_name(digest)))
+    if _sha256(raw) != digest:
+        raise RuntimeError(f"Morceau corrompu: {digest}")
+    return raw
+
+
+def load_manifest(target, name: Optional[str] = None) -> Dict[str, Any]:
+    """Manifeste `name` (le plus récent par défaut)."""
+    name = name or target.get("LATEST").decode("utf-8").strip()
+    return json.loads(gzip.decompress(target.get(name)).decode("utf-8"))
+
+
+def restore(target, dest_dir: Path, manifest_name: Optional[str] = None) -> int:
+    """
+    Reconstruit activities.json, streams/ et profile.json dans `dest_dir`
+    depuis un manifeste. Retourne le nombre d'activités restaurées.
+    """
+    manifest = load_manifest(target, manifest_name)
+    dest_dir = Path(dest_dir)
+    activities = []
+    for entry in manifest["activities"]:
+        activities.append(json.loads(_read_chunk(target, entry["summary"])))
+        for channel, digest in (entry.get("streams") or {}).items():
+            stream_dir = dest_dir / "streams" / entry["activity_id"]
+            stream_dir.mkdir(parents=True, exist_ok=True)
+            (stream_dir / f"{channel}.npy").write_bytes(_read_chunk(target, digest))
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    serializers.dump_file(dest_dir / "activities.json", activities, "json")
+    if manifest.get("profile"):
+        serializers.dump_file(dest_dir / "profile.json",
+                              json.loads(_read_chunk(target, manifest["profile"])), "json-pretty")
+    return len(activities)
+
+
+if __name__ == "__main__":
+    target = default_target()
+    if target is None:
+        print("❌ Aucune cible : définir T2T_BACKUP_DIR ou FOLDER_ID + GOOGLE_APPLICATION_CREDENTIALS")
+        raise SystemExit(1)
+    stats = run_backup(target)
+    print(f"✅ Sauvegarde {target.name}: {stats['uploaded']} morceaux envoyés "
+          f"({stats['bytes'] / 1024:.1f} Ko) sur {stats['chunks']}, manifeste {stats['manifest']}")
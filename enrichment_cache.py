@@ -0,0 +1,95 @@
+# enrichment_cache.py — Résultats dérivés mémorisés avec l'empreinte de leurs entrées
+#
+# analyze_cardiac_health et enrich_single_activity étaient relancés à chaque
+# chargement (carrousel : analyse cardiaque des 10 dernières sorties et des
+# 10 précédentes du même type, à chaque GET /), même sans aucun changement.
+# Chaque résultat est maintenant stocké avec une empreinte de ce dont il
+# dépend :
+#
+#   - hash des canaux de points utilisés (store colonnaire streams/, ou points
+#     en mémoire s'ils ne correspondent pas encore au store)
+#   - paramètres utiles (profil : hr_rest / hr_max ; FC max des fractionnés...)
+#   - version de l'algorithme (à incrémenter quand le calcul change)
+#
+# Le calcul n'est refait que si l'empreinte change : modifier le profil
+# recalcule les zones cardiaques, pas la dérive ; une sortie inchangée ne
+# coûte qu'une lecture. Résultats dans le kv (un espace de noms par calcul).
+from __future__ import annotations
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import numpy as np
+
+import data_access_local as dal
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def _dbg(msg: str) -> None:
+    if dal.DEBUG:
+        print(f"[ENRICH-CACHE] {msg}")
+
+
+def _count(key: str) -> None:
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def stats() -> Dict[str, int]:
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _columns(activity: Dict[str, Any]) -> Optional[Dict[str, np.ndarray]]:
+    """Colonnes du store si elles correspondent aux points en mémoire, sinon conversion des points."""
+    points = activity.get("points") or []
+    columns = dal.load_points(activity.get("activity_id"))
+    if columns is not None and "time" in columns and (not points or len(columns["time"]) == len(points)):
+        return columns
+    return dal.points_to_columns(points) if points else None
+
+
+def points_fingerprint(activity: Dict[str, Any], channels: Iterable[str]) -> Optional[str]:
+    """Hash des canaux `channels` des points de l'activité (None si aucun point)."""
+    columns = _columns(activity)
+    if not columns:
+        return None
+    digest = hashlib.sha1()
+    for channel in channels:
+        digest.update(channel.encode("utf-8"))
+        column = columns.get(channel)
+        if column is not None:
+            digest.update(np.ascontiguousarray(column, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def fingerprint(points_hash: Optional[str], params: Dict[str, Any], version: int) -> Optional[str]:
+    """Empreinte (points, paramètres, version) ; None si les points manquent."""
+    if points_hash is None:
+        return None
+    payload = json.dumps({"points": points_hash, "params": params, "version": version},
+                         sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def cached(namespace: str, key: Any, fp: Optional[str], compute: Callable[[], Any]) -> Any:
+    """
+    Résultat mémorisé sous (namespace, key) si son empreinte vaut `fp`, sinon
+    calculé puis stocké. Sans clé ni empreinte (activité sans id ni points) :
+    calculé à chaque appel, rien n'est stocké.
+    """
+    if key is None or fp is None:
+        return compute()
+    entry = dal.kv_get(namespace, key)
+    if entry is not None and entry.get("fingerprint") == fp:
+        _count("hits")
+        return entry.get("result")
+    _count("misses")
+    result = compute()
+    if result is not None:
+        dal.kv_put(namespace, key, {"fingerprint": fp, "result": result})
+        _dbg(f"{namespace}[{key}] recalculé")
+    return result
@@ -1,13 +1,24 @@
 # get_streams.py — ingestion uniquement (cadence brute)
-import os, sys, json, time
-from bisect import bisect_left
+#
+# L'import ne fait aucune E/S : le token Strava est géré à la demande par
+# strava_client.StravaClient et l'index des activités est passé en paramètre
+# (process_activity, ingest_batch). CLI : python get_streams.py <ACTIVITY_ID>
+import os, sys
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 import numpy as np
-from dotenv import load_dotenv
 
 # Import pour mise à jour automatique des stats
-from calculate_running_stats import calculate_stats_by_type, save_running_stats
+from calculate_running_stats import RunningStatsAggregator
+import migrations
+import raw_archive
+import shared_snapshot
+import stream_ops
+import weather_service
+import weather_jobs
+import drive_backup
+from strava_client import ETAG_NAMESPACE, default_client
 
 # WMO Weather Codes mapping
 def get_weather_emoji(code):
@@ -23,43 +34,24 @@ def get_weather_emoji(code):
 def fetch_open_meteo(lat, lng, date_str):
     """
     Récupère la météo histo/forecast pour une date donnée.
-    Retourne (temp_max, weather_code)
+    Retourne (temp_max, weather_code) — via le cache de weather_service.
     """
-    try:
-        # Format date: YYYY-MM-DD
-        day_str = date_str[:10]
-        url = "https://api.open-meteo.com/v1/forecast"
-        params = {
-            "latitude": lat,
-            "longitude": lng,
-            "start_date": day_str,
-            "end_date": day_str,
-            "daily": "weather_code,temperature_2m_max",
-            "timezone": "auto"
-        }
-        r = requests.get(url, params=params, timeout=5)
-        if r.status_code == 200:
-            d = r.json()
-            if "daily" in d:
-                wc = d["daily"]["weather_code"][0] if d["daily"].get("weather_code") else None
-                tm = d["daily"]["temperature_2m_max"][0] if d["daily"].get("temperature_2m_max") else None
-                return tm, wc
-    except Exception as e:
-        print(f"⚠️ Météo API erreur: {e}")
-    return None, None
+    return weather_service.daily_summary(lat, lng, date_str)
 
 
 # ----------------------------
-# ENV bootstrap (Strava tokens)
+# Fichier local (pas de Drive)
 # ----------------------------
-# Charge .env pour les tokens Strava si besoin
-load_dotenv()
+# Lecture/écriture via data_access_local : les points sont stockés en colonnes
+# dans streams/ et réhydratés au chargement.
+import data_access_local as dal
 
+ACTIVITIES_FILE = str(dal.ACTIVITIES_FILE)
 
-# ----------------------------
-# Fichier local (pas de Drive)
-# ----------------------------
-ACTIVITIES_FILE = "activities.json"
+# Téléchargements Strava simultanés (détail + streams de plusieurs activités)
+FETCH_WORKERS = int(os.getenv("T2T_STRAVA_WORKERS", "8"))
+# Résolution des points stockés : count:10 (défaut), time:<s> ou distance:<m>
+RESAMPLE_MODE, RESAMPLE_SIZE = stream_ops.parse_resolution(os.getenv("T2T_RESAMPLE"))
 
 def load_activities_local():
     """Charge activities.json depuis le disque local."""
@@ -68,12 +60,7 @@ def load_activities_local():
         return []
 
     try:
-        with open(ACTIVITIES_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        if not isinstance(data, list):
-            print(f"⚠️ {ACTIVITIES_FILE} n'est pas une liste, réinitialisation")
-            return []
-        return data
+        return dal.load_activities_local()
     except Exception as e:
         print(f"⚠️ Erreur lecture {ACTIVITIES_FILE}: {e}, réinitialisation")
         return []
@@ -81,85 +68,25 @@ def load_activities_local():
 def save_activities_local(activities):
     """Sauvegarde activities.json sur le disque local."""
     try:
-        with open(ACTIVITIES_FILE, "w", encoding="utf-8") as f:
-            json.dump(activities, f, ensure_ascii=False, indent=2)
+        dal.save_activities_local(activities)
         print(f"💾 {ACTIVITIES_FILE} sauvegardé: {len(activities)} activités")
     except Exception as e:
         print(f"❌ Erreur écriture {ACTIVITIES_FILE}: {e}")
 
 
-# ----------------------------
-# Strava token (refresh si besoin)
-# ----------------------------
-with open("strava_tokens.json") as f:
-    tokens = json.load(f)
-
-access_token = tokens["access_token"]
-refresh_token = tokens["refresh_token"]
-expires_at = tokens["expires_at"]
-
-time_remaining = expires_at - int(time.time())
-if time_remaining < 300:
-    print(f"🔄 Token expirant dans {time_remaining}s, on le renouvelle...")
-    resp = requests.post(
-        "https://www.strava.com/api/v3/oauth/token",
-        data={
-            "client_id": os.getenv("STRAVA_CLIENT_ID", "162245"),
-            "client_secret": os.getenv("STRAVA_CLIENT_SECRET", "0552c0e87d83493d7f6667d0570de1e8ac9e9a68"),
-            "grant_type": "refresh_token",
-            "refresh_token": refresh_token
-        },
-        timeout=30
-    )
-    resp.raise_for_status()
-    new_tokens = resp.json()
-    tokens["access_token"] = new_tokens["access_token"]
-    tokens["refresh_token"] = new_tokens["refresh_token"]
-    tokens["expires_at"] = new_tokens["expires_at"]
-    with open("strava_tokens.json", "w") as f:
-        json.dump(tokens, f, indent=2)
-    access_token = tokens["access_token"]
-    print("✅ Token Strava rafraîchi.")
-else:
-    print(f"✅ Token encore valide pour {time_remaining}s.")
-
-headers = {"Authorization": f"Bearer {access_token}"}
-
-
 # ----------------------------
 # Helpers: mapping série -> points existants
 # ----------------------------
 def _map_series_to_points_by_time(points, time_stream, series, field_name: str, tol_sec=5):
     """
     Remplit points[i][field_name] avec la valeur la plus proche temporellement (± tol_sec).
-    N'écrase PAS une valeur déjà présente.
+    N'écrase PAS une valeur déjà présente. Retourne le nombre de points remplis.
+    (Alignement vectorisé : stream_ops.fill_points, plusieurs canaux en une passe.)
     """
-    times = time_stream or []
-    vals = series or []
-    if not times or not vals or not points:
+    if not time_stream or not series or not points:
         return 0
-
-    filled = 0
-    for p in points:
-        if p.get(field_name) is not None:
-            continue
-        t = p.get("time")
-        if t is None:
-            continue
-        idx = bisect_left(times, t)
-        cand = [j for j in (idx-1, idx, idx+1) if 0 <= j < len(times)]
-        best = None; best_dt = None
-        for j in cand:
-            v = vals[j]
-            if not isinstance(v, (int, float)):
-                continue
-            dt = abs(times[j] - t)
-            if best is None or dt < best_dt:
-                best, best_dt = v, dt
-        if best is not None and (best_dt is None or best_dt <= tol_sec):
-            p[field_name] = best
-            filled += 1
-    return filled
+    report = stream_ops.fill_points(points, time_stream, {field_name: series}, tol_sec=tol_sec)
+    return report[field_name]["filled"]
 
 
 def _calculate_deriv_cardio(points):
@@ -205,42 +132,137 @@ def _calculate_deriv_cardio(points):
 
 
 # ----------------------------
-# Charger activities.json depuis le fichier local
+# Récupérer/mettre à jour une activité (cadence BRUTE)
 # ----------------------------
-activities = load_activities_local()
-print(f"✅ activities.json chargé ({len(activities)} activités).")
+# Champs modifiables après coup dans Strava : clé de l'API / de l'événement "update" -> champ stocké
+STRAVA_EDITABLE_FIELDS = {"name": "name", "title": "name", "sport_type": "sport_type",
+                          "type": "sport_type", "private": "private"}
 
 
-# ----------------------------
-# Récupérer/mettre à jour une activité (cadence BRUTE)
-# ----------------------------
-def process_activity(activity_id: int):
-    url_activity = f"https://www.strava.com/api/v3/activities/{activity_id}"
-    ra = requests.get(url_activity, headers=headers, timeout=30)
-    if ra.status_code != 200:
-        print(f"❌ Erreur {ra.status_code} sur l'activité {activity_id}")
-        return
-    activity_data = ra.json()
-    start_date = activity_data.get("start_date_local")
+def strava_metadata(data):
+    """Champs modifiables (titre, type, visibilité) d'un détail / résumé / événement update Strava."""
+    fields = {}
+    for key, value in (data or {}).items():
+        field = STRAVA_EDITABLE_FIELDS.get(key)
+        if field is None or value is None:
+            continue
+        if field == "private" and isinstance(value, str):
+            value = value.strip().lower() == "true"  # les événements envoient "true" / "false"
+        fields[field] = value
+    return fields
+
+
+def fetch_activity(activity_id: int, client=None, summary=None):
+    """
+    Détail + streams d'une activité (sans toucher l'index) ; None si indisponible.
+    `summary` (entrée de athlete/activities) tient lieu de détail : une requête de moins.
+    Les streams bruts sont archivés au passage (raw_archive : points régénérables sans réseau).
+    """
+    client = client or default_client()
+    if summary is not None:
+        activity_data = summary
+    else:
+        ra = client.activity(activity_id)
+        if ra.status_code != 200:
+            print(f"❌ Erreur {ra.status_code} sur l'activité {activity_id}")
+            return None
+        activity_data = ra.json()
 
     # Streams
-    url_streams = f"https://www.strava.com/api/v3/activities/{activity_id}/streams"
-    params = {
-        "keys": "time,distance,heartrate,cadence,velocity_smooth,altitude,temperature,moving,latlng",
-        "key_by_type": "true"
-    }
-    rs = requests.get(url_streams, params=params, headers=headers, timeout=60)
+    rs = client.streams(activity_id)
     if rs.status_code != 200:
         print(f"❌ Erreur HTTP {rs.status_code} pour streams {activity_id}")
-        return
+        return None
     streams = rs.json()
+    try:
+        raw_archive.save_raw_streams(activity_id, streams)
+    except RuntimeError as e:
+        print(f"⚠️ Archive des streams bruts impossible pour {activity_id}: {e}")
+    return activity_data, streams
+
+
+def process_activity(activity_id: int, activities, client=None):
+    """
+    Ajoute ou complète une activité dans la liste `activities` (modifiée en place) ;
+    retourne l'activité touchée (None sinon).
+    """
+    fetched = fetch_activity(activity_id, client)
+    if fetched is None:
+        return None
+    return apply_activity(activity_id, *fetched, activities)
+
+
+def is_complete(summary, activities_by_id):
+    """
+    Vrai si une activité de athlete/activities est déjà stockée avec ses points et
+    sa cadence brute (ou si Strava n'a pas de cadence pour elle) : rien à télécharger.
+    """
+    act = activities_by_id.get(str(summary.get("id")))
+    if act is None or not act.get("points"):
+        return False
+    if summary.get("average_cadence") is None:
+        return True
+    return any(p.get("cad_raw") is not None for p in act["points"])
+
+
+def latest_incomplete(client, activities, per_page=30):
+    """
+    Ids des `per_page` dernières activités Strava absentes ou incomplètes dans
+    `activities` (points chargés pour ces seules activités). [] si Strava ne répond pas.
+    """
+    try:
+        summaries = client.athlete_activities(per_page=per_page, page=1)
+    except Exception as e:
+        print("ℹ️ Impossible de parcourir les dernières activités:", e)
+        return []
+    recent = {str(s.get("id")) for s in summaries}
+    by_id = {str(a.get("activity_id")): a for a in activities}
+    dal.hydrate_points([a for key, a in by_id.items() if key in recent])
+    latest = [int(s["id"]) for s in summaries if not is_complete(s, by_id)]
+    print(f"🔎 {len(summaries) - len(latest)} activités récentes déjà complètes, {len(latest)} à récupérer")
+    return latest
+
+
+def process_activities(activity_ids, activities, client=None, max_workers=FETCH_WORKERS, summaries=None):
+    """
+    Télécharge plusieurs activités en parallèle (pool borné, session partagée), puis
+    les applique à `activities` dans l'ordre des ids. `summaries` ({id: résumé de
+    athlete/activities}) évite la requête de détail des activités concernées.
+    Retourne (activités touchées, ids en échec : réseau ou réponse inattendue).
+    """
+    activity_ids = list(dict.fromkeys(int(i) for i in activity_ids))
+    if not activity_ids:
+        return [], []
+    client = client or default_client()
+    summaries = summaries or {}
+    touched, failed = [], []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(activity_ids)))) as pool:
+        futures = [(activity_id, pool.submit(fetch_activity, activity_id, client, summaries.get(activity_id)))
+                   for activity_id in activity_ids]
+        for activity_id, future in futures:
+            try:
+                fetched = future.result()
+                act = apply_activity(activity_id, *fetched, activities) if fetched is not None else None
+            except requests.RequestException as e:
+                print(f"❌ Erreur réseau sur l'activité {activity_id}: {e}")
+                failed.append(activity_id)
+                continue
+            except Exception as e:
+                # Réponse inattendue, écriture de l'archive brute... : seule cette activité échoue
+                print(f"❌ Erreur sur l'activité {activity_id}: {type(e).__name__}: {e}")
+                failed.append(activity_id)
+                continue
+            if act is not None:
+                touched.append(act)
+    return touched, failed
+
+
+def apply_activity(activity_id: int, activity_data, streams, activities):
+    """Intègre le détail + les streams téléchargés dans `activities` ; retourne l'activité touchée."""
+    start_date = activity_data.get("start_date_local")
 
     time_data   = (streams.get("time") or {}).get("data", []) or []
     distance    = (streams.get("distance") or {}).get("data", []) or []
-    heartrate   = (streams.get("heartrate") or {}).get("data", []) or []
-    velocity    = (streams.get("velocity_smooth") or {}).get("data", []) or []
-    altitude    = (streams.get("altitude") or {}).get("data", []) or []
-    latlng      = (streams.get("latlng") or {}).get("data", []) or []
     cadence_raw = (streams.get("cadence") or {}).get("data", []) or []
     temp_data   = (streams.get("temperature") or {}).get("data", []) or []
 
@@ -255,14 +277,21 @@ def process_activity(activity_id: int):
         print(f"⚠️ Pas de données time/distance pour {activity_id}, on ignore.")
         return
 
-    # Si déjà présente: compléter uniquement 'cad_raw'
+    # Si déjà présente: compléter uniquement 'cad_raw' (et les champs modifiables dans Strava)
     act = next((a for a in activities if a.get("activity_id") == activity_id), None)
     if act is not None:
         print(f"👣 Activité {activity_id} déjà présente → MAJ cad_raw uniquement")
+        act.update(strava_metadata(activity_data))
         pts = act.get("points") or []
-        filled = _map_series_to_points_by_time(pts, time_data, cadence_raw, "cad_raw", tol_sec=5)
-        print(f"   → cad_raw remplie sur {filled} points")
+        coverage = stream_ops.fill_points(pts, time_data, {"cad_raw": cadence_raw}, tol_sec=5)["cad_raw"]
+        filled = coverage["filled"]
+        print(f"   → cad_raw remplie sur {filled} points (couverture {coverage['coverage_pct']}%)")
         act["points"] = pts
+        if filled:
+            # Nouvelle cadence brute : re-normaliser cad_spm et re-dériver les champs
+            act.pop("cadence_meta", None)
+            act.pop("schema_version", None)
+            migrations.migrate_activity(act)
         
         # En profiter pour MAJ la météo si manquante
         if act.get("weather_emoji") is None or act.get("temperature") is None:
@@ -284,43 +313,14 @@ def process_activity(activity_id: int):
                      act["temperature"] = w_temp
                  print(f"   ☀️ Météo MAJ: {act.get('weather_emoji')} {act.get('temperature')}°C")
 
-        return
+        return act
 
-    # Nouvelle activité → créer des points “fenêtres 10 échantillons”
-    points = []
-    window = 10
-    n = len(time_data)
-    for i in range(0, n, window):
-        slice_range = range(i, min(i + window, n))
-        point_time = time_data[slice_range[-1]]
-        last_dist = distance[slice_range[-1]] if slice_range[-1] < len(distance) else None
-
-        def _avg(series):
-            vals = [series[j] for j in slice_range if j < len(series) and isinstance(series[j], (int, float))]
-            return (sum(vals) / len(vals)) if vals else None
-
-        avg_hr  = _avg(heartrate)
-        avg_vel = _avg(velocity)
-        avg_alt = _avg(altitude)
-
-        lat_vals = [latlng[j][0] for j in slice_range if j < len(latlng) and latlng[j]]
-        lng_vals = [latlng[j][1] for j in slice_range if j < len(latlng) and latlng[j]]
-        avg_lat = (sum(lat_vals) / len(lat_vals)) if lat_vals else None
-        avg_lng = (sum(lng_vals) / len(lng_vals)) if lng_vals else None
-
-        cad_vals = [cadence_raw[j] for j in slice_range if j < len(cadence_raw) and isinstance(cadence_raw[j], (int, float))]
-        cad_mean_raw = (sum(cad_vals) / len(cad_vals)) if cad_vals else None
-
-        points.append({
-            "time": point_time,
-            "distance": last_dist,
-            "hr": avg_hr,
-            "vel": avg_vel,
-            "alt": avg_alt,
-            "lat": avg_lat,
-            "lng": avg_lng,
-            "cad_raw": cad_mean_raw,   # <-- BRUT uniquement, normalisé plus tard dans app.py
-        })
+    # Nouvelle activité → points rééchantillonnés (par défaut fenêtres de 10 échantillons) ;
+    # cad_raw reste BRUT, normalisé ensuite (migrations.normalize_cadence)
+    points = dal.columns_to_points(stream_ops.resample(streams, RESAMPLE_MODE, RESAMPLE_SIZE))
+    # Position moyenne de la dernière fenêtre (météo)
+    avg_lat = points[-1]["lat"] if points else None
+    avg_lng = points[-1]["lng"] if points else None
 
     # Calculer deriv_cardio
     deriv_cardio = _calculate_deriv_cardio(points)
@@ -328,7 +328,8 @@ def process_activity(activity_id: int):
     new_activity = {
         "activity_id": activity_id,
         "date": start_date,
-        "points": points
+        "points": points,
+        **strava_metadata(activity_data),
     }
 
     # Ajouter Météo
@@ -350,44 +351,165 @@ def process_activity(activity_id: int):
     else:
         print(f"🚀 Activité {activity_id} ajoutée avec {len(points)} points (pas de deriv_cardio)")
 
-    activities.append(new_activity)
+    # Champs dérivés calculés dès l'ingestion (k_moy & co : au premier chargement par app.py)
+    activities.append(migrations.migrate_activity(new_activity))
+    return activities[-1]
 
 
-# ----------------------------
-# Main
-# ----------------------------
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python get_streams.py <ACTIVITY_ID>")
-        sys.exit(1)
-
-    activity_id_arg = int(sys.argv[1])
+# Fenêtres des 15 dernières courses par catégorie (kv) : une ingestion ne
+# recalcule que la catégorie des courses touchées
+running_stats = RunningStatsAggregator(n_last=15)
 
-    # 1) Traiter l'ID demandé
-    process_activity(activity_id_arg)
 
-    # 2) Optionnel: rafraîchir les dernières activités (sans supprimer l'ancien)
+def update_running_stats(activities):
+    """Stats par catégorie pour des activités nouvelles ou modifiées (leurs catégories seulement)."""
     try:
-        url = "https://www.strava.com/api/v3/athlete/activities"
-        params = {"per_page": 30, "page": 1}
-        resp = requests.get(url, params=params, headers=headers, timeout=30)
-        latest_activities = resp.json()
-        if isinstance(latest_activities, list):
-            for act in latest_activities:
-                process_activity(int(act["id"]))
-        else:
-            print("⚠️ Réponse inattendue pour athlete/activities:", latest_activities)
+        print("📊 Mise à jour des running stats...")
+        categories = running_stats.update(activities)
+        print(f"✅ Running stats mises à jour ({', '.join(sorted(categories)) or 'aucune catégorie touchée'})")
     except Exception as e:
-        print("ℹ️ Impossible de parcourir les dernières activités:", e)
+        print(f"⚠️ Erreur lors de la mise à jour des stats: {e}")
 
-    # 3) Sauvegarder local uniquement
-    save_activities_local(activities)
 
-    # 4) Mettre à jour les running stats automatiquement
+def ingest_batch(activity_ids, client=None):
+    """
+    Ingère un lot d'activités (file d'ingestion du webhook) en une seule écriture,
+    plus les dernières activités incomplètes (comme en ligne de commande).
+    L'index est relu (un autre process a pu écrire) sans les points : seuls ceux
+    des activités concernées sont chargés, seules les activités touchées sont
+    réécrites. Retourne les ids du lot en échec (à réessayer).
+    """
+    client = client or default_client()
+    requested = [int(i) for i in activity_ids]
+    activities = dal.load_activity_summaries()
+    ids = list(dict.fromkeys(requested + latest_incomplete(client, activities)))
+    wanted = {str(i) for i in ids}
+    dal.hydrate_points([a for a in activities if str(a.get("activity_id")) in wanted])
+
+    acts, failed = process_activities(ids, activities, client)
+    touched = {str(act["activity_id"]): act for act in acts}
+
+    if touched:
+        dal.upsert_activities_local(list(touched.values()))
+        print(f"💾 {len(touched)} activité(s) écrite(s) ({len(activities)} au total)")
+        update_running_stats(list(touched.values()))
+        # Météo de sortie (dashboard) calculée en tâche de fond
+        weather_jobs.enqueue([act["activity_id"] for act in touched.values()])
+        # Sauvegarde incrémentale en tâche de fond (nouvelles tentatives sans bloquer la file)
+        drive_backup.backup_in_background()
+    return [i for i in failed if i in requested]
+
+
+def apply_updates(patches):
+    """
+    Événements "update" : {activity_id: champs Strava modifiés} appliqués par patch
+    à la seule activité concernée. Titre / type / visibilité n'entrent dans aucun
+    calcul : stats inchangées, instantané du dashboard reporté sans recalcul.
+    Retourne les ids absents de l'index (à ingérer).
+    """
+    stored = {str(a.get("activity_id")) for a in dal.load_activity_summaries()}
+    fields = {int(i): strava_metadata(u) for i, u in patches.items() if str(i) in stored}
+    fields = {i: f for i, f in fields.items() if f}
+    if fields:
+        previous_version = shared_snapshot.data_version()
+        dal.patch_activities_local(fields)
+        shared_snapshot.carry_forward(previous_version, fields)
+        print(f"✏️ {len(fields)} activité(s) modifiée(s): {list(fields)}")
+    return [int(i) for i in patches if str(i) not in stored]
+
+
+# Entrées kv rattachées à une activité, par id (feedback, ETag Strava, analyse
+# cardiaque mémorisée) ou par date (commentaires IA)
+ACTIVITY_KV_NAMESPACES = ("run_feedbacks", ETAG_NAMESPACE, "cardiac_analysis")
+ACTIVITY_DATE_KV_NAMESPACES = ("ai_comments", "zones_fc_comments")
+
+
+def purge_activity_data(activities):
+    """Supprime les entrées kv des activités supprimées (plus rien ne les lit)."""
+    for act in activities:
+        for namespace in ACTIVITY_KV_NAMESPACES:
+            dal.kv_delete(namespace, act["activity_id"])
+        if act.get("date"):
+            for namespace in ACTIVITY_DATE_KV_NAMESPACES:
+                dal.kv_delete(namespace, act["date"])
+
+
+def delete_activities(activity_ids):
+    """
+    Événements "delete" : retire les activités de l'index, leurs streams, leur
+    archive brute et leurs entrées kv, puis recalcule les stats de leurs seules
+    catégories. L'instantané du dashboard est reporté sans les activités
+    supprimées (contexte historique de leurs catégories seulement).
+    """
+    wanted = {str(i) for i in activity_ids}
+    deleted = [a for a in dal.load_activity_summaries() if str(a.get("activity_id")) in wanted]
+    for activity_id in activity_ids:
+        raw_archive.delete_raw_streams(activity_id)
+    if not deleted:
+        return
+    previous_version = shared_snapshot.data_version()
+    dal.delete_activities_local([a["activity_id"] for a in deleted])
+    shared_snapshot.carry_forward_removal(previous_version, [a["activity_id"] for a in deleted])
+    purge_activity_data(deleted)
+    print(f"🗑️ {len(deleted)} activité(s) supprimée(s): {[a['activity_id'] for a in deleted]}")
     try:
-        print("📊 Mise à jour des running stats...")
-        stats = calculate_stats_by_type(activities, n_last=15)
-        save_running_stats(stats, 'running_stats.json')
-        print("✅ Running stats mis à jour automatiquement après webhook")
+        running_stats.remove([a["activity_id"] for a in deleted])
     except Exception as e:
         print(f"⚠️ Erreur lors de la mise à jour des stats: {e}")
+
+
+def handle_events(entries, client=None):
+    """
+    Traite un lot de la file du webhook (entrées ingest_queue : activity_id, action,
+    updates) : suppressions et modifications par patch ciblé, créations par
+    ingest_batch. Retourne les ids en échec (à réessayer).
+    """
+    by_action = {"ingest": [], "patch": {}, "delete": []}
+    for entry in entries:
+        action = entry.get("action", "ingest")
+        if action == "patch":
+            by_action["patch"][entry["activity_id"]] = entry.get("updates") or {}
+        else:
+            by_action[action].append(entry["activity_id"])
+
+    delete_activities(by_action["delete"])
+    # Modification d'une activité jamais reçue (création manquée) : ingestion complète
+    missing = apply_updates(by_action["patch"]) if by_action["patch"] else []
+    ingest_ids = by_action["ingest"] + missing
+    failed = ingest_batch(ingest_ids, client) if ingest_ids else []
+    if (by_action["delete"] or by_action["patch"]) and not ingest_ids:
+        drive_backup.backup_in_background()
+    return failed
+
+
+# ----------------------------
+# Main
+# ----------------------------
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python get_streams.py <ACTIVITY_ID>")
+        sys.exit(1)
+
+    activity_id_arg = int(sys.argv[1])
+    client = default_client()
+    activities = load_activities_local()
+    print(f"✅ activities.json chargé ({len(activities)} activités).")
+
+    # 1) L'ID demandé + 2) les dernières activités incomplètes (sans supprimer l'ancien)
+    latest = latest_incomplete(client, activities)
+    touched, _ = process_activities([activity_id_arg] + latest, activities, client)
+
+    # 3) Sauvegarder local uniquement : les activités touchées (journal), pas
+    # tout l'index chargé au départ (une compaction a pu le réécrire entre-temps)
+    if touched:
+        dal.upsert_activities_local(touched)
+        print(f"💾 {len(touched)} activité(s) écrite(s) ({len(activities)} au total)")
+
+    # 4) Mettre à jour les running stats (catégories des activités touchées)
+    update_running_stats(touched)
+    weather_jobs.enqueue([act["activity_id"] for act in touched])
+
+    # 5) Sauvegarde incrémentale (seuls les morceaux nouveaux sont envoyés),
+    # attendue avant de quitter : le thread de sauvegarde ne survit pas au process
+    if drive_backup.backup_in_background():
+        drive_backup.wait_for_background_backup()
@@ -0,0 +1,24 @@
+# gunicorn.conf.py — lu automatiquement par `gunicorn app:app`
+#
+# L'application est chargée une fois dans le master (preload_app) : l'instantané
+# partagé des activités y est construit avant le fork, puis chaque worker s'y
+# attache (tableaux memory-mappés, pages partagées) au lieu de reparser et
+# réenrichir tout l'historique. Le nombre de workers suit WEB_CONCURRENCY.
+
+preload_app = True
+
+
+def when_ready(server):
+    from app import refresh_shared_snapshot
+    try:
+        snapshot = refresh_shared_snapshot()
+        if snapshot is not None:
+            server.log.info("Instantané partagé %s prêt (%d activités)", snapshot.version, len(snapshot))
+    except Exception as e:
+        # Les workers reconstruiront l'instantané à la première requête
+        server.log.warning("Instantané partagé non construit: %s", e)
+
+
+def post_fork(server, worker):
+    import shared_snapshot
+    shared_snapshot.attach()
@@ -0,0 +1,305 @@
+# http_replay.py — Enregistrement / rejeu des réponses HTTP (Strava, Open-Meteo)
+#
+# Pour mesurer ou tester l'ingestion sans appeler les vraies API :
+#
+#   record   RecordingAdapter monté sur une requests.Session : les requêtes
+#            partent normalement, chaque réponse est écrite dans une fixture
+#   replay   ReplayServer (serveur HTTP local) sert les fixtures, avec une
+#            latence et un taux d'erreurs injectés ; ReplayAdapter redirige
+#            vers lui les requêtes https:// de la session
+#
+#   http_fixtures/<hôte>/<chemin>-<hash>.json
+#       {method, url, status, headers, body}  (une fixture par méthode + URL ;
+#       paramètres de requête triés, en-têtes d'authentification jamais stockés)
+#
+# Les échanges de token OAuth ne sont pas enregistrés (secrets) : en rejeu,
+# le serveur répond par un token factice. Seuls Content-Type et ETag sont
+# conservés : pas de budget Strava rejoué, le RateLimiter n'est pas freiné.
+#
+#   python http_replay.py list
+#   python http_replay.py serve --port 8765 --latency 0.05 --error-rate 0.02
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import data_access_local as dal
+
+FIXTURES_DIR = dal.BASE_DIR / "http_fixtures"
+KEPT_HEADERS = ("Content-Type", "ETag")
+TOKEN_PATH = re.compile(r"/oauth/token$")
+POOL_SIZE = 16
+
+
+def _dbg(msg: str) -> None:
+    if dal.DEBUG:
+        print(f"[REPLAY] {msg}")
+
+
+def normalize_url(url: str) -> str:
+    """URL canonique (paramètres triés) : même fixture quel que soit l'ordre des paramètres."""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return f"https://{parts.netloc}{parts.path}" + (f"?{query}" if query else "")
+
+
+def prepared_url(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """URL telle que requests l'enverrait (pour écrire des fixtures à la main)."""
+    return requests.Request("GET", url, params=params).prepare().url
+
+
+class Fixtures:
+    """Réponses enregistrées, une par (méthode, URL canonique)."""
+
+    def __init__(self, root: Path = FIXTURES_DIR) -> None:
+        self.root = Path(root)
+
+    def path(self, method: str, url: str) -> Path:
+        url = normalize_url(url)
+        parts = urlsplit(url)
+        digest = hashlib.sha1(f"{method.upper()} {url}".encode("utf-8")).hexdigest()[:16]
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", parts.path).strip("_")[:60] or "root"
+        return self.root / parts.netloc / f"{slug}-{digest}.json"
+
+    def save(self, method: str, url: str, status: int, headers: Dict[str, str], body: bytes) -> Path:
+        path = self.path(method, url)
+        text = body.decode("utf-8", errors="replace")
+        try:
+            payload = {"json": json.loads(text)}
+        except ValueError:
+            payload = {"text": text}
+        fixture = {
+            "method": method.upper(),
+            "url": normalize_url(url),
+            "status": status,
+            "headers": {k: headers[k] for k in KEPT_HEADERS if k in headers},
+            **payload,
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(fixture, f, ensure_ascii=False)
+        tmp.replace(path)
+        return path
+
+    def save_json(self, url: str, data: Any, status: int = 200, method: str = "GET") -> Path:
+        body = json.dumps(data).encode("utf-8")
+        return self.save(method, url, status, {"Content-Type": "application/json"}, body)
+
+    def load(self, method: str, url: str) -> Optional[Dict[str, Any]]:
+        path = self.path(method, url)
+        if not path.exists():
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise RuntimeError(f"Erreur lecture fixture {path}: {e}") from e
+
+    def entries(self) -> Iterator[Dict[str, Any]]:
+        for path in sorted(self.root.glob("*/*.json")):
+            with open(path, "r", encoding="utf-8") as f:
+                yield json.load(f)
+
+
+# ========== ENREGISTREMENT ==========
+
+class RecordingAdapter(HTTPAdapter):
+    """Transport requests qui enregistre chaque réponse (hors token OAuth)."""
+
+    def __init__(self, fixtures: Fixtures, **kwargs) -> None:
+        kwargs.setdefault("pool_maxsize", POOL_SIZE)
+        super().__init__(**kwargs)
+        self.fixtures = fixtures
+        self.recorded = 0
+
+    def send(self, request, **kwargs):
+        resp = super().send(request, **kwargs)
+        if not TOKEN_PATH.search(urlsplit(request.url).path):
+            self.fixtures.save(request.method, request.url, resp.status_code, resp.headers, resp.content)
+            self.recorded += 1
+            _dbg(f"enregistré {request.method} {request.url} -> {resp.status_code}")
+        return resp
+
+
+# ========== REJEU ==========
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    server: "_Server"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, headers: Dict[str, str], body: bytes) -> None:
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data: Any) -> None:
+        self._send(status, {"Content-Type": "application/json"}, json.dumps(data).encode("utf-8"))
+
+    def _handle(self) -> None:
+        replay: ReplayServer = self.server.replay
+        host, _, rest = self.path.lstrip("/").partition("/")
+        url = f"https://{host}/{rest}"
+        replay._count("requests")
+        replay._delay()
+        if TOKEN_PATH.search(urlsplit(url).path):
+            self._send_json(200, {"access_token": "replay", "refresh_token": "replay",
+                                  "expires_at": int(time.time()) + 6 * 3600})
+            return
+        if replay._inject_error():
+            replay._count("injected_errors")
+            self._send_json(replay.error_status, {"message": "erreur injectée (rejeu)"})
+            return
+        fixture = replay.fixtures.load(self.command, url)
+        if fixture is None:
+            replay._count("missing")
+            _dbg(f"fixture absente: {self.command} {url}")
+            self._send_json(404, {"message": f"fixture absente: {self.command} {normalize_url(url)}"})
+            return
+        replay._count("served")
+        if "json" in fixture:
+            body = json.dumps(fixture["json"]).encode("utf-8")
+        else:
+            body = fixture.get("text", "").encode("utf-8")
+        if "If-None-Match" in self.headers and self.headers["If-None-Match"] == fixture["headers"].get("ETag"):
+            self._send(304, {"ETag": fixture["headers"]["ETag"]}, b"")
+            return
+        self._send(fixture["status"], fixture["headers"], body)
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    replay: "ReplayServer"
+
+
+class ReplayServer:
+    """
+    Serveur local qui sert les fixtures. `latency` + uniforme(0, `jitter`) secondes
+    par requête ; une requête sur 1/`error_rate` reçoit `error_status` (503 : réessayé
+    par StravaClient, erreur réseau pour weather_service).
+    """
+
+    def __init__(self, fixtures: Optional[Fixtures] = None, host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, seed: Optional[int] = None) -> None:
+        self.fixtures = fixtures or Fixtures()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "served": 0, "missing": 0, "injected_errors": 0}
+        self._server = _Server((host, port), _ReplayHandler)
+        self._server.replay = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def _delay(self) -> None:
+        with self._lock:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _inject_error(self) -> bool:
+        with self._lock:
+            return self.error_rate > 0 and self._random.random() < self.error_rate
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def start(self) -> "ReplayServer":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, name="http-replay", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self) -> "ReplayServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class ReplayAdapter(HTTPAdapter):
+    """Transport requests qui envoie les requêtes https:// au ReplayServer (hôte d'origine dans le chemin)."""
+
+    def __init__(self, base_url: str, **kwargs) -> None:
+        kwargs.setdefault("pool_maxsize", POOL_SIZE)
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip("/")
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request = request.copy()
+        request.url = f"{self.base_url}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+        return super().send(request, **kwargs)
+
+
+def install(session: requests.Session, adapter: HTTPAdapter) -> HTTPAdapter:
+    """Monte l'adaptateur (enregistrement ou rejeu) pour toutes les requêtes https:// de la session."""
+    session.mount("https://", adapter)
+    return adapter
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Fixtures HTTP enregistrées (Strava, Open-Meteo)")
+    ap.add_argument("command", choices=("list", "serve"))
+    ap.add_argument("--fixtures", default=str(FIXTURES_DIR), help="répertoire des fixtures")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=0.0, help="latence ajoutée par requête (s)")
+    ap.add_argument("--jitter", type=float, default=0.0, help="latence aléatoire supplémentaire max (s)")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="proportion de réponses en erreur")
+    args = ap.parse_args()
+
+    fixtures = Fixtures(Path(args.fixtures))
+    if args.command == "list":
+        count = 0
+        for entry in fixtures.entries():
+            print(f"{entry['status']} {entry['method']} {entry['url']}")
+            count += 1
+        print(f"📼 {count} fixture(s) dans {fixtures.root}")
+    else:
+        server = ReplayServer(fixtures, port=args.port, latency=args.latency, jitter=args.jitter,
+                              error_rate=args.error_rate).start()
+        print(f"📼 Rejeu sur {server.base_url} (Ctrl+C pour arrêter)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.stop()
@@ -0,0 +1,322 @@
+# ingest_queue.py — File d'ingestion durable sur disque (webhook Strava)
+#
+# Le webhook lançait un nouvel interpréteur get_streams.py par événement
+# (imports, relecture de activities.json, réécriture complète, écritures
+# concurrentes qui s'écrasaient). Il dépose maintenant l'événement dans une
+# file sur disque et répond aussitôt ; des workers du process webhook la vident.
+#
+#   ingest_queue/pending/<activity_id>.json     en attente (un fichier par activité :
+#                                               les événements répétés sont fusionnés)
+#   ingest_queue/processing/<activity_id>.json  pris par un worker (propriétaire : hôte + pid ;
+#                                               mtime = battement de cœur pendant le traitement)
+#   ingest_queue/failed/<activity_id>.json      abandonné après MAX_ATTEMPTS essais
+#
+# Chaque entrée porte une action, fusionnée au fil des événements Strava :
+#   ingest  (create)  télécharger détail + streams
+#   patch   (update)  appliquer les champs modifiés (titre, type, visibilité)
+#   delete  (delete)  supprimer l'activité (définitif : l'emporte sur le reste)
+#
+# Au démarrage d'un worker, seules les entrées de processing/ abandonnées repassent
+# en attente : process propriétaire mort, ou battement de cœur plus vieux que
+# STALE_SECONDS. Les lots en cours dans un autre process (gunicorn) sont laissés.
+# Un worker attend COALESCE_SECONDS après le premier événement pour regrouper
+# une rafale, puis traite jusqu'à MAX_BATCH activités en une seule écriture.
+from __future__ import annotations
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import data_access_local as dal
+import serializers
+
+QUEUE_DIR = dal.BASE_DIR / "ingest_queue"
+QUEUE_LOCK_FILE = dal.BASE_DIR / ".ingest_queue.lock"
+
+INGEST_WORKERS = int(os.getenv("T2T_INGEST_WORKERS", "1"))
+COALESCE_SECONDS = float(os.getenv("T2T_INGEST_COALESCE_SECONDS", "2"))
+MAX_BATCH = 20
+MAX_ATTEMPTS = 5
+# Délai avant nouvel essai : RETRY_BASE_SECONDS * 2^(essai - 1)
+RETRY_BASE_SECONDS = 30
+# Battement de cœur des entrées en cours ; au-delà de STALE_SECONDS sans battement,
+# l'entrée est considérée abandonnée (process figé, autre machine)
+HEARTBEAT_SECONDS = 30
+STALE_SECONDS = 300
+
+
+def _dbg(msg: str) -> None:
+    if dal.DEBUG:
+        print(f"[INGEST] {msg}")
+
+
+# aspect_type Strava -> action de la file
+ACTIONS = {"create": "ingest", "update": "patch", "delete": "delete"}
+
+
+def _owner() -> Dict[str, Any]:
+    return {"host": socket.gethostname(), "pid": os.getpid()}
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # process d'un autre utilisateur
+    return True
+
+
+def _merge_action(entry: Dict[str, Any], action: str, updates: Optional[Dict[str, Any]]) -> None:
+    """Fusionne une action dans une entrée : delete > ingest > patch (champs modifiés cumulés)."""
+    current = entry.get("action")
+    if "delete" in (current, action):
+        entry["action"] = "delete"
+        entry.pop("updates", None)
+        return
+    entry["action"] = "ingest" if "ingest" in (current, action) else "patch"
+    if updates:
+        entry["updates"] = {**entry.get("updates", {}), **updates}
+
+
+class IngestQueue:
+    """File durable d'ids d'activités, dédupliquée par id."""
+
+    def __init__(self, root: Path = QUEUE_DIR, lock_file: Path = QUEUE_LOCK_FILE) -> None:
+        self.root = Path(root)
+        self.lock_file = lock_file
+        self.pending = self.root / "pending"
+        self.processing = self.root / "processing"
+        self.failed = self.root / "failed"
+        for directory in (self.pending, self.processing, self.failed):
+            directory.mkdir(parents=True, exist_ok=True)
+
+    def _name(self, activity_id: Any) -> str:
+        return f"{int(activity_id)}.json"
+
+    def put(self, activity_id: Any, event: Optional[Dict[str, Any]] = None) -> bool:
+        """Ajoute (ou fusionne) un événement. Retourne True si l'activité n'était pas déjà en attente."""
+        path = self.pending / self._name(activity_id)
+        with dal._file_lock(self.lock_file):
+            entry = serializers.load_optional(path)
+            is_new = entry is None
+            if is_new:
+                entry = {"activity_id": int(activity_id), "events": 0, "attempts": 0,
+                         "not_before": 0, "queued_at": datetime.now().isoformat()}
+            entry["events"] += 1
+            entry["not_before"] = 0  # nouvel événement : traiter sans attendre le backoff
+            action = ACTIONS.get((event or {}).get("aspect_type"), "ingest")
+            _merge_action(entry, action, (event or {}).get("updates"))
+            if event:
+                entry["last_event"] = event
+            serializers.dump_file(path, entry, "json")
+        return is_new
+
+    def _abandoned(self, path: Path) -> bool:
+        """Entrée en cours dont le propriétaire a disparu (mort, ou sans battement de cœur)."""
+        try:
+            if time.time() - path.stat().st_mtime > STALE_SECONDS:
+                return True
+            owner = (serializers.load_file(path) or {}).get("owner") or {}
+        except FileNotFoundError:
+            return False  # terminée entre-temps
+        except (OSError, ValueError):
+            return True
+        if owner.get("host") != socket.gethostname() or not owner.get("pid"):
+            return False  # autre machine : seul le battement de cœur fait foi
+        # Le process appelant n'a encore rien pris : son pid sur une entrée vient
+        # d'un process précédent (pid réutilisé après redémarrage du conteneur)
+        return owner["pid"] == os.getpid() or not _pid_alive(owner["pid"])
+
+    def recover(self) -> int:
+        """
+        Remet en attente les entrées abandonnées en cours de traitement (crash).
+        À appeler avant de prendre des entrées : celles d'un autre process vivant restent.
+        """
+        recovered = 0
+        with dal._file_lock(self.lock_file):
+            for path in self.processing.glob("*.json"):
+                if not self._abandoned(path):
+                    continue
+                if not (self.pending / path.name).exists():
+                    os.replace(path, self.pending / path.name)
+                else:
+                    path.unlink()  # déjà remise en attente par un nouvel événement
+                recovered += 1
+        return recovered
+
+    def ready_count(self) -> int:
+        now = time.time()
+        return sum(1 for entry in self._pending_entries() if entry.get("not_before", 0) <= now)
+
+    def _pending_entries(self) -> List[Dict[str, Any]]:
+        entries = []
+        for path in self.pending.glob("*.json"):
+            try:
+                entries.append(serializers.load_file(path))
+            except (OSError, ValueError):
+                continue  # en cours d'écriture par un autre process
+        return entries
+
+    def claim(self, limit: int = MAX_BATCH) -> List[Dict[str, Any]]:
+        """Prend jusqu'à `limit` entrées prêtes (plus anciennes d'abord)."""
+        now = time.time()
+        claimed = []
+        with dal._file_lock(self.lock_file):
+            ready = [e for e in self._pending_entries() if e.get("not_before", 0) <= now]
+            ready.sort(key=lambda e: e.get("queued_at", ""))
+            for entry in ready[:limit]:
+                name = self._name(entry["activity_id"])
+                # Déjà pris par un autre worker : on ne traite pas deux fois la même activité
+                if (self.processing / name).exists():
+                    continue
+                serializers.dump_file(self.processing / name, dict(entry, owner=_owner()), "json")
+                (self.pending / name).unlink()
+                claimed.append(entry)
+        return claimed
+
+    def heartbeat(self, activity_ids: Iterable[Any]) -> None:
+        """Signale que des entrées prises sont toujours en cours (mtime de processing/)."""
+        for activity_id in activity_ids:
+            try:
+                os.utime(self.processing / self._name(activity_id))
+            except FileNotFoundError:
+                pass
+
+    def done(self, activity_id: Any) -> None:
+        (self.processing / self._name(activity_id)).unlink(missing_ok=True)
+
+    def retry(self, entry: Dict[str, Any]) -> bool:
+        """Replanifie une entrée en échec. Retourne False si elle est abandonnée (failed/)."""
+        name = self._name(entry["activity_id"])
+        entry = dict(entry, attempts=entry.get("attempts", 0) + 1)
+        with dal._file_lock(self.lock_file):
+            (self.processing / name).unlink(missing_ok=True)
+            if entry["attempts"] >= MAX_ATTEMPTS:
+                serializers.dump_file(self.failed / name, entry, "json")
+                return False
+            pending = serializers.load_optional(self.pending / name)
+            if pending is not None:
+                # Nouvel événement arrivé entre-temps : traité avec l'action en échec
+                _merge_action(pending, entry.get("action", "ingest"), entry.get("updates"))
+                serializers.dump_file(self.pending / name, pending, "json")
+                return True
+            entry["not_before"] = time.time() + RETRY_BASE_SECONDS * 2 ** (entry["attempts"] - 1)
+            serializers.dump_file(self.pending / name, entry, "json")
+        return True
+
+    def state(self, activity_id: Any) -> Optional[str]:
+        """'pending', 'processing', 'failed' ou None si l'activité n'est pas dans la file."""
+        name = self._name(activity_id)
+        for state, directory in (("processing", self.processing), ("pending", self.pending),
+                                 ("failed", self.failed)):
+            if (directory / name).exists():
+                return state
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": sum(1 for _ in self.pending.glob("*.json")),
+            "processing": sum(1 for _ in self.processing.glob("*.json")),
+            "failed": sum(1 for _ in self.failed.glob("*.json")),
+        }
+
+
+class IngestionWorker:
+    """
+    Workers (threads) qui vident la file par lots.
+    `handler(entries)` traite un lot d'entrées (activity_id, action, updates)
+    et retourne les ids en échec.
+    """
+
+    def __init__(self, queue: IngestQueue, handler: Callable[[List[Dict[str, Any]]], Iterable[Any]],
+                 workers: int = INGEST_WORKERS, coalesce_seconds: float = COALESCE_SECONDS,
+                 max_batch: int = MAX_BATCH, poll_seconds: float = 30.0) -> None:
+        self.queue = queue
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.coalesce_seconds = coalesce_seconds
+        self.max_batch = max_batch
+        self.poll_seconds = poll_seconds
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._busy = 0
+        self._busy_lock = threading.Lock()
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        recovered = self.queue.recover()
+        if recovered:
+            print(f"♻️ {recovered} activité(s) reprise(s) après interruption")
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"ingest-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._wakeup.set()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, activity_id: Any, event: Optional[Dict[str, Any]] = None) -> bool:
+        is_new = self.queue.put(activity_id, event)
+        self._wakeup.set()
+        return is_new
+
+    def idle(self) -> bool:
+        with self._busy_lock:
+            return self._busy == 0 and self.queue.ready_count() == 0
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wakeup.wait(self.poll_seconds)  # poll : entrées en backoff, autres process
+            if self._stop.is_set():
+                return
+            self._wakeup.clear()
+            if not self.queue.ready_count():
+                continue
+            # Laisser arriver le reste de la rafale avant d'écrire
+            self._stop.wait(self.coalesce_seconds)
+            with self._busy_lock:
+                self._busy += 1
+            try:
+                batch = self.queue.claim(self.max_batch)
+                if batch:
+                    self._process(batch)
+                    self._wakeup.set()  # il peut en rester
+            finally:
+                with self._busy_lock:
+                    self._busy -= 1
+
+    def _heartbeat(self, ids: List[Any], finished: threading.Event) -> None:
+        while not finished.wait(HEARTBEAT_SECONDS):
+            self.queue.heartbeat(ids)
+
+    def _process(self, batch: List[Dict[str, Any]]) -> None:
+        ids = [entry["activity_id"] for entry in batch]
+        print(f"📥 Traitement de {len(ids)} activité(s): {ids}")
+        finished = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(ids, finished), name="ingest-heartbeat",
+                         daemon=True).start()
+        try:
+            failed = {int(i) for i in (self.handler(batch) or [])}
+        except Exception as e:
+            print(f"❌ Lot en échec ({e}), nouvel essai plus tard")
+            failed = set(ids)
+        finally:
+            finished.set()
+        for entry in batch:
+            if entry["activity_id"] not in failed:
+                self.queue.done(entry["activity_id"])
+            elif not self.queue.retry(entry):
+                print(f"❌ Activité {entry['activity_id']} abandonnée après {MAX_ATTEMPTS} essais")
+        _dbg(f"lot traité: {len(ids) - len(failed)} ok, {len(failed)} en échec")
@@ -0,0 +1,212 @@
+# migrations.py — Champs dérivés calculés une fois, à l'ingestion ou à la migration
+#
+# Les champs scalaires d'une activité (distance, durée, allure, FC moyenne,
+# cadence, catégorie, début en epoch) sont dérivés de ses points une seule
+# fois puis stockés, avec la version de l'algorithme (`schema_version`).
+# Les lectures font confiance aux champs stockés : index() ne repasse plus
+# sur tout l'historique à chaque requête, seulement sur les activités dont
+# `schema_version` est inférieure à SCHEMA_VERSION.
+#
+# Incrémenter SCHEMA_VERSION quand une dérivation change : les activités
+# concernées seront re-migrées (et réécrites) au prochain chargement.
+from __future__ import annotations
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+import data_access_local as dal
+from data_access_sqlite import start_ts
+
+SCHEMA_VERSION = 1
+
+# Types obsolètes ou inconnus : à reclasser
+LEGACY_TYPES = ("-", "inconnue", "normal_5k", "normal_10k")
+# Seuil d'allure tempo_rapide / tempo_recup (5:20/km)
+TEMPO_PACE_THRESHOLD = 5.333
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def needs_migration(activity: Dict[str, Any]) -> bool:
+    return activity.get("schema_version", 0) < SCHEMA_VERSION
+
+
+# ========== DÉRIVATIONS ==========
+
+def classify_from_scalars(dist_km: Optional[float], duree_sec: Optional[float]) -> str:
+    """
+    Type de séance par distance + allure :
+    tempo_recup (< 7 km, > 5:20/km), tempo_rapide (< 7 km, ≤ 5:20/km),
+    endurance (7-11 km), long_run (> 11 km).
+    """
+    if not dist_km:
+        return "inconnue"
+    if duree_sec and duree_sec > 0 and dist_km > 0:
+        pace_min_per_km = (duree_sec / 60.0) / dist_km
+    else:
+        pace_min_per_km = 999  # Pas de données → considéré comme lent
+
+    if dist_km > 11:
+        return "long_run"
+    if dist_km >= 7:
+        return "endurance"
+    return "tempo_rapide" if pace_min_per_km <= TEMPO_PACE_THRESHOLD else "tempo_recup"
+
+
+def session_category_for(activity: Dict[str, Any]) -> Optional[str]:
+    """
+    Catégorie d'entraînement : session_category si déjà définie (reclassification),
+    sinon dérivée de type_sortie / is_fractionne.
+    """
+    if activity.get("session_category"):
+        return activity.get("session_category")
+    type_sortie = activity.get("type_sortie", "")
+    if activity.get("is_fractionne", False):
+        return "fractionné"
+    if type_sortie in ("long_run", "endurance", "tempo_rapide", "tempo_recup", "normal_5k", "normal_10k"):
+        return type_sortie
+    return None
+
+
+def normalize_cadence(activity: Dict[str, Any]) -> bool:
+    """
+    Convertit une cadence brute (cad_raw / cadence / cad) en 'cad_spm' (steps/min,
+    deux pieds) sur les points déjà rattachés. Heuristique one-foot : médiane < 120 => x2.
+    N'écrase pas un 'cad_spm' existant. Retourne True si l'activité a changé.
+    """
+    pts = activity.get("points") or []
+    if not pts:
+        return False
+
+    # Si déjà normalisé quelque part, on ne touche à rien
+    if any(isinstance(p.get("cad_spm"), (int, float)) for p in pts):
+        return False
+
+    # Série brute par point (ordre de priorité)
+    raw = []
+    for p in pts:
+        v = (p.get("cad_raw") if p.get("cad_raw") is not None else
+             p.get("cadence")  if p.get("cadence")  is not None else
+             p.get("cad")      if p.get("cad")      is not None else
+             None)
+        raw.append(v)
+
+    vals = [v for v in raw if isinstance(v, (int, float))]
+    if not vals:
+        # pas de cadence dispo (mémorisé pour ne plus recharger les points)
+        if "cadence_meta" not in activity:
+            activity["cadence_meta"] = {
+                "present": False, "units": "spm", "source": "none",
+                "coverage_pct": 0.0, "normalized": False, "one_foot_detected": False
+            }
+            return True
+        return False
+
+    # Détection "one-foot"
+    median_val = sorted(vals)[len(vals)//2]
+    one_foot = median_val < 120.0
+    factor = 2.0 if one_foot else 1.0
+
+    filled = 0
+    for i, p in enumerate(pts):
+        v = raw[i]
+        if isinstance(v, (int, float)):
+            p["cad_spm"] = float(v) * factor
+            filled += 1
+        else:
+            p.setdefault("cad_spm", None)
+
+    activity["cadence_meta"] = {
+        "present": True, "units": "spm", "source": "stream|raw",
+        "coverage_pct": round(100.0*filled/max(1,len(pts)), 1),
+        "normalized": bool(factor == 2.0),
+        "one_foot_detected": bool(one_foot),
+    }
+    return True
+
+
+def _last(column: Optional[np.ndarray]) -> Optional[float]:
+    if column is None or not len(column) or np.isnan(column[-1]):
+        return None
+    return float(column[-1])
+
+
+def _nanmean(column: Optional[np.ndarray], ndigits: int) -> Optional[float]:
+    if column is None or not len(column) or np.all(np.isnan(column)):
+        return None
+    return round(float(np.nanmean(column)), ndigits)
+
+
+def derive_scalar_fields(activity: Dict[str, Any], columns: Dict[str, np.ndarray]) -> None:
+    """
+    distance_km / duree_sec (si absents), pace_min_per_km (min/km), fc_moy,
+    cad_spm (moyenne, pas/min) et start_ts (epoch), depuis les colonnes des points.
+    """
+    if not activity.get("distance_km"):
+        last_dist = _last(columns.get("distance"))
+        if last_dist:
+            activity["distance_km"] = round(last_dist / 1000.0, 2)
+    if not activity.get("duree_sec"):
+        last_time = _last(columns.get("time"))
+        if last_time:
+            activity["duree_sec"] = int(last_time)
+
+    dist_km, duree_sec = activity.get("distance_km"), activity.get("duree_sec")
+    if _is_number(dist_km) and _is_number(duree_sec) and dist_km > 0 and duree_sec > 0:
+        activity["pace_min_per_km"] = round((duree_sec / 60.0) / dist_km, 3)
+
+    fc_moy = _nanmean(columns.get("hr"), 1)
+    if fc_moy is not None:
+        activity["fc_moy"] = fc_moy
+    cad_spm = _nanmean(columns.get("cad_spm"), 1)
+    if cad_spm is not None:
+        activity["cad_spm"] = cad_spm
+    activity["start_ts"] = start_ts(activity.get("date"))
+
+
+# ========== MIGRATION ==========
+
+def migrate_activity(activity: Dict[str, Any],
+                     enrich: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Dérive les champs stockés d'une activité. Retourne l'activité (éventuellement
+    remplacée par `enrich`).
+
+    `enrich(activity)` calcule k_moy, deriv_cardio... (app.enrich_single_activity) ;
+    il n'est appelé que si ces champs manquent. La version de schéma n'est
+    enregistrée que lorsque `enrich` est fourni : une activité ingérée sans
+    enrichissement (get_streams) reste à terminer au prochain chargement.
+    """
+    # 👣 Cadence : seules les activités jamais traitées ont besoin de leurs points
+    if "cadence_meta" not in activity:
+        dal.hydrate_points([activity])
+        normalize_cadence(activity)
+
+    if activity.get("points"):
+        columns = dal.points_to_columns(activity["points"])
+    elif activity.get("activity_id") is not None:
+        columns = dal.load_points(activity["activity_id"]) or {}
+    else:
+        columns = {}
+    # Classification sur la distance non arrondie (comme le faisait classify_run_type)
+    dist_km = activity.get("distance_km") or (_last(columns.get("distance")) or 0) / 1000.0
+    derive_scalar_fields(activity, columns)
+
+    old_type = activity.get("type_sortie")
+    if not old_type or old_type in LEGACY_TYPES:
+        new_type = classify_from_scalars(dist_km, activity.get("duree_sec"))
+        if old_type != new_type:
+            activity["type_sortie"] = new_type
+            print(f"🔄 Reclassification {activity.get('date')}: {old_type} → {new_type} (dist: {activity.get('distance_km')}km)")
+            # Effacer session_category uniquement si le type a changé
+            activity.pop("session_category", None)
+
+    if enrich is not None and (not _is_number(activity.get("k_moy")) or
+                               not _is_number(activity.get("deriv_cardio"))):
+        activity = enrich(activity)
+    activity["session_category"] = session_category_for(activity)
+    if enrich is not None:
+        activity["schema_version"] = SCHEMA_VERSION
+    return activity
@@ -0,0 +1,313 @@
+# raw_archive.py — Archive compressée des streams Strava bruts (1 Hz)
+#
+# process_activity ne garde que les points rééchantillonnés : changer de
+# fenêtre, ajouter un canal ou corriger un calcul obligeait à tout
+# retélécharger depuis une API limitée en débit. Les streams bruts sont
+# désormais archivés à l'ingestion et les points se régénèrent localement
+# (rebuild_points / rebuild_all : CPU seul, en parallèle).
+#
+#   raw_streams/<activity_id>.raw   MAGIC + codec (1 octet) + charge compressée
+#
+# Charge : longueur de l'en-tête (4 octets) + en-tête JSON + tableaux.
+# Chaque canal numérique est quantifié à la précision de Strava (distance et
+# altitude au décimètre, vitesse au mm/s, latlng à 1e-7°), puis encodé en
+# différences successives (int64 : des zéros et petits entiers, qui se
+# compressent très bien). Valeurs absentes : masque de bits à part. Un canal
+# que la quantification ne restitue pas exactement est stocké en float64 brut :
+# la relecture rend toujours les valeurs d'origine.
+#
+# Compression : T2T_RAW_COMPRESSION=zlib (défaut, rapide) ou lzma (plus compact, plus lent).
+from __future__ import annotations
+import argparse
+import json
+import lzma
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+import data_access_local as dal
+import migrations
+import stream_ops
+
+RAW_DIR = dal.BASE_DIR / "raw_streams"
+MAGIC = b"T2TRAW\x01"
+CODECS = {"zlib": b"z", "lzma": b"x"}
+COMPRESSION = os.getenv("T2T_RAW_COMPRESSION", "zlib").strip().lower()
+
+# Pas de quantification par stream Strava (valeur stockée = round(v * échelle))
+CHANNEL_SCALES = {
+    "time": 1,
+    "distance": 10,
+    "altitude": 10,
+    "velocity_smooth": 1000,
+    "grade_smooth": 10,
+    "heartrate": 1,
+    "cadence": 1,
+    "watts": 1,
+    "temperature": 1,
+    "moving": 1,
+}
+LATLNG_SCALE = 10_000_000
+DEFAULT_SCALE = 1000
+
+# Champs dérivés des points : recalculés après régénération (migrations / enrichissement)
+DERIVED_FIELDS = ("cadence_meta", "schema_version", "k_moy", "deriv_cardio")
+
+
+def _dbg(msg: str) -> None:
+    if dal.DEBUG:
+        print(f"[RAW] {msg}")
+
+
+def raw_path(activity_id: Any):
+    return RAW_DIR / f"{activity_id}.raw"
+
+
+def has_raw_streams(activity_id: Any) -> bool:
+    return raw_path(activity_id).exists()
+
+
+# ========== ENCODAGE ==========
+
+def _kind(values: List[Any]) -> str:
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, bool) for v in present):
+        return "bool"
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        return "int"
+    return "float"
+
+
+def _encode_column(values: np.ndarray, scale: float) -> tuple:
+    """Colonne float (NaN = absent) -> (descripteur, octets)."""
+    missing = np.isnan(values)
+    spec: Dict[str, Any] = {"length": len(values), "missing": bool(missing.any())}
+    parts = []
+    quantized = np.round(np.where(missing, 0.0, values) * scale)
+    if np.array_equal(quantized / scale, np.where(missing, 0.0, values)) and np.abs(quantized).max(initial=0) < 2 ** 53:
+        q = quantized.astype(np.int64)
+        if spec["missing"]:
+            # Trou : on répète la valeur précédente (delta nul)
+            last = np.maximum.accumulate(np.where(missing, 0, np.arange(len(q))))
+            q = q[last]
+        spec.update(encoding="delta", scale=scale)
+        parts.append(np.diff(q, prepend=0).astype("<i8").tobytes())
+    else:
+        spec["encoding"] = "f8"
+        parts.append(np.where(missing, 0.0, values).astype("<f8").tobytes())
+    if spec["missing"]:
+        parts.append(np.packbits(missing).tobytes())
+    return spec, b"".join(parts)
+
+
+def encode_streams(streams: Dict[str, Any], codec: str = COMPRESSION) -> bytes:
+    """Streams Strava (key_by_type) -> octets de l'archive."""
+    if codec not in CODECS:
+        raise ValueError(f"Compression inconnue: {codec} (attendu: {', '.join(CODECS)})")
+    header: Dict[str, Any] = {"channels": []}
+    blobs = []
+    for key, stream in sorted(streams.items()):
+        if not isinstance(stream, dict):
+            continue
+        data = stream.get("data") or []
+        meta = {k: v for k, v in stream.items() if k != "data"}
+        if key == "latlng":
+            lat, lng = stream_ops.latlng_arrays(data, len(data))
+            columns = [("lat", lat, LATLNG_SCALE), ("lng", lng, LATLNG_SCALE)]
+            kind = "latlng"
+        else:
+            kind = _kind(data)
+            columns = [(key, stream_ops.to_array(data, len(data)), CHANNEL_SCALES.get(key, DEFAULT_SCALE))]
+            if kind != "float":
+                columns = [(key, columns[0][1], 1)]
+        channel = {"key": key, "kind": kind, "meta": meta, "columns": []}
+        for name, values, scale in columns:
+            spec, blob = _encode_column(values, scale)
+            spec.update(name=name, size=len(blob))
+            channel["columns"].append(spec)
+            blobs.append(blob)
+        header["channels"].append(channel)
+
+    raw_header = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    payload = struct.pack("<I", len(raw_header)) + raw_header + b"".join(blobs)
+    compressed = zlib.compress(payload, 6) if codec == "zlib" else lzma.compress(payload, preset=6)
+    return MAGIC + CODECS[codec] + compressed
+
+
+def _decode_column(spec: Dict[str, Any], blob: bytes) -> np.ndarray:
+    n = spec["length"]
+    if spec["encoding"] == "delta":
+        values = np.cumsum(np.frombuffer(blob[:8 * n], dtype="<i8")) / spec["scale"]
+    else:
+        values = np.frombuffer(blob[:8 * n], dtype="<f8").copy()
+    if spec["missing"]:
+        mask = np.unpackbits(np.frombuffer(blob[8 * n:], dtype=np.uint8), count=n).astype(bool)
+        values[mask] = np.nan
+    return values
+
+
+def decode_streams(raw: bytes, as_arrays: bool = False) -> Dict[str, Any]:
+    """
+    Octets de l'archive -> streams au format Strava ({'time': {'data': [...]}, ...}).
+    as_arrays=True : 'data' en ndarray float64 (NaN = absent, latlng en (n, 2)),
+    sans reconversion en listes Python (chemin rapide de rebuild_points).
+    """
+    if not raw.startswith(MAGIC):
+        raise ValueError("archive de streams invalide (en-tête)")
+    codec, body = raw[len(MAGIC):len(MAGIC) + 1], raw[len(MAGIC) + 1:]
+    if codec == CODECS["zlib"]:
+        payload = zlib.decompress(body)
+    elif codec == CODECS["lzma"]:
+        payload = lzma.decompress(body)
+    else:
+        raise ValueError(f"codec d'archive inconnu: {codec!r}")
+    (header_len,) = struct.unpack_from("<I", payload)
+    header = json.loads(payload[4:4 + header_len])
+    offset = 4 + header_len
+
+    streams = {}
+    for channel in header["channels"]:
+        columns = []
+        for spec in channel["columns"]:
+            columns.append(_decode_column(spec, payload[offset:offset + spec["size"]]))
+            offset += spec["size"]
+        if as_arrays:
+            data = np.column_stack(columns) if channel["kind"] == "latlng" else columns[0]
+        elif channel["kind"] == "latlng":
+            lat, lng = columns
+            data = [[a, b] if not (np.isnan(a) or np.isnan(b)) else []
+                    for a, b in zip(lat.tolist(), lng.tolist())]
+        else:
+            values = columns[0]
+            cast = {"int": int, "bool": bool}.get(channel["kind"], float)
+            data = [None if np.isnan(v) else cast(v) for v in values.tolist()]
+        streams[channel["key"]] = dict(channel["meta"], data=data)
+    return streams
+
+
+# ========== ARCHIVE SUR DISQUE ==========
+
+def save_raw_streams(activity_id: Any, streams: Dict[str, Any], codec: str = COMPRESSION) -> int:
+    """Archive les streams bruts d'une activité (écriture atomique) ; retourne la taille en octets."""
+    target = raw_path(activity_id)
+    try:
+        raw = encode_streams(streams, codec)
+        RAW_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_suffix(".raw.tmp")
+        tmp.write_bytes(raw)
+        os.replace(tmp, target)
+    except Exception as e:
+        raise RuntimeError(f"Erreur écriture archive {target}: {e}") from e
+    _dbg(f"streams bruts archivés pour {activity_id}: {len(raw)} octets")
+    return len(raw)
+
+
+def load_raw_streams(activity_id: Any, as_arrays: bool = False) -> Optional[Dict[str, Any]]:
+    """Streams bruts archivés d'une activité (None si absents)."""
+    target = raw_path(activity_id)
+    if not target.exists():
+        return None
+    try:
+        return decode_streams(target.read_bytes(), as_arrays=as_arrays)
+    except Exception as e:
+        raise RuntimeError(f"Erreur lecture archive {target}: {e}") from e
+
+
+def delete_raw_streams(activity_id: Any) -> None:
+    raw_path(activity_id).unlink(missing_ok=True)
+
+
+def archived_ids() -> List[str]:
+    return sorted(p.stem for p in RAW_DIR.glob("*.raw")) if RAW_DIR.is_dir() else []
+
+
+# ========== RÉGÉNÉRATION DES POINTS ==========
+
+def _resolution(resolution: Any) -> tuple:
+    if isinstance(resolution, tuple):
+        return resolution
+    return stream_ops.parse_resolution(resolution or os.getenv("T2T_RESAMPLE"))
+
+
+def rebuild_columns(activity_id: Any, resolution: Any = None) -> Optional[Dict[str, np.ndarray]]:
+    """Colonnes des points régénérées depuis l'archive (None si pas d'archive)."""
+    streams = load_raw_streams(activity_id, as_arrays=True)
+    if streams is None:
+        return None
+    mode, size = _resolution(resolution)
+    return stream_ops.resample(streams, mode, size)
+
+
+def rebuild_points(activity_id: Any, resolution: Any = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    Points d'une activité régénérés localement depuis les streams bruts archivés,
+    à la résolution demandée ('count:10', 'time:5', 'distance:10' ; défaut
+    T2T_RESAMPLE). Mêmes points que l'ingestion (cad_raw brut). None si pas d'archive.
+    """
+    columns = rebuild_columns(activity_id, resolution)
+    return None if columns is None else dal.columns_to_points(columns)
+
+
+def _rebuild_worker(args: tuple) -> tuple:
+    activity_id, resolution = args
+    return activity_id, rebuild_columns(activity_id, resolution)
+
+
+def rebuild_all(activity_ids: Optional[Iterable[Any]] = None, resolution: Any = None,
+                workers: Optional[int] = None, batch_size: int = 200) -> Dict[str, Any]:
+    """
+    Régénère les points de toutes les activités archivées (ou de `activity_ids`)
+    en parallèle (un process par cœur), puis réécrit streams/ et l'index par lots.
+    Les champs dérivés (cadence, k_moy, deriv_cardio...) sont recalculés :
+    migrations tout de suite, enrichissement au prochain chargement de l'app.
+    """
+    resolution = _resolution(resolution)
+    archived = set(archived_ids())
+    wanted = [str(i) for i in activity_ids] if activity_ids is not None else sorted(archived)
+    summaries = {str(a.get("activity_id")): a for a in dal.load_activity_summaries()}
+    ids = [i for i in wanted if i in archived and i in summaries]
+    stats = {"rebuilt": 0, "missing": len(wanted) - len(ids), "seconds": 0.0}
+    if not ids:
+        return stats
+
+    started = time.perf_counter()
+    workers = max(1, min(workers or os.cpu_count() or 1, len(ids)))
+    batch = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = ((i, resolution) for i in ids)
+        for activity_id, columns in pool.map(_rebuild_worker, jobs, chunksize=8):
+            if not columns:
+                continue
+            act = summaries[activity_id]
+            for field in DERIVED_FIELDS:
+                act.pop(field, None)
+            act["points"] = dal.columns_to_points(columns)
+            batch.append(migrations.migrate_activity(act))
+            if len(batch) >= batch_size:
+                dal.upsert_activities_local(batch)
+                stats["rebuilt"] += len(batch)
+                batch = []
+    if batch:
+        dal.upsert_activities_local(batch)
+        stats["rebuilt"] += len(batch)
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Régénère les points depuis l'archive des streams bruts")
+    ap.add_argument("activity_ids", nargs="*", help="activités à régénérer (défaut : toutes les archivées)")
+    ap.add_argument("--resolution", default=None, help="count:<n>, time:<s> ou distance:<m> (défaut T2T_RESAMPLE)")
+    ap.add_argument("--workers", type=int, default=None, help="process en parallèle (défaut : nb de cœurs)")
+    args = ap.parse_args()
+
+    mode, size = _resolution(args.resolution)
+    print(f"🔁 Régénération des points ({mode}:{size:g}) depuis {RAW_DIR}")
+    result = rebuild_all(args.activity_ids or None, (mode, size), args.workers)
+    print(f"✅ {result['rebuilt']} activité(s) régénérée(s) en {result['seconds']}s"
+          f" ({result['missing']} sans archive ou hors index)")
@@ -1,45 +1,73 @@
-from get_streams import activities, save_activities_local, fetch_open_meteo, get_weather_emoji
-import time
+from datetime import datetime, timedelta
+
+import data_access_local as dal
+import weather_service
+from get_streams import load_activities_local, fetch_open_meteo, get_weather_emoji
+
+
+def _needs_weather(act):
+    # Si météo manquante ou emoji par défaut
+    return act.get("weather_emoji") is None or act.get("weather_emoji") == "❓" or act.get("temperature") is None
+
+
+def plan_weather(activities):
+    """
+    Activités à compléter -> [(activité, lat, lng, jours couverts)] ; jours
+    couverts = jour de départ et jour d'arrivée (sortie passant minuit).
+    """
+    plan = []
+    for act in activities:
+        if not _needs_weather(act):
+            continue
+        points = act.get("points", [])
+        date_str = act.get("date")
+        if not points or not date_str:
+            continue
+
+        # Trouver lat/lng
+        lat = next((p["lat"] for p in points if p.get("lat")), None)
+        lng = next((p["lng"] for p in points if p.get("lng")), None)
+        if not (lat and lng):
+            continue
+
+        days = {date_str[:10]}
+        try:
+            start = datetime.fromisoformat(date_str[:19])
+            days.add((start + timedelta(seconds=points[-1].get("time") or 0)).date().isoformat())
+        except (TypeError, ValueError):
+            pass
+        plan.append((act, lat, lng, sorted(days)))
+    return plan
+
 
 def refresh_all_weather():
+    activities = load_activities_local()
     print(f"🌦️ Vérification météo pour {len(activities)} activités...")
-    count = 0
-    
-    for act in activities:
-        # Si météo manquante ou emoji par défaut
-        if act.get("weather_emoji") is None or act.get("weather_emoji") == "❓" or act.get("temperature") is None:
-            points = act.get("points", [])
-            if not points:
-                continue
-                
-            # Trouver lat/lng
-            lat = next((p["lat"] for p in points if p.get("lat")), None)
-            lng = next((p["lng"] for p in points if p.get("lng")), None)
-            
-            if lat and lng:
-                date_str = act.get("date")
-                if not date_str:
-                    continue
-                    
-                print(f"   update {act['activity_id']} ({date_str})...", end="", flush=True)
-                
-                # Petit délai pour ne pas spammer l'API (rate limit Open-Meteo généreux mais restons polis)
-                time.sleep(0.1)
-                
-                w_temp, w_code = fetch_open_meteo(lat, lng, date_str)
-                
-                if w_code is not None:
-                    act["weather_emoji"] = get_weather_emoji(w_code)
-                    if act.get("temperature") is None and w_temp is not None:
-                        act["temperature"] = w_temp
-                    count += 1
-                    print(" ✅")
-                else:
-                    print(" ❌")
-
-    if count > 0:
-        save_activities_local(activities)
-        print(f"✅ Météo mise à jour pour {count} activités.")
+    plan = plan_weather(activities)
+    if not plan:
+        print("✅ Toutes les activités ont déjà la météo.")
+        return
+
+    # Une requête Open-Meteo par cellule de grille (toute la plage de dates),
+    # au lieu d'une par activité : le temps dépend du nombre de lieux distincts
+    report = weather_service.prefetch((lat, lng, day) for _, lat, lng, days in plan for day in days)
+    print(f"   {len(plan)} activités, {report['cells']} lieux à compléter, {report['network_calls']} requêtes")
+
+    patches = {}
+    for act, lat, lng, _ in plan:
+        w_temp, w_code = fetch_open_meteo(lat, lng, act["date"])
+        if w_code is None:
+            print(f"   update {act['activity_id']} ({act['date']})... ❌")
+            continue
+        fields = {"weather_emoji": get_weather_emoji(w_code)}
+        if act.get("temperature") is None and w_temp is not None:
+            fields["temperature"] = w_temp
+        patches[act["activity_id"]] = fields
+
+    if patches:
+        # Une seule écriture pour tout le lot
+        dal.patch_activities_local(patches)
+        print(f"✅ Météo mise à jour pour {len(patches)} activités.")
     else:
         print("✅ Toutes les activités ont déjà la météo.")
 
@@ -0,0 +1,133 @@
+# serializers.py — Formats de fichiers de données (JSON compact / indenté, MessagePack, NumPy)
+#
+# Le format d'écriture est choisi par type de fichier (FILE_FORMATS, surchargeable
+# par variable d'environnement T2T_FORMAT_<TYPE>, ex. T2T_FORMAT_ACTIVITIES=msgpack).
+# À la lecture le format est détecté par les premiers octets, quel que soit le
+# nom du fichier : on peut changer de format sans migration.
+#
+#   json         JSON compact (séparateurs sans espaces)
+#   json-pretty  JSON indenté (fichiers édités / lus à la main)
+#   msgpack      MessagePack préfixé par MSGPACK_MAGIC (paquet msgpack listé dans
+#                requirements.txt ; s'il manque, format_for() écrit en json et
+#                seule la lecture d'un fichier déjà en msgpack échoue)
+#   npy          tableaux NumPy (streams/), détectés par leur en-tête \x93NUMPY
+from __future__ import annotations
+import io
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+MSGPACK_MAGIC = b"T2TMP\x01"
+NPY_MAGIC = b"\x93NUMPY"
+
+FORMATS = ("json", "json-pretty", "msgpack")
+
+# Format d'écriture par type de fichier
+FILE_FORMATS = {
+    "activities": "json",        # index des activités (gros, lu à chaque requête froide)
+    "snapshot": "json",          # instantané partagé entre workers
+    "running_stats": "json",
+    "outputs": "json-pretty",    # plans, analyses : lus par l'utilisateur
+    "kv": "json-pretty",
+    "profile": "json-pretty",
+    "tokens": "json-pretty",
+}
+
+
+def format_for(kind: str) -> str:
+    """Format d'écriture d'un type de fichier (env T2T_FORMAT_<TYPE> prioritaire)."""
+    fmt = os.getenv(f"T2T_FORMAT_{kind.upper()}", FILE_FORMATS.get(kind, "json")).strip().lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Format inconnu pour {kind}: {fmt} (attendu: {', '.join(FORMATS)})")
+    if fmt == "msgpack" and not MSGPACK_AVAILABLE:
+        return "json"
+    return fmt
+
+
+def _default(obj: Any) -> Any:
+    """Types NumPy -> types Python (np.float64 passe déjà, pas np.int64 ni les tableaux)."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Type non sérialisable: {type(obj).__name__}")
+
+
+def dumps(data: Any, fmt: str = "json") -> bytes:
+    if fmt == "json":
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+    if fmt == "json-pretty":
+        return json.dumps(data, ensure_ascii=False, indent=2, default=_default).encode("utf-8")
+    if fmt == "msgpack":
+        if not MSGPACK_AVAILABLE:
+            raise RuntimeError("msgpack non installé (pip install msgpack)")
+        return MSGPACK_MAGIC + msgpack.packb(data, use_bin_type=True, default=_default)
+    raise ValueError(f"Format inconnu: {fmt}")
+
+
+def detect_format(raw: bytes) -> str:
+    if raw.startswith(MSGPACK_MAGIC):
+        return "msgpack"
+    if raw.startswith(NPY_MAGIC):
+        return "npy"
+    return "json"
+
+
+def loads(raw: bytes) -> Any:
+    fmt = detect_format(raw)
+    if fmt == "msgpack":
+        if not MSGPACK_AVAILABLE:
+            raise RuntimeError("fichier MessagePack mais msgpack non installé (pip install msgpack)")
+        return msgpack.unpackb(raw[len(MSGPACK_MAGIC):], raw=False, strict_map_key=False)
+    if fmt == "npy":
+        return np.load(io.BytesIO(raw), allow_pickle=False)
+    return json.loads(raw.decode("utf-8-sig"))
+
+
+def load_file(path: Path) -> Any:
+    """Lit un fichier de données, format détecté à la lecture."""
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def dump_file(path: Path, data: Any, fmt: str = "json", atomic: bool = True) -> None:
+    """
+    Écrit un fichier de données ; par défaut via fichier temporaire + fsync + os.replace.
+    Temporaire unique par écriture : deux process (ou threads) qui écrivent le
+    même fichier ne partagent jamais leur temporaire, le dernier os.replace gagne.
+    """
+    raw = dumps(data, fmt)
+    path = Path(path)
+    if not atomic:
+        with open(path, "wb") as f:
+            f.write(raw)
+        return
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(tmp, "xb") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def load_optional(path: Path) -> Optional[Any]:
+    """Comme load_file, None si le fichier n'existe pas."""
+    try:
+        return load_file(path)
+    except FileNotFoundError:
+        return None
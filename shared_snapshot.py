@@ -0,0 +1,455 @@
+# shared_snapshot.py — Instantané partagé (lecture seule) entre workers gunicorn
+#
+# index() enrichit l'historique, le trie, calcule les moyennes glissantes par
+# catégorie (add_historical_context) et les séries des graphiques. Avec
+# plusieurs workers, chacun refaisait ce travail et gardait sa propre copie.
+#
+# L'instantané est construit une fois par version des données puis relu par
+# tous les workers. Seuls les tableaux NumPy sont partagés (memory-mappés, pages
+# communes à tous les process) ; records.json est décodé une fois par version
+# dans chaque worker, qui en garde sa propre copie en mémoire : l'économie porte
+# sur le calcul (enrichissement, contexte historique), pas sur la mémoire des
+# résumés. Disposition :
+#
+#   snapshot/CURRENT                version publiée (remplacée atomiquement)
+#   snapshot/<version>/meta.json    version, nombre d'activités, catégories
+#   snapshot/<version>/records.json résumés enrichis (ordre de chargement)
+#   snapshot/<version>/series.json  séries du graphique historique k / dérive
+#   snapshot/<version>/*.npy        ordre de tri, historiques par catégorie,
+#                                   moyennes glissantes (ordre trié)
+#
+# La version dérive de la signature (mtime, taille, inode) de l'index des
+# activités : toute écriture la fait changer. Un worker détecte une nouvelle
+# publication par un simple stat de CURRENT, sans rien recharger d'autre.
+# Patchs de champs (carry_forward) et suppressions d'activités
+# (carry_forward_removal, contexte historique des catégories touchées
+# seulement) publient la nouvelle version à partir de la précédente.
+from __future__ import annotations
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import data_access_local as dal
+import migrations
+import serializers
+
+SNAPSHOT_DIR = dal.BASE_DIR / "snapshot"
+CURRENT_FILE = SNAPSHOT_DIR / "CURRENT"
+LOCK_FILE = SNAPSHOT_DIR / ".lock"
+
+# À incrémenter quand le contenu calculé change (enrichissement, séries...)
+SNAPSHOT_FORMAT = 1
+# Nombre de séances précédentes du même type gardées pour les sparklines
+HISTORY_LEN = 10
+# Taille max de l'historique du graphique k / dérive du dashboard
+MAX_SERIES = 50
+
+ROLLING_COLUMNS = ("k_moy", "deriv_cardio", "k_avg_10", "drift_avg_10",
+                   "k_p10", "k_p90", "drift_p10", "drift_p90", "k_trend", "drift_trend")
+# Intervalles 80 % : seulement posés quand il existe des séances précédentes
+PERCENTILE_FIELDS = ("k_p10", "k_p90", "drift_p10", "drift_p90")
+
+
+def _dbg(msg: str) -> None:
+    if dal.DEBUG:
+        print(f"[SNAPSHOT] {msg}")
+
+
+def data_version() -> str:
+    """Version courante des données (change à chaque écriture de l'index)."""
+    raw = repr((SNAPSHOT_FORMAT, dal.activities_signature()))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def read_current_version() -> Optional[str]:
+    try:
+        return CURRENT_FILE.read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+# ========== CONSTRUCTION ==========
+
+def add_historical_context(activities):
+    """
+    Ajoute pour chaque activité:
+    - k_avg_10: moyenne k des 10 dernières séances du même type
+    - drift_avg_10: moyenne drift des 10 dernières séances du même type
+    - k_trend: tendance (+1 si amélioration, -1 si dégradation, 0 si stable)
+    - drift_trend: tendance (-1 si amélioration, +1 si dégradation, 0 si stable)
+    """
+    # Catégorie d'entraînement (session_category stockée, sinon dérivée du type)
+    get_session_category = migrations.session_category_for
+
+    for idx, activity in enumerate(activities):
+        current_category = get_session_category(activity)
+
+        # Ajouter la catégorie pour utilisation dans le template
+        activity['session_category'] = current_category
+
+        if not current_category:
+            activity['k_avg_10'] = None
+            activity['drift_avg_10'] = None
+            activity['k_trend'] = 0
+            activity['drift_trend'] = 0
+            continue
+
+        # Récupérer les 10 dernières séances du même type AVANT celle-ci
+        previous_same_type = [
+            act for i, act in enumerate(activities[idx+1:])
+            if get_session_category(act) == current_category
+            and isinstance(act.get('k_moy'), (int, float))
+            and isinstance(act.get('deriv_cardio'), (int, float))
+        ][:10]  # Limiter aux 10 premières trouvées
+
+        if previous_same_type:
+            # Moyennes des 10 dernières
+            k_values = [act['k_moy'] for act in previous_same_type]
+            drift_values = [act['deriv_cardio'] for act in previous_same_type]
+
+            activity['k_avg_10'] = np.mean(k_values)
+            activity['drift_avg_10'] = np.mean(drift_values)
+
+            # Intervalles 80% (P10 et P90)
+            activity['k_p10'] = np.percentile(k_values, 10)
+            activity['k_p90'] = np.percentile(k_values, 90)
+            activity['drift_p10'] = np.percentile(drift_values, 10)
+            activity['drift_p90'] = np.percentile(drift_values, 90)
+
+            # Calculer tendance (comparer première moitié vs deuxième moitié)
+            if len(k_values) >= 6:
+                mid = len(k_values) // 2
+                k_recent_avg = np.mean(k_values[:mid])  # Plus récentes
+                k_older_avg = np.mean(k_values[mid:])   # Plus anciennes
+
+                drift_recent_avg = np.mean(drift_values[:mid])
+                drift_older_avg = np.mean(drift_values[mid:])
+
+                # Pour k: augmentation = amélioration (+1)
+                k_diff = k_recent_avg - k_older_avg
+                activity['k_trend'] = 1 if k_diff > 0.15 else (-1 if k_diff < -0.15 else 0)
+
+                # Pour drift: diminution = amélioration (-1)
+                drift_diff = drift_recent_avg - drift_older_avg
+                activity['drift_trend'] = -1 if drift_diff < -0.03 else (1 if drift_diff > 0.03 else 0)
+            else:
+                activity['k_trend'] = 0
+                activity['drift_trend'] = 0
+        else:
+            activity['k_avg_10'] = None
+            activity['drift_avg_10'] = None
+            activity['k_trend'] = 0
+            activity['drift_trend'] = 0
+
+    return activities
+
+
+def _history_key(act: Dict[str, Any]) -> Any:
+    return act.get("session_category") or act.get("type_sortie")
+
+
+def _history_index(activities_sorted: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    Pour chaque activité (ordre trié, plus récente d'abord), positions des
+    HISTORY_LEN activités précédentes du même type (plus récente d'abord, -1 sinon).
+    """
+    n = len(activities_sorted)
+    history = np.full((n, HISTORY_LEN), -1, dtype=np.int32)
+    recent: Dict[Any, List[int]] = {}
+    for i in range(n - 1, -1, -1):
+        act = activities_sorted[i]
+        current_type = act.get("session_category") or act.get("type_sortie", "-")
+        previous = recent.get(current_type, [])
+        history[i, :len(previous)] = previous
+        key = _history_key(act)
+        recent[key] = ([i] + recent.get(key, []))[:HISTORY_LEN]
+    return history
+
+
+def _number(value: Any) -> float:
+    return float(value) if isinstance(value, (int, float)) else np.nan
+
+
+def _history_series(activities_sorted: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Séries k / dérive du graphique historique (mêmes règles que compute_dashboard_data)."""
+    dates, ks, drifts = [], [], []
+    for act in activities_sorted:
+        k = act.get("k_moy")
+        d = act.get("deriv_cardio")
+        if not isinstance(k, (int, float)) or not isinstance(d, (int, float)):
+            continue
+        dt = act.get("date") or "-"
+        try:
+            ds = datetime.strptime(dt, "%Y-%m-%dT%H:%M:%S%z").strftime("%Y-%m-%d")
+        except Exception:
+            ds = dt[:10] if isinstance(dt, str) else "-"
+        dates.append(ds)
+        ks.append(k)
+        drifts.append(d)
+    return {
+        "history_dates": dates[-MAX_SERIES:],
+        "history_k": ks[-MAX_SERIES:],
+        "history_drift": drifts[-MAX_SERIES:],
+    }
+
+
+def _save_npy(path: Path, array: np.ndarray) -> None:
+    with open(path, "wb") as f:
+        np.save(f, array)
+
+
+def publish(activities: List[Dict[str, Any]], activities_sorted: List[Dict[str, Any]],
+            version: Optional[str] = None) -> Optional["Snapshot"]:
+    """
+    Écrit l'instantané des activités enrichies et le publie comme version courante.
+    `activities_sorted` doit contenir les mêmes objets que `activities`.
+    Un seul process construit à la fois ; les autres réutilisent sa publication.
+    """
+    SNAPSHOT_DIR.mkdir(exist_ok=True)
+    try:
+        with dal._file_lock(LOCK_FILE):
+            version = version or data_version()
+            if read_current_version() == version:
+                return current()
+
+            # Points relus à la demande depuis streams/ (gardés si l'activité n'a pas d'id)
+            records = []
+            for a in activities:
+                if a.get("activity_id") is not None and a.get("points"):
+                    dal.save_points(a["activity_id"], a["points"])  # no-op si déjà à jour
+                records.append(dal._strip_points(a))
+            _write_version(version, records, activities, activities_sorted)
+        _dbg(f"instantané {version} publié ({len(records)} activités)")
+        return current()
+    except Exception as e:
+        raise RuntimeError(f"Erreur publication instantané {SNAPSHOT_DIR}: {e}") from e
+
+
+def _write_version(version: str, records: List[Dict[str, Any]], activities: List[Dict[str, Any]],
+                   activities_sorted: List[Dict[str, Any]]) -> None:
+    """
+    Écrit puis publie la version `version` (sous LOCK_FILE). `records[i]` est
+    l'enregistrement de `activities[i]` ; `activities_sorted` contient les mêmes
+    objets que `activities`.
+    """
+    positions = {id(a): i for i, a in enumerate(activities)}
+    order = np.array([positions[id(a)] for a in activities_sorted], dtype=np.int32)
+    categories = sorted({str(_history_key(a)) for a in activities_sorted if _history_key(a)})
+
+    tmp = SNAPSHOT_DIR / f".tmp-{version}-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    fmt = serializers.format_for("snapshot")
+    serializers.dump_file(tmp / "records.json", records, fmt, atomic=False)
+    serializers.dump_file(tmp / "series.json", _history_series(activities_sorted), fmt, atomic=False)
+    _save_npy(tmp / "order.npy", order)
+    _save_npy(tmp / "history_idx.npy", _history_index(activities_sorted))
+    for name in ROLLING_COLUMNS:
+        _save_npy(tmp / f"{name}.npy",
+                  np.array([_number(a.get(name)) for a in activities_sorted], dtype=np.float64))
+    with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "version": version,
+            "format": SNAPSHOT_FORMAT,
+            "count": len(records),
+            "categories": categories,
+            "built_at": datetime.now().isoformat(),
+        }, f, ensure_ascii=False, indent=2)
+    _replace_current(tmp, version)
+
+
+def _replace_current(tmp: Path, version: str) -> None:
+    """Installe le répertoire `tmp` comme version `version` et la publie (sous LOCK_FILE)."""
+    target = SNAPSHOT_DIR / version
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    tmp_current = CURRENT_FILE.with_name(CURRENT_FILE.name + ".tmp")
+    tmp_current.write_text(version, encoding="utf-8")
+    os.replace(tmp_current, CURRENT_FILE)
+    _prune(keep={version})
+
+
+def carry_forward(previous_version: str, patches: Dict[Any, Dict[str, Any]]) -> bool:
+    """
+    Publie la version actuelle des données à partir de l'instantané `previous_version`,
+    en fusionnant seulement des champs de résumé ({activity_id: champs}). Réservé aux
+    modifications sans effet sur les moyennes ni les séries (titre, visibilité) :
+    rien n'est recalculé, les tableaux sont repris par lien physique.
+    Retourne False si `previous_version` n'est plus l'instantané publié.
+    """
+    if not SNAPSHOT_DIR.is_dir():
+        return False
+    patches = {str(k): v for k, v in patches.items()}
+    try:
+        with dal._file_lock(LOCK_FILE):
+            if read_current_version() != previous_version:
+                return False
+            version = data_version()
+            source = SNAPSHOT_DIR / previous_version
+            tmp = SNAPSHOT_DIR / f".tmp-{version}-{os.getpid()}"
+            shutil.rmtree(tmp, ignore_errors=True)
+            tmp.mkdir()
+            for path in source.iterdir():
+                if path.name in ("records.json", "meta.json"):
+                    continue
+                try:
+                    os.link(path, tmp / path.name)
+                except OSError:
+                    shutil.copy2(path, tmp / path.name)
+            records = serializers.load_file(source / "records.json")
+            for record in records:
+                fields = patches.get(str(record.get("activity_id")))
+                if fields:
+                    record.update(fields)
+            serializers.dump_file(tmp / "records.json", records, serializers.format_for("snapshot"), atomic=False)
+            with open(source / "meta.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            meta.update(version=version, built_at=datetime.now().isoformat())
+            with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+            _replace_current(tmp, version)
+        _dbg(f"instantané {previous_version} reporté en {version} ({len(patches)} activités modifiées)")
+        return True
+    except Exception as e:
+        raise RuntimeError(f"Erreur report instantané {SNAPSHOT_DIR}: {e}") from e
+
+
+def carry_forward_removal(previous_version: str, activity_ids: Iterable[Any]) -> bool:
+    """
+    Publie la version actuelle des données à partir de l'instantané `previous_version`
+    privé des activités supprimées. Rien n'est réenrichi : seul le contexte historique
+    des catégories touchées est recalculé (moyennes des séances suivantes du même
+    type), tri, historiques et séries sont reconstruits depuis les enregistrements.
+    Retourne False si `previous_version` n'est plus l'instantané publié.
+    """
+    if not SNAPSHOT_DIR.is_dir():
+        return False
+    removed = {str(i) for i in activity_ids}
+    try:
+        with dal._file_lock(LOCK_FILE):
+            if read_current_version() != previous_version:
+                return False
+            version = data_version()
+            source = SNAPSHOT_DIR / previous_version
+            records = serializers.load_file(source / "records.json")
+            order = np.load(source / "order.npy")
+            activities_sorted = [records[i] for i in order]
+            categories = {migrations.session_category_for(a) for a in records
+                          if str(a.get("activity_id")) in removed}
+            categories.discard(None)
+
+            records = [a for a in records if str(a.get("activity_id")) not in removed]
+            activities_sorted = [a for a in activities_sorted if str(a.get("activity_id")) not in removed]
+            affected = [a for a in activities_sorted if migrations.session_category_for(a) in categories]
+            for act in affected:
+                for name in PERCENTILE_FIELDS:
+                    act.pop(name, None)
+            add_historical_context(affected)
+            _write_version(version, records, records, activities_sorted)
+        _dbg(f"instantané {previous_version} reporté en {version} "
+             f"({len(removed)} supprimées, {len(affected)} recontextualisées)")
+        return True
+    except Exception as e:
+        raise RuntimeError(f"Erreur report instantané {SNAPSHOT_DIR}: {e}") from e
+
+
+def _prune(keep: set) -> None:
+    """Supprime les anciennes versions (les mmaps déjà ouverts restent valides sous POSIX)."""
+    for entry in SNAPSHOT_DIR.iterdir():
+        if entry.is_dir() and entry.name not in keep and not entry.name.startswith(".tmp-"):
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+# ========== LECTURE ==========
+
+class Snapshot:
+    """Vue en lecture seule d'une version publiée."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with open(path / "meta.json", "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.version = self.meta["version"]
+        self.order = np.load(path / "order.npy", mmap_mode="r")
+        self.history_idx = np.load(path / "history_idx.npy", mmap_mode="r")
+        self._records: Optional[List[Dict[str, Any]]] = None
+        self._series: Optional[Dict[str, List[Any]]] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return int(self.meta["count"])
+
+    def column(self, name: str) -> np.ndarray:
+        """Moyenne glissante / métrique par activité (ordre trié, NaN si absente)."""
+        if name not in ROLLING_COLUMNS:
+            raise KeyError(name)
+        return np.load(self.path / f"{name}.npy", mmap_mode="r")
+
+    @property
+    def series(self) -> Dict[str, List[Any]]:
+        if self._series is None:
+            self._series = serializers.load_file(self.path / "series.json")
+        return self._series
+
+    def activities(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        (activités dans l'ordre de chargement, mêmes activités triées par date décroissante).
+        Copies (valeurs imbriquées comprises) : l'appelant peut les modifier sans
+        toucher l'instantané décodé.
+        """
+        with self._lock:
+            if self._records is None:
+                self._records = serializers.load_file(self.path / "records.json")
+        activities = [dal._copy_record(a) for a in self._records]
+        return activities, [activities[i] for i in self.order]
+
+    def same_type_history(self, sorted_pos: int) -> List[int]:
+        """Positions (ordre trié) des séances précédentes du même type, plus récente d'abord."""
+        row = self.history_idx[sorted_pos]
+        return [int(i) for i in row if i >= 0]
+
+
+_current: Optional[Snapshot] = None
+_current_signature: Optional[tuple] = None
+_current_lock = threading.Lock()
+
+
+def current() -> Optional[Snapshot]:
+    """Instantané publié (rouvert seulement si CURRENT a changé), None s'il n'y en a pas."""
+    global _current, _current_signature
+    signature = dal._file_signature(CURRENT_FILE)
+    with _current_lock:
+        if signature is not None and signature == _current_signature:
+            return _current
+        version = read_current_version()
+        if version is None:
+            _current, _current_signature = None, signature
+            return None
+        try:
+            _current = Snapshot(SNAPSHOT_DIR / version)
+        except (OSError, ValueError, KeyError) as e:
+            _dbg(f"instantané {version} illisible: {e}")
+            _current = None
+        _current_signature = signature
+        return _current
+
+
+def fresh() -> Optional[Snapshot]:
+    """Instantané publié s'il correspond à la version actuelle des données, sinon None."""
+    snap = current()
+    if snap is not None and snap.version == data_version():
+        return snap
+    return None
+
+
+def attach() -> None:
+    """Hook post_fork : ouvre l'instantané courant dans le worker."""
+    snap = current()
+    _dbg(f"worker {os.getpid()} attaché à {snap.version if snap else 'aucun instantané'}")
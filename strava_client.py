@@ -0,0 +1,346 @@
+# strava_client.py — Client API Strava (token OAuth renouvelé à la demande)
+#
+# L'import ne fait rien : strava_tokens.json n'est lu qu'au premier appel
+# à l'API, et le token n'est renouvelé que s'il expire dans moins de
+# REFRESH_MARGIN secondes (ou après un 401). Les requêtes passent par une
+# requests.Session partagée (connexions keep-alive réutilisées entre threads).
+#
+# Limites de l'API : Strava renvoie à chaque réponse les budgets 15 min et
+# jour (X-RateLimit-Limit / X-RateLimit-Usage, et X-ReadRateLimit-* pour les
+# lectures). RateLimiter les suit et espace les requêtes (seau à jetons)
+# pour ne jamais dépasser le budget de la fenêtre ; un 429 ou une erreur
+# serveur sont réessayés avec un backoff exponentiel aléatoire. Le détail des
+# activités est mis en cache par ETag (If-None-Match → 304, non décompté
+# du contenu à retransférer).
+from __future__ import annotations
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import serializers
+
+API_BASE = "https://www.strava.com/api/v3"
+TOKEN_URL = f"{API_BASE}/oauth/token"
+TOKENS_FILE = Path(__file__).parent / "strava_tokens.json"
+
+# Renouveler le token s'il expire dans moins de 5 min
+REFRESH_MARGIN = 300
+STREAM_KEYS = "time,distance,heartrate,cadence,velocity_smooth,altitude,temperature,moving,latlng"
+# Connexions gardées ouvertes vers l'API (≥ nombre de threads de téléchargement)
+POOL_SIZE = 16
+
+# Budgets par défaut (lecture) tant qu'aucune réponse ne les a donnés
+DEFAULT_SHORT_LIMIT = 100
+DEFAULT_DAILY_LIMIT = 1000
+SHORT_WINDOW = 15 * 60
+DAILY_WINDOW = 24 * 3600
+# Requêtes pouvant partir d'un coup (rafale de webhook) avant l'espacement
+BURST = 20
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+# Attente max pour un budget épuisé : au-delà, RateLimitExceeded (réessai plus tard)
+MAX_WAIT = SHORT_WINDOW
+ETAG_NAMESPACE = "strava_etags"
+
+
+class RateLimitExceeded(requests.RequestException):
+    """Budget Strava épuisé (ou 429 persistant) : la requête est à refaire plus tard."""
+
+
+class UnexpectedResponse(requests.RequestException):
+    """Réponse Strava dont le contenu n'a pas la forme attendue (page à redemander)."""
+
+
+def _parse_pair(value: Optional[str]) -> Optional[tuple]:
+    try:
+        short, daily = (int(v) for v in value.split(","))
+        return short, daily
+    except (AttributeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    Budgets 15 min / jour (fenêtres alignées en UTC, comme Strava) et seau à
+    jetons : débit = budget restant / temps restant dans la fenêtre, avec une
+    rafale de `burst` requêtes.
+    """
+
+    def __init__(self, short_limit: int = DEFAULT_SHORT_LIMIT, daily_limit: int = DEFAULT_DAILY_LIMIT,
+                 burst: int = BURST, clock=time.time, sleep=time.sleep) -> None:
+        self.short_limit = short_limit
+        self.daily_limit = daily_limit
+        self.short_used = 0
+        self.daily_used = 0
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(burst)
+        self._last = clock()
+        self._short_reset = self._next_boundary(self._last, SHORT_WINDOW)
+        self._daily_reset = self._next_boundary(self._last, DAILY_WINDOW)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _next_boundary(now: float, window: int) -> float:
+        return (int(now) // window + 1) * window
+
+    def _roll(self, now: float) -> None:
+        if now >= self._short_reset:
+            self.short_used = 0
+            self._short_reset = self._next_boundary(now, SHORT_WINDOW)
+        if now >= self._daily_reset:
+            self.daily_used = 0
+            self._daily_reset = self._next_boundary(now, DAILY_WINDOW)
+
+    def _rate(self, now: float) -> float:
+        remaining = max(0, self.short_limit - self.short_used)
+        return remaining / max(1.0, self._short_reset - now)
+
+    def _wait_time(self, now: float) -> float:
+        """0 si une requête peut partir maintenant (et la décompte), sinon secondes à attendre."""
+        self._roll(now)
+        if self.daily_used >= self.daily_limit:
+            return self._daily_reset - now
+        if self.short_used >= self.short_limit:
+            return self._short_reset - now
+        rate = self._rate(now)
+        self._tokens = min(float(self.burst), self._tokens + (now - self._last) * rate)
+        self._last = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            self.short_used += 1
+            self.daily_used += 1
+            return 0.0
+        return (1 - self._tokens) / rate
+
+    def acquire(self, max_wait: float = MAX_WAIT) -> None:
+        """Bloque jusqu'à ce qu'une requête puisse partir ; RateLimitExceeded si l'attente dépasse max_wait."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                wait = self._wait_time(self._clock())
+            if wait <= 0:
+                return
+            if waited + wait > max_wait:
+                raise RateLimitExceeded(f"budget Strava épuisé (reprise dans {wait:.0f}s)")
+            self._sleep(wait)
+            waited += wait
+
+    def update(self, headers) -> None:
+        """Recale limites et consommation sur les en-têtes (lecture prioritaire)."""
+        limit = _parse_pair(headers.get("X-ReadRateLimit-Limit")) or _parse_pair(headers.get("X-RateLimit-Limit"))
+        usage = _parse_pair(headers.get("X-ReadRateLimit-Usage")) or _parse_pair(headers.get("X-RateLimit-Usage"))
+        with self._lock:
+            self._roll(self._clock())
+            if limit:
+                self.short_limit, self.daily_limit = limit
+            if usage:
+                self.short_used, self.daily_used = usage
+
+    def exhausted(self) -> bool:
+        with self._lock:
+            self._roll(self._clock())
+            return self.short_used >= self.short_limit or self.daily_used >= self.daily_limit
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            now = self._clock()
+            self._roll(now)
+            return {
+                "short": f"{self.short_used}/{self.short_limit}",
+                "daily": f"{self.daily_used}/{self.daily_limit}",
+                "short_reset_in": round(self._short_reset - now),
+                "daily_reset_in": round(self._daily_reset - now),
+            }
+
+
+class _KvEtagStore:
+    """Cache ETag → réponse dans le store clé-valeur (outputs/kv/strava_etags/)."""
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        import data_access_local as dal
+        return dal.kv_get(ETAG_NAMESPACE, key)
+
+    def __setitem__(self, key: str, value: Dict[str, Any]) -> None:
+        import data_access_local as dal
+        dal.kv_put(ETAG_NAMESPACE, key, value)
+
+
+def _backoff(attempt: int, base: float = BACKOFF_BASE) -> float:
+    """Backoff exponentiel à jitter complet."""
+    return random.uniform(0, min(BACKOFF_CAP, base * 2 ** attempt))
+
+
+def _cached_response(resp: requests.Response, data: Any) -> requests.Response:
+    """Réponse 200 reconstruite depuis le cache (après un 304)."""
+    cached = requests.Response()
+    cached.status_code = 200
+    cached._content = json.dumps(data).encode("utf-8")
+    cached.encoding = "utf-8"
+    cached.headers = resp.headers
+    cached.url = resp.url
+    cached.request = resp.request
+    return cached
+
+
+class StravaClient:
+    """Accès à l'API Strava avec renouvellement paresseux du token."""
+
+    def __init__(self, tokens_file: Path = TOKENS_FILE, client_id: Optional[str] = None,
+                 client_secret: Optional[str] = None, timeout: float = 30,
+                 api_base: str = API_BASE, limiter: Optional[RateLimiter] = None,
+                 etag_store=None, backoff_base: float = BACKOFF_BASE) -> None:
+        self.tokens_file = Path(tokens_file)
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.timeout = timeout
+        self.api_base = api_base.rstrip("/")
+        self.limiter = limiter or RateLimiter()
+        self.etag_store = etag_store if etag_store is not None else _KvEtagStore()
+        self.backoff_base = backoff_base
+        self._tokens: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=POOL_SIZE))
+
+    # ---------- Token ----------
+
+    def _refresh(self) -> None:
+        time_remaining = self._tokens["expires_at"] - int(time.time())
+        print(f"🔄 Token expirant dans {time_remaining}s, on le renouvelle...")
+        resp = self.session.post(
+            f"{self.api_base}/oauth/token",
+            data={
+                "client_id": self.client_id or os.getenv("STRAVA_CLIENT_ID", "162245"),
+                "client_secret": self.client_secret or os.getenv("STRAVA_CLIENT_SECRET", "0552c0e87d83493d7f6667d0570de1e8ac9e9a68"),
+                "grant_type": "refresh_token",
+                "refresh_token": self._tokens["refresh_token"],
+            },
+            timeout=30,
+        )
+        resp.raise_for_status()
+        new_tokens = resp.json()
+        self._tokens["access_token"] = new_tokens["access_token"]
+        self._tokens["refresh_token"] = new_tokens["refresh_token"]
+        self._tokens["expires_at"] = new_tokens["expires_at"]
+        serializers.dump_file(self.tokens_file, self._tokens, serializers.format_for("tokens"))
+        print("✅ Token Strava rafraîchi.")
+
+    def access_token(self, force_refresh: bool = False) -> str:
+        """Token valide (lu au premier appel, renouvelé s'il expire bientôt)."""
+        with self._lock:
+            if self._tokens is None:
+                self._tokens = serializers.load_file(self.tokens_file)
+            if force_refresh or self._tokens["expires_at"] - int(time.time()) < REFRESH_MARGIN:
+                self._refresh()
+            return self._tokens["access_token"]
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.access_token()}"}
+
+    # ---------- API ----------
+
+    def get(self, path: str, params: Optional[Dict[str, Any]] = None,
+            timeout: Optional[float] = None, etag: Optional[str] = None) -> requests.Response:
+        """
+        GET sur l'API (chemin relatif à api_base), au rythme du budget Strava.
+        Un 401 force un renouvellement du token ; 429, erreurs 5xx et coupures
+        réseau sont réessayés (backoff). RateLimitExceeded si le budget reste épuisé.
+        """
+        url = f"{self.api_base}/{path.lstrip('/')}"
+        refreshed = False
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            headers = self.headers
+            if etag:
+                headers["If-None-Match"] = etag
+            try:
+                resp = self.session.get(url, params=params, headers=headers, timeout=timeout or self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= MAX_RETRIES:
+                    raise
+                time.sleep(_backoff(attempt, self.backoff_base))
+                attempt += 1
+                continue
+            self.limiter.update(resp.headers)
+
+            if resp.status_code == 401 and not refreshed:
+                self.access_token(force_refresh=True)
+                refreshed = True
+                continue
+            if resp.status_code == 429 or resp.status_code >= 500:
+                if attempt >= MAX_RETRIES:
+                    if resp.status_code == 429:
+                        raise RateLimitExceeded(f"429 persistant sur {path}", response=resp)
+                    return resp
+                # Budget épuisé : acquire() attendra la fin de la fenêtre ; sinon backoff
+                if not self.limiter.exhausted():
+                    time.sleep(_backoff(attempt, self.backoff_base))
+                attempt += 1
+                continue
+            return resp
+
+    def activity(self, activity_id: int) -> requests.Response:
+        """Détail d'une activité, revalidé par ETag (304 → réponse en cache)."""
+        key = str(activity_id)
+        cached = self.etag_store.get(key)
+        resp = self.get(f"activities/{activity_id}", etag=cached["etag"] if cached else None)
+        if resp.status_code == 304 and cached:
+            return _cached_response(resp, cached["data"])
+        if resp.status_code == 200 and resp.headers.get("ETag"):
+            self.etag_store[key] = {"etag": resp.headers["ETag"], "data": resp.json()}
+        return resp
+
+    def streams(self, activity_id: int, keys: str = STREAM_KEYS) -> requests.Response:
+        return self.get(f"activities/{activity_id}/streams",
+                        params={"keys": keys, "key_by_type": "true"}, timeout=60)
+
+    def athlete_activities(self, per_page: int = 30, page: int = 1, after: Optional[int] = None,
+                           before: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Activités de l'athlète (résumés), les plus récentes d'abord ; after / before
+        (epoch) bornent la période. HTTPError si la réponse est en erreur,
+        UnexpectedResponse si le contenu n'est pas une liste : une page vide
+        signifie toujours "plus d'activités", jamais un échec.
+        """
+        params = {"per_page": per_page, "page": page}
+        if after is not None:
+            params["after"] = int(after)
+        if before is not None:
+            params["before"] = int(before)
+        resp = self.get("athlete/activities", params=params)
+        resp.raise_for_status()
+        try:
+            data = resp.json()
+        except ValueError as e:
+            raise UnexpectedResponse(f"athlete/activities page {page}: JSON invalide", response=resp) from e
+        if not isinstance(data, list):
+            raise UnexpectedResponse(f"athlete/activities page {page}: réponse inattendue {data!r:.200}",
+                                     response=resp)
+        return data
+
+
+_default_client: Optional[StravaClient] = None
+_default_lock = threading.Lock()
+
+
+def default_client() -> StravaClient:
+    """Client partagé du process (créé au premier appel, .env chargé à ce moment)."""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _default_client = StravaClient()
+        return _default_client
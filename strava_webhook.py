@@ -1,24 +1,31 @@
 from flask import Flask, request, jsonify, Response
-import subprocess
 import os
-import sys
 import logging
 
+from ingest_queue import IngestQueue, IngestionWorker
+
 app = Flask(__name__)
 
 # Logger
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
 
-# Chemin absolu du script get_streams.py
-SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-GET_STREAMS_PATH = os.path.join(SCRIPT_DIR, "get_streams.py")
-VENV_PYTHON = os.path.join(SCRIPT_DIR, ".venv", "bin", "python")
-
 # Token de vérification (peut être défini via la variable d'environnement STRAVA_VERIFY_TOKEN)
 VERIFY_TOKEN = os.environ.get("STRAVA_VERIFY_TOKEN", "STRAVA")
 
 
+# File d'ingestion durable : le webhook répond immédiatement, les workers
+# traitent par lots dans ce process (client Strava et token partagés) :
+# créations ingérées, modifications et suppressions appliquées par patch ciblé
+def _ingest(entries):
+    import get_streams
+    return get_streams.handle_events(entries)
+
+
+ingest_queue = IngestQueue()
+ingest_worker = IngestionWorker(ingest_queue, _ingest)
+
+
 @app.route("/webhook", methods=["GET", "POST", "HEAD"])
 def webhook():
     # HEAD est traité automatiquement comme GET sans body
@@ -57,33 +64,36 @@ def webhook():
             logger.warning("❌ Requête POST sans JSON")
             return jsonify({"error": "Invalid JSON"}), 400
 
-        # Si c'est une nouvelle activité créée
-        if data.get("object_type") == "activity" and data.get("aspect_type") == "create":
+        # Activité créée, modifiée (titre, type, visibilité) ou supprimée
+        if data.get("object_type") == "activity" and data.get("aspect_type") in ("create", "update", "delete"):
             activity_id = data.get("object_id")
             if not activity_id:
                 logger.warning("❌ object_id manquant dans la notification")
                 return jsonify({"error": "object_id is required"}), 400
 
-            logger.info(f"🎯 Nouvelle activité détectée : {activity_id}")
-
-            # Détermine quel binaire Python utiliser (venv si présent, sinon l'interpréteur courant)
-            python_executable = VENV_PYTHON if os.path.exists(VENV_PYTHON) else sys.executable
-            if python_executable != VENV_PYTHON:
-                logger.info(f"⚠️  .venv python introuvable, utilisation de {python_executable}")
+            logger.info(f"🎯 Activité {activity_id} : {data.get('aspect_type')} {data.get('updates') or ''}")
 
             try:
-                # Lance ton script get_streams.py en arrière-plan avec le bon python
-                subprocess.Popen([python_executable, GET_STREAMS_PATH, str(activity_id)],
-                                 cwd=SCRIPT_DIR,
-                                 close_fds=True)
-                logger.info("🚀 Script get_streams.py lancé en tâche de fond.")
+                ingest_worker.start()  # no-op si déjà démarré
+                if ingest_worker.submit(activity_id, data):
+                    logger.info("📥 Activité ajoutée à la file d'ingestion.")
+                else:
+                    logger.info("📥 Activité déjà en file, événement fusionné.")
             except Exception as e:
-                logger.exception("❌ Erreur lors du lancement du script get_streams.py : %s", e)
-                return jsonify({"error": "failed to launch background job"}), 500
+                logger.exception("❌ Erreur lors de la mise en file de l'activité : %s", e)
+                return jsonify({"error": "failed to queue ingestion job"}), 500
 
         return jsonify({"status": "received"}), 200
 
 
+@app.route("/ingest/status", methods=["GET"])
+def ingest_status():
+    from strava_client import default_client
+    return jsonify({**ingest_queue.stats(), "strava_rate_limit": default_client().limiter.status()}), 200
+
+
 if __name__ == "__main__":
+    # Reprend les activités restées en file avant un arrêt
+    ingest_worker.start()
     # Expose le serveur sur le port 5003
     app.run(host="0.0.0.0", port=5003)
\ No newline at end of file
@@ -0,0 +1,227 @@
+# stream_ops.py — Rééchantillonnage vectorisé des streams Strava (NumPy)
+#
+# Les streams bruts (1 échantillon/s environ) sont regroupés en fenêtres ;
+# chaque fenêtre donne un point : time / distance du dernier échantillon,
+# moyenne des échantillons présents pour les autres canaux (NaN = absent,
+# None si aucun échantillon dans la fenêtre).
+#
+#   count     fenêtres de `size` échantillons (historique : 10)
+#   time      fenêtres de `size` secondes depuis le début
+#   distance  fenêtres de `size` mètres (distance cumulée, trous comblés)
+#
+# Séries plus courtes que le temps (queue manquante) et valeurs non
+# numériques sont traitées comme des NaN.
+from __future__ import annotations
+from itertools import chain
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+MODES = ("count", "time", "distance")
+DEFAULT_MODE = "count"
+DEFAULT_SIZE = 10
+
+# Canal de point -> clé du stream Strava (key_by_type)
+STREAM_CHANNELS = {
+    "hr": "heartrate",
+    "vel": "velocity_smooth",
+    "alt": "altitude",
+    "cad_raw": "cadence",
+}
+
+
+def parse_resolution(spec: Optional[str]) -> tuple:
+    """'count:10', 'time:5', 'distance:10' -> (mode, taille) ; défaut (count, 10)."""
+    if not spec:
+        return DEFAULT_MODE, DEFAULT_SIZE
+    mode, _, size = spec.partition(":")
+    mode = mode.strip().lower()
+    if mode not in MODES:
+        raise ValueError(f"Mode de rééchantillonnage inconnu: {mode} (attendu: {', '.join(MODES)})")
+    size = float(size) if size else DEFAULT_SIZE
+    if size <= 0:
+        raise ValueError(f"Taille de fenêtre invalide: {size}")
+    return mode, size
+
+
+def to_array(series: Optional[Sequence[Any]], n: int) -> np.ndarray:
+    """Série Strava -> float64 de longueur n (None / non numérique / queue manquante -> NaN)."""
+    out = np.full(n, np.nan)
+    if series is None or len(series) == 0:
+        return out
+    m = min(n, len(series))
+    if isinstance(series, np.ndarray):
+        out[:m] = series[:m]
+        return out
+    try:
+        out[:m] = np.fromiter(series[:m], dtype=np.float64, count=m)
+    except (TypeError, ValueError):
+        out[:m] = [v if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan
+                   for v in series[:m]]
+    return out
+
+
+def latlng_arrays(latlng: Optional[Sequence[Any]], n: int) -> tuple:
+    """Stream latlng ([[lat, lng], ...], entrées vides possibles, ou ndarray (n, 2)) -> (lat, lng)."""
+    lat, lng = np.full(n, np.nan), np.full(n, np.nan)
+    if isinstance(latlng, np.ndarray):  # déjà en colonnes (n, 2), NaN = absent
+        m = min(n, len(latlng))
+        lat[:m], lng[:m] = latlng[:m, 0], latlng[:m, 1]
+        return lat, lng
+    latlng = (latlng or [])[:n]
+    try:
+        flat = np.fromiter(chain.from_iterable(latlng), dtype=np.float64, count=2 * len(latlng))
+        lat[:len(latlng)], lng[:len(latlng)] = flat[0::2], flat[1::2]
+        return lat, lng
+    except (TypeError, ValueError):
+        pass  # entrées vides ou incomplètes : parcours point par point
+    for i, pair in enumerate(latlng):
+        if pair:
+            lat[i], lng[i] = pair[0], pair[1]
+    return lat, lng
+
+
+def _running_max(values: np.ndarray) -> np.ndarray:
+    """Série cumulée rendue monotone : trous (NaN) et petits reculs GPS comblés par le maximum courant."""
+    filled = np.maximum.accumulate(np.where(np.isnan(values), -np.inf, values))
+    return np.where(np.isinf(filled), 0.0, filled)
+
+
+def window_starts(time: np.ndarray, distance: np.ndarray, mode: str = DEFAULT_MODE,
+                  size: float = DEFAULT_SIZE) -> np.ndarray:
+    """Indices de début de chaque fenêtre (le premier vaut toujours 0)."""
+    n = len(time)
+    if n == 0:
+        return np.zeros(0, dtype=np.intp)
+    if mode == "count":
+        return np.arange(0, n, int(size), dtype=np.intp)
+    if mode == "time":
+        t = _running_max(time)
+        labels = np.floor((t - t[0]) / size)
+    elif mode == "distance":
+        labels = np.floor(_running_max(distance) / size)
+    else:
+        raise ValueError(f"Mode de rééchantillonnage inconnu: {mode}")
+    return np.concatenate(([0], np.flatnonzero(np.diff(labels)) + 1)).astype(np.intp)
+
+
+def window_mean(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Moyenne par fenêtre des valeurs présentes (NaN si aucune)."""
+    present = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(present, values, 0.0), starts)
+    counts = np.add.reduceat(present.astype(np.int64), starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def resample(streams: Dict[str, Any], mode: str = DEFAULT_MODE,
+             size: float = DEFAULT_SIZE) -> Dict[str, np.ndarray]:
+    """
+    Streams Strava (key_by_type, {'time': {'data': [...]}, ...}) -> colonnes par point
+    (time, distance, hr, vel, alt, lat, lng, cad_raw). {} si pas de stream time.
+    """
+    def data(key):
+        values = (streams.get(key) or {}).get("data")
+        return [] if values is None else values
+
+    n = len(data("time"))
+    if n == 0:
+        return {}
+    time = to_array(data("time"), n)
+    distance = to_array(data("distance"), n)
+    starts = window_starts(time, distance, mode, size)
+    ends = np.append(starts[1:], n) - 1
+
+    columns = {"time": time[ends], "distance": distance[ends]}
+    for channel, key in STREAM_CHANNELS.items():
+        columns[channel] = window_mean(to_array(data(key), n), starts)
+    lat, lng = latlng_arrays(data("latlng"), n)
+    columns["lat"] = window_mean(lat, starts)
+    columns["lng"] = window_mean(lng, starts)
+    return columns
+
+
+# ========== ALIGNEMENT TEMPOREL ==========
+#
+# Série arrivée après coup (cadence, température, puissance...) recalée sur
+# des points existants : pour chaque point, échantillon le plus proche dans
+# le temps parmi les voisins (searchsorted), retenu s'il est à ± tol secondes.
+
+def align_nearest(target_times: np.ndarray, sample_times: np.ndarray, values: np.ndarray,
+                  tol: float = 5.0) -> np.ndarray:
+    """
+    Valeur de l'échantillon le plus proche de chaque instant cible (NaN si aucun
+    échantillon valide à ± tol). À distance égale, l'échantillon le plus ancien gagne.
+    """
+    target_times = np.asarray(target_times, dtype=np.float64)
+    sample_times = np.asarray(sample_times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    m = min(len(sample_times), len(values))
+    out = np.full(len(target_times), np.nan)
+    if m == 0 or len(target_times) == 0:
+        return out
+    sample_times, values = sample_times[:m], values[:m]
+
+    idx = np.searchsorted(sample_times, target_times, side="left")
+    candidates = idx[:, None] + np.array([-1, 0, 1])
+    in_range = (candidates >= 0) & (candidates < m)
+    safe = np.clip(candidates, 0, m - 1)
+    dt = np.abs(sample_times[safe] - target_times[:, None])
+    dt[~in_range | np.isnan(values[safe]) | np.isnan(dt)] = np.inf
+    best = np.argmin(dt, axis=1)
+    rows = np.arange(len(target_times))
+    ok = dt[rows, best] <= tol
+    out[ok] = values[safe[rows, best]][ok]
+    return out
+
+
+def fill_columns(columns: Dict[str, np.ndarray], sample_times: Sequence[Any],
+                 series: Dict[str, Sequence[Any]], tol_sec: float = 5.0) -> Dict[str, Dict[str, Any]]:
+    """
+    Comme fill_points, sur des colonnes (streams/ : {'time': [...], canal: [...]}) :
+    les canaux absents sont créés, les valeurs présentes ne sont pas écrasées.
+    Retourne par champ {"filled": n, "coverage_pct": %}.
+    """
+    point_times = np.asarray(columns.get("time", []), dtype=np.float64)
+    n = len(point_times)
+    n_samples = 0 if sample_times is None else len(sample_times)
+    times = to_array(sample_times, n_samples)
+    report = {}
+    for field, values in series.items():
+        current = np.asarray(columns.get(field, np.full(n, np.nan)), dtype=np.float64)
+        aligned = align_nearest(point_times, times, to_array(values, n_samples), tol_sec)
+        fill = np.isnan(current) & ~np.isnan(aligned)
+        columns[field] = np.where(fill, aligned, current)
+        report[field] = {
+            "filled": int(fill.sum()),
+            "coverage_pct": round(100.0 * float((~np.isnan(columns[field])).sum()) / n, 1) if n else 0.0,
+        }
+    return report
+
+
+def fill_points(points: list, sample_times: Sequence[Any], series: Dict[str, Sequence[Any]],
+                tol_sec: float = 5.0) -> Dict[str, Dict[str, Any]]:
+    """
+    Complète les points (en place) avec des séries recalées dans le temps :
+    series = {champ: valeurs échantillonnées à sample_times}. N'écrase pas une
+    valeur déjà présente. Retourne par champ {"filled": n, "coverage_pct": %}
+    (couverture = points ayant une valeur après remplissage).
+    """
+    report = {}
+    if not points:
+        return {field: {"filled": 0, "coverage_pct": 0.0} for field in series}
+    n_samples = 0 if sample_times is None else len(sample_times)
+    times = to_array(sample_times, n_samples)
+    point_times = to_array([p.get("time") for p in points], len(points))
+    for field, values in series.items():
+        current = np.fromiter((p.get(field) is not None for p in points), dtype=bool, count=len(points))
+        aligned = align_nearest(point_times, times, to_array(values, n_samples), tol_sec)
+        fill = ~current & ~np.isnan(aligned)
+        filled_values = aligned.tolist()
+        for i in np.flatnonzero(fill).tolist():
+            points[i][field] = filled_values[i]
+        report[field] = {
+            "filled": int(fill.sum()),
+            "coverage_pct": round(100.0 * float((current | fill).sum()) / len(points), 1),
+        }
+    return report
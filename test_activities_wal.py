@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test du journal de l'index (activities.wal.jsonl) : rejeu au chargement,
+patchs concurrents repliés à la sauvegarde, sauvegarde après compaction,
+dernière ligne tronquée. Travaille dans un répertoire temporaire : ne touche
+ni activities.json ni streams/ du projet.
+"""
+import shutil
+import tempfile
+from pathlib import Path
+
+import data_access_local as dal
+
+PATHS = ("ACTIVITIES_FILE", "ACTIVITIES_WAL_FILE", "ACTIVITIES_LOCK_FILE", "STREAMS_DIR", "STORAGE_BACKEND")
+
+
+def make_activity(i):
+    return {
+        "activity_id": str(8_000_000 + i),
+        "date": f"2025-02-{i + 1:02d}T08:00:00Z",
+        "distance_km": 5.0 + i,
+        "type_sortie": "endurance",
+    }
+
+
+def by_id(activities):
+    return {a["activity_id"]: a for a in activities}
+
+
+def test_activities_wal():
+    print("\n" + "=" * 60)
+    print("TEST: Journal de l'index des activités")
+    print("=" * 60)
+
+    tmp = Path(tempfile.mkdtemp(prefix="t2t_wal_test_"))
+    saved = {name: getattr(dal, name) for name in PATHS}
+    dal.ACTIVITIES_FILE = tmp / "activities.json"
+    dal.ACTIVITIES_WAL_FILE = tmp / "activities.wal.jsonl"
+    dal.ACTIVITIES_LOCK_FILE = tmp / ".activities.lock"
+    dal.STREAMS_DIR = tmp / "streams"
+    dal.STORAGE_BACKEND = "json"
+    try:
+        ids = [make_activity(i)["activity_id"] for i in range(3)]
+        dal.save_activities_local([make_activity(i) for i in range(3)])
+
+        # Rejeu : set / put / delete appliqués au snapshot
+        dal.patch_activities_local({ids[0]: {"notes": "a"}})
+        dal.upsert_activities_local([make_activity(3)])
+        dal.delete_activities_local([ids[2]])
+        loaded = by_id(dal.load_activity_summaries())
+        assert loaded[ids[0]]["notes"] == "a" and make_activity(3)["activity_id"] in loaded
+        assert ids[2] not in loaded and len(loaded) == 3
+        print("Rejeu du journal : OK")
+
+        # Patch d'un autre process entre chargement et sauvegarde : replié, pas perdu
+        activities = dal.load_activities_local()
+        dal.patch_activities_local({ids[1]: {"concurrent": 1}})
+        activities[0]["mine"] = 2
+        dal.save_activities_local(activities)
+        assert dal.ACTIVITIES_WAL_FILE.stat().st_size == 0
+        loaded = by_id(dal.load_activity_summaries())
+        assert loaded[activities[0]["activity_id"]]["mine"] == 2
+        assert loaded[ids[1]]["concurrent"] == 1
+        print("Patch concurrent replié à la sauvegarde : OK")
+
+        # Compaction entre chargement et sauvegarde : sauvegarde refusée, index intact
+        stale = dal.load_activities_local()
+        dal.patch_activities_local({ids[0]: {"compacted": True}})
+        assert dal.compact_activities_wal() == 1
+        stale[0]["stale"] = True
+        try:
+            dal.save_activities_local(stale)
+        except RuntimeError as e:
+            print(f"Sauvegarde après compaction refusée : {e}")
+        else:
+            raise AssertionError("sauvegarde d'une liste périmée acceptée")
+        loaded = by_id(dal.load_activity_summaries())
+        assert loaded[ids[0]]["compacted"] is True
+        assert not any(a.get("stale") for a in loaded.values())
+        # Seules les activités touchées écrites : rien de perdu
+        dal.upsert_activities_local([stale[0]])
+        loaded = by_id(dal.load_activity_summaries())
+        assert loaded[stale[0]["activity_id"]]["stale"] is True
+        print("Écriture des seules activités touchées après compaction : OK")
+
+        # Dernière ligne tronquée (crash pendant l'écriture) : ignorée, la suivante lue
+        with open(dal.ACTIVITIES_WAL_FILE, "ab") as f:
+            f.write(b'{"op":"set","activity_id":"' + ids[1].encode() + b'","fie')
+        assert len(dal.load_activity_summaries()) == len(loaded)
+        dal.patch_activities_local({ids[1]: {"after_crash": 1}})
+        loaded = by_id(dal.load_activity_summaries())
+        assert loaded[ids[1]]["after_crash"] == 1
+        dal.compact_activities_wal()
+        assert by_id(dal.load_activity_summaries())[ids[1]]["after_crash"] == 1
+        print("Ligne tronquée ignorée, patch suivant conservé : OK")
+    finally:
+        for name, value in saved.items():
+            setattr(dal, name, value)
+        dal._cache.invalidate("activities")
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print("✅ Journal de l'index OK")
+
+
+if __name__ == "__main__":
+    test_activities_wal()
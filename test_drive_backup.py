@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test de la sauvegarde incrémentale (drive_backup.py) contre un répertoire local
+qui tient lieu de Drive. Travaille dans un répertoire temporaire : ne touche
+ni streams/ ni l'état de sauvegarde du projet.
+"""
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+import data_access_local as dal
+import drive_backup
+import serializers
+
+
+def make_activity(i):
+    return {
+        "activity_id": str(9_000_000 + i),
+        "date": f"2025-01-{i + 1:02d}T08:00:00Z",
+        "distance_km": 5.0 + i,
+        "type_sortie": "endurance",
+    }
+
+
+def make_points(i, n=200):
+    return [{"time": t, "distance": t * 3.0 + i, "hr": 140.0 + (t % 7), "vel": 3.0} for t in range(n)]
+
+
+class FlakyTarget(drive_backup.LocalDirectoryTarget):
+    """Échoue sur les `failures` premiers envois (coupure réseau simulée)."""
+
+    def __init__(self, root, failures):
+        super().__init__(root)
+        self.failures = failures
+
+    def put(self, name, data):
+        if self.failures > 0:
+            self.failures -= 1
+            raise OSError("réseau indisponible")
+        super().put(name, data)
+
+
+def test_incremental_backup():
+    print("\n" + "=" * 60)
+    print("TEST: Sauvegarde incrémentale vers un répertoire local")
+    print("=" * 60)
+
+    tmp = Path(tempfile.mkdtemp(prefix="t2t_backup_test_"))
+    saved = (dal.STREAMS_DIR, drive_backup.BACKUP_STATE_FILE, drive_backup.BACKUP_LOCK_FILE)
+    dal.STREAMS_DIR = tmp / "streams"
+    drive_backup.BACKUP_STATE_FILE = tmp / "state.json"
+    drive_backup.BACKUP_LOCK_FILE = tmp / "backup.lock"
+    try:
+        target = drive_backup.LocalDirectoryTarget(tmp / "remote")
+        activities = [make_activity(i) for i in range(3)]
+        for i, act in enumerate(activities):
+            dal.save_points(act["activity_id"], make_points(i))
+
+        first = drive_backup.run_backup(target, activities)
+        print(f"1re sauvegarde : {first['uploaded']} morceaux, {first['bytes']} octets")
+        assert first["uploaded"] > 0
+
+        second = drive_backup.run_backup(target, activities)
+        print(f"2e sauvegarde (rien de changé) : {second['uploaded']} morceaux")
+        assert second["uploaded"] == 0
+
+        # Une nouvelle sortie : seuls son résumé et ses canaux sont envoyés
+        activities.append(make_activity(3))
+        dal.save_points(activities[-1]["activity_id"], make_points(3))
+        third = drive_backup.run_backup(target, activities)
+        channels = len(list(dal._stream_dir(activities[-1]["activity_id"]).glob("*.npy")))
+        print(f"3e sauvegarde (1 nouvelle sortie) : {third['uploaded']} morceaux")
+        assert 0 < third["uploaded"] <= 1 + channels
+
+        # Restauration depuis le dernier manifeste
+        restored_dir = tmp / "restored"
+        count = drive_backup.restore(target, restored_dir)
+        restored = serializers.load_file(restored_dir / "activities.json")
+        assert count == 4 and restored == activities
+        hr = np.load(restored_dir / "streams" / activities[0]["activity_id"] / "hr.npy")
+        assert np.array_equal(hr, dal.load_points(activities[0]["activity_id"])["hr"])
+        print(f"Restauration : {count} activités, streams identiques")
+
+        # Nouvelles tentatives : deux échecs puis succès
+        flaky = FlakyTarget(tmp / "remote_flaky", failures=2)
+        assert drive_backup.run_backup_with_retry(flaky, activities, delays=(0, 0, 0)) is not None
+        assert drive_backup.restore(flaky, tmp / "restored_flaky") == 4
+        print("Reprise après échecs : OK")
+
+        # Tâche de fond
+        background = drive_backup.LocalDirectoryTarget(tmp / "remote_bg")
+        assert drive_backup.backup_in_background(background, delays=(0,))
+        assert drive_backup.wait_for_background_backup(timeout=30)
+        assert background.exists("LATEST")
+        print("Sauvegarde en tâche de fond : OK")
+    finally:
+        dal.STREAMS_DIR, drive_backup.BACKUP_STATE_FILE, drive_backup.BACKUP_LOCK_FILE = saved
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print("✅ Sauvegarde incrémentale OK")
+
+
+if __name__ == "__main__":
+    test_incremental_backup()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test de la couche HTTP Strava (strava_client.py) contre un faux serveur Strava
+local : budgets X-RateLimit-*, réessais sur 429 / 5xx, cache ETag.
+Aucun appel à la vraie API, aucun fichier du projet modifié.
+"""
+import json
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from strava_client import RateLimiter, RateLimitExceeded, StravaClient
+
+
+class FakeStrava(BaseHTTPRequestHandler):
+    """Détail d'activité avec ETag, 429 / 503 transitoires, en-têtes de budget."""
+
+    requests_seen = 0
+    failures = {"/api/v3/activities/429": 2, "/api/v3/activities/503": 1}
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=None, extra=None):
+        FakeStrava.requests_seen += 1
+        self.send_response(status)
+        self.send_header("X-ReadRateLimit-Limit", "100,1000")
+        self.send_header("X-ReadRateLimit-Usage", f"{FakeStrava.requests_seen},{FakeStrava.requests_seen}")
+        for key, value in (extra or {}).items():
+            self.send_header(key, value)
+        raw = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_GET(self):
+        if FakeStrava.failures.get(self.path, 0) > 0:
+            FakeStrava.failures[self.path] -= 1
+            self._send(429 if self.path.endswith("429") else 503, {"message": "Rate Limit Exceeded"})
+            return
+        activity_id = self.path.rsplit("/", 1)[-1]
+        etag = f'"v-{activity_id}"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, extra={"ETag": etag})
+            return
+        self._send(200, {"id": activity_id, "start_date_local": "2025-01-01T08:00:00Z"}, {"ETag": etag})
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def test_rate_limiter():
+    print("\n" + "=" * 60)
+    print("TEST: Budgets et seau à jetons")
+    print("=" * 60)
+
+    # Fenêtre 15 min commencée : 100 s restantes pour 10 requêtes => 0.1 req/s
+    clock = FakeClock(9_000_000 - 100)
+    limiter = RateLimiter(short_limit=10, daily_limit=1000, burst=2, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        limiter.acquire()
+    print(f"3 requêtes, attentes: {[round(s, 1) for s in clock.slept]}")
+    assert len(clock.slept) == 1 and clock.slept[0] > 0
+
+    # Budget épuisé d'après les en-têtes : attente jusqu'à la fin de la fenêtre
+    limiter.update({"X-RateLimit-Limit": "10,1000", "X-RateLimit-Usage": "10,50"})
+    assert limiter.exhausted()
+    clock.slept.clear()
+    limiter.acquire()
+    assert clock.now >= 9_000_000 and limiter.short_used == 1
+    print(f"Budget épuisé : reprise après {clock.slept[0]:.0f}s (nouvelle fenêtre)")
+
+    # Budget journalier épuisé : pas d'attente de plusieurs heures
+    limiter.update({"X-RateLimit-Limit": "10,1000", "X-RateLimit-Usage": "1,1000"})
+    try:
+        limiter.acquire(max_wait=900)
+        raise AssertionError("RateLimitExceeded attendu")
+    except RateLimitExceeded as e:
+        print(f"Budget journalier épuisé : {e}")
+    print("✅ RateLimiter OK")
+
+
+def test_client_against_fake_server():
+    print("\n" + "=" * 60)
+    print("TEST: StravaClient contre un faux serveur Strava")
+    print("=" * 60)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeStrava)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    tmp = Path(tempfile.mkdtemp(prefix="t2t_strava_test_"))
+    tokens_file = tmp / "strava_tokens.json"
+    tokens_file.write_text(json.dumps({"access_token": "test", "refresh_token": "r",
+                                       "expires_at": int(time.time()) + 3600}))
+    try:
+        etags = {}
+        client = StravaClient(tokens_file, api_base=f"http://127.0.0.1:{server.server_port}/api/v3",
+                              etag_store=etags, backoff_base=0.01)
+
+        first = client.activity(42)
+        assert first.status_code == 200 and first.json()["id"] == "42" and "42" in etags
+        second = client.activity(42)
+        assert second.status_code == 200 and second.json() == first.json()
+        print("Cache ETag : 2e lecture servie par un 304")
+
+        assert client.activity("429").status_code == 200
+        assert client.activity("503").status_code == 200
+        print("429 / 503 transitoires : réessayés avec backoff")
+
+        assert client.limiter.short_limit == 100
+        assert client.limiter.short_used == FakeStrava.requests_seen
+        print(f"Budget suivi depuis les en-têtes : {client.limiter.status()}")
+    finally:
+        server.shutdown()
+        tokens_file.unlink()
+        tmp.rmdir()
+    print("✅ StravaClient OK")
+
+
+if __name__ == "__main__":
+    test_rate_limiter()
+    test_client_against_fake_server()
@@ -0,0 +1,152 @@
+# weather_jobs.py — Météo de sortie calculée en tâche de fond
+#
+# Le dashboard appelait Open-Meteo pendant GET / quand la dernière activité
+# n'avait pas encore avg_temperature : une réponse lente bloquait la page.
+# La météo de sortie (température moyenne / départ / arrivée, code dominant)
+# est maintenant une étape asynchrone après l'ingestion :
+#
+#   weather_queue/pending|processing|failed/<activity_id>.json
+#       même file durable que l'ingestion (ingest_queue.IngestQueue) ; chaque
+#       worker gunicorn démarre son weather_worker, qui ne reprend que les
+#       entrées abandonnées (propriétaire mort), pas les lots d'un voisin
+#   weather_status (champ de l'activité)
+#       done         météo calculée et enregistrée
+#       unavailable  pas de coordonnées / date : rien à demander
+#       (absent)     pending si en file, failed si abandonnée
+#
+# get_streams.ingest_batch met les activités ingérées en file ; le dashboard
+# s'affiche aussitôt avec un badge "en cours" et demande la valeur à
+# /api/weather/<activity_id> jusqu'à ce que le worker l'ait enregistrée.
+# Le worker traite un lot en une fois : prefetch weather_service (une requête
+# par lieu), un seul patch de l'index, instantané partagé reporté sans recalcul.
+from __future__ import annotations
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+import data_access_local as dal
+import shared_snapshot
+import weather_service
+from ingest_queue import IngestionWorker, IngestQueue
+
+WEATHER_QUEUE_DIR = dal.BASE_DIR / "weather_queue"
+WEATHER_QUEUE_LOCK_FILE = dal.BASE_DIR / ".weather_queue.lock"
+COALESCE_SECONDS = float(os.getenv("T2T_WEATHER_COALESCE_SECONDS", "1"))
+
+STATUS_FIELD = "weather_status"
+DONE = "done"
+UNAVAILABLE = "unavailable"
+PENDING = "pending"
+FAILED = "failed"
+
+
+def _dbg(msg: str) -> None:
+    if dal.DEBUG:
+        print(f"[WEATHER-JOB] {msg}")
+
+
+def run_window(activity: Dict[str, Any]) -> Optional[tuple]:
+    """(lat, lng, départ naïf heure locale, durée en minutes) ; None si coordonnées ou date absentes."""
+    columns = dal.load_points(activity.get("activity_id"))
+    date_str = activity.get("date")
+    if not columns or not date_str or "lat" not in columns or "lng" not in columns:
+        return None
+    lat, lng = np.asarray(columns["lat"], dtype=np.float64), np.asarray(columns["lng"], dtype=np.float64)
+    located = np.flatnonzero(~np.isnan(lat) & ~np.isnan(lng))
+    if not len(located):
+        return None
+    try:
+        # Fuseau supprimé pour comparer avec les heures locales de l'API
+        start_dt = datetime.fromisoformat(date_str[:19])
+    except ValueError:
+        return None
+    times = np.asarray(columns.get("time", []), dtype=np.float64)
+    duration_minutes = float(times[-1] - times[0]) / 60 if len(times) else 0.0
+    return float(lat[located[0]]), float(lng[located[0]]), start_dt, duration_minutes
+
+
+def enrich(entries: List[Dict[str, Any]]) -> List[Any]:
+    """
+    Handler du worker : météo de sortie d'un lot d'activités, enregistrée en une
+    seule écriture. Retourne les ids en échec (réseau : nouvel essai plus tard).
+    """
+    wanted = {str(entry["activity_id"]) for entry in entries}
+    activities = [a for a in dal.load_activity_summaries() if str(a.get("activity_id")) in wanted]
+
+    patches: Dict[Any, Dict[str, Any]] = {}
+    windows = {}
+    for act in activities:
+        window = run_window(act)
+        if window is None:
+            patches[act["activity_id"]] = {STATUS_FIELD: UNAVAILABLE}
+        else:
+            windows[act["activity_id"]] = window
+
+    # Une requête Open-Meteo par lieu pour tout le lot
+    weather_service.prefetch((lat, lng, start.date().isoformat()) for lat, lng, start, _ in windows.values())
+    failed = []
+    for activity_id, (lat, lng, start_dt, duration) in windows.items():
+        avg_temperature, temp_debut, temp_fin, weather_code = weather_service.run_weather(
+            lat, lng, start_dt, duration)
+        if avg_temperature is None and weather_code is None:
+            failed.append(activity_id)
+            continue
+        patches[activity_id] = {
+            "avg_temperature": avg_temperature,
+            "temp_debut": temp_debut,
+            "temp_fin": temp_fin,
+            "weather_code": weather_code,
+            STATUS_FIELD: DONE,
+        }
+
+    if patches:
+        # Champs sans effet sur les moyennes ni les séries : instantané reporté
+        previous_version = shared_snapshot.data_version()
+        dal.patch_activities_local(patches)
+        shared_snapshot.carry_forward(previous_version, patches)
+        print(f"🌡️ Météo enregistrée pour {len(patches)} activité(s)")
+    _dbg(f"lot: {len(patches)} ok, {len(failed)} en échec")
+    return failed
+
+
+weather_queue = IngestQueue(WEATHER_QUEUE_DIR, WEATHER_QUEUE_LOCK_FILE)
+weather_worker = IngestionWorker(weather_queue, enrich, coalesce_seconds=COALESCE_SECONDS)
+
+
+def has_weather(activity: Dict[str, Any]) -> bool:
+    return activity.get(STATUS_FIELD) in (DONE, UNAVAILABLE) or (
+        activity.get("avg_temperature") is not None and activity.get("weather_code") is not None)
+
+
+def weather_status(activity: Dict[str, Any]) -> str:
+    """done / unavailable / pending / failed (failed : abandonnée après plusieurs essais)."""
+    if has_weather(activity):
+        return activity.get(STATUS_FIELD) or DONE
+    if activity.get("activity_id") is None:
+        return UNAVAILABLE
+    state = weather_queue.state(activity.get("activity_id"))
+    return FAILED if state == "failed" else PENDING
+
+
+def enqueue(activity_ids: Iterable[Any]) -> int:
+    """Met des activités en file (worker démarré dans ce process). Retourne le nombre ajouté."""
+    weather_worker.start()  # no-op si déjà démarré
+    added = sum(1 for activity_id in activity_ids if weather_worker.submit(activity_id))
+    _dbg(f"{added} activité(s) en file")
+    return added
+
+
+def request_weather(activity: Dict[str, Any]) -> str:
+    """
+    Statut météo d'une activité ; la met en file si rien n'est calculé ni en attente.
+    Ne fait aucun appel réseau (utilisable dans une requête HTTP).
+    """
+    status = weather_status(activity)
+    if status == PENDING:
+        if weather_queue.state(activity["activity_id"]) is None:
+            enqueue([activity["activity_id"]])
+        else:
+            weather_worker.start()  # entrée déposée par un autre process (ingestion en ligne de commande)
+    return status
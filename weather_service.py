@@ -0,0 +1,270 @@
+# weather_service.py — Météo Open-Meteo avec cache disque partagé
+#
+# get_streams.fetch_open_meteo, app.get_temperature_for_run et refresh_weather
+# interrogeaient chacun Open-Meteo sans mémoïsation (et sans timeout pour
+# app). Tous passent maintenant par ce module :
+#
+#   - une entrée de cache par (cellule de grille, jour local) : la série
+#     horaire complète (température, code météo), dans le kv "weather"
+#   - archive (jour antérieur à avant-hier) : entrée permanente, les données
+#     ne changent plus ; prévision (aujourd'hui, hier, avant-hier, ou archive
+#     pas encore disponible) : entrée valable FORECAST_TTL secondes
+#   - requêtes centrées sur la cellule : deux sorties du même parc le même
+#     jour (ou une relance de refresh_weather) ne font aucun appel réseau
+#   - prefetch() : pour un lot (refresh_weather), une seule requête par
+#     cellule couvrant toute la plage de dates, découpée ensuite par jour
+#
+# Les heures sont locales au lieu (timezone=auto), comme avant.
+from __future__ import annotations
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+import data_access_local as dal
+
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+HOURLY_FIELDS = "temperature_2m,weathercode"
+CACHE_NAMESPACE = "weather"
+
+# Taille de la cellule de grille (degrés) : ~5 km, sous la résolution des modèles
+GRID_DEG = float(os.getenv("T2T_WEATHER_GRID_DEG", "0.05"))
+FORECAST_TTL = int(os.getenv("T2T_WEATHER_FORECAST_TTL", str(3 * 3600)))
+# Jours les plus récents servis par l'API de prévision (l'archive a du retard)
+FORECAST_DAYS_BACK = 2
+TIMEOUT = (5, 15)  # (connexion, lecture) en secondes
+
+_session = requests.Session()
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "network_calls": 0, "errors": 0}
+
+
+def _dbg(msg: str) -> None:
+    if dal.DEBUG:
+        print(f"[WEATHER] {msg}")
+
+
+def _count(key: str) -> None:
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def stats() -> Dict[str, int]:
+    with _stats_lock:
+        return dict(_stats)
+
+
+def grid_cell(lat: float, lng: float) -> Tuple[float, float]:
+    """Centre de la cellule de grille contenant (lat, lng)."""
+    return (round(round(float(lat) / GRID_DEG) * GRID_DEG, 4),
+            round(round(float(lng) / GRID_DEG) * GRID_DEG, 4))
+
+
+def cache_key(lat: float, lng: float, day: str) -> str:
+    cell_lat, cell_lng = grid_cell(lat, lng)
+    return f"{cell_lat:.4f},{cell_lng:.4f},{day}"
+
+
+def _is_recent(day: str) -> bool:
+    return date.fromisoformat(day) >= date.today() - timedelta(days=FORECAST_DAYS_BACK)
+
+
+def _fetch(url: str, cell: Tuple[float, float], day: str,
+           end_day: Optional[str] = None) -> Optional[Dict[str, List[Any]]]:
+    """Série horaire de day à end_day inclus (None si erreur réseau / réponse inattendue)."""
+    params = {
+        "latitude": cell[0],
+        "longitude": cell[1],
+        "start_date": day,
+        "end_date": end_day or day,
+        "hourly": HOURLY_FIELDS,
+        "timezone": "auto",
+    }
+    _count("network_calls")
+    try:
+        resp = _session.get(url, params=params, timeout=TIMEOUT)
+        resp.raise_for_status()
+        hourly = resp.json().get("hourly") or {}
+    except (requests.RequestException, ValueError) as e:
+        _count("errors")
+        print(f"⚠️ Météo API erreur: {e}")
+        return None
+    return {
+        "time": hourly.get("time") or [],
+        "temperature_2m": hourly.get("temperature_2m") or [],
+        "weathercode": hourly.get("weathercode") or [],
+    }
+
+
+def _complete(series: Dict[str, List[Any]]) -> bool:
+    temps = series.get("temperature_2m") or []
+    return bool(temps) and all(t is not None for t in temps)
+
+
+def _split_days(series: Dict[str, List[Any]]) -> Dict[str, Dict[str, List[Any]]]:
+    """Série horaire sur plusieurs jours -> {jour: série du jour}."""
+    days: Dict[str, Dict[str, List[Any]]] = {}
+    temps, codes = series.get("temperature_2m") or [], series.get("weathercode") or []
+    for i, hour in enumerate(series.get("time") or []):
+        day = days.setdefault(hour[:10], {"time": [], "temperature_2m": [], "weathercode": []})
+        day["time"].append(hour)
+        day["temperature_2m"].append(temps[i] if i < len(temps) else None)
+        day["weathercode"].append(codes[i] if i < len(codes) else None)
+    return days
+
+
+def _store(key: str, series: Dict[str, List[Any]], permanent: bool) -> Dict[str, Any]:
+    entry = dict(series, source="archive" if permanent else "forecast", permanent=permanent,
+                 fetched_at=time.time())
+    if not permanent:
+        entry["expires_at"] = time.time() + FORECAST_TTL
+    dal.kv_put(CACHE_NAMESPACE, key, entry)
+    _dbg(f"{key}: {entry['source']} ({len(entry['time'])} heures)")
+    return entry
+
+
+def _valid(entry: Optional[Dict[str, Any]]) -> bool:
+    return entry is not None and bool(entry.get("permanent") or time.time() < entry.get("expires_at", 0))
+
+
+def hourly(lat: float, lng: float, day: str) -> Optional[Dict[str, Any]]:
+    """
+    Série horaire (time, temperature_2m, weathercode, heures locales) du jour
+    `day` (YYYY-MM-DD) pour la cellule de (lat, lng) ; depuis le cache si possible.
+    """
+    key = cache_key(lat, lng, day)
+    entry = dal.kv_get(CACHE_NAMESPACE, key)
+    if _valid(entry):
+        _count("hits")
+        return entry
+    _count("misses")
+
+    cell = grid_cell(lat, lng)
+    series, permanent = None, False
+    if not _is_recent(day):
+        series = _fetch(ARCHIVE_URL, cell, day)
+        permanent = series is not None and _complete(series)
+    if not permanent:
+        # Aujourd'hui / hier, ou archive pas encore disponible pour ce jour
+        forecast = _fetch(FORECAST_URL, cell, day)
+        if forecast is not None and (series is None or _complete(forecast)):
+            series = forecast
+    if series is None:
+        return entry  # réseau indisponible : dernière valeur connue (même expirée)
+
+    return _store(key, series, permanent)
+
+
+def prefetch(points: Iterable[Tuple[float, float, str]]) -> Dict[str, int]:
+    """
+    Remplit le cache pour un lot de (lat, lng, jour) : jours manquants regroupés
+    par cellule, une requête archive par cellule sur toute la plage (min..max),
+    puis une requête prévision par cellule pour les jours récents ou pas encore
+    archivés. Seuls les jours demandés sont conservés. Les appels suivants à
+    hourly() / daily_summary() pour ces jours sont servis par le cache.
+    Retourne {"cells": n, "days": n, "network_calls": n}.
+    """
+    by_cell: Dict[Tuple[float, float], set] = defaultdict(set)
+    for lat, lng, day in points:
+        by_cell[grid_cell(lat, lng)].add(day[:10])
+
+    report = {"cells": 0, "days": 0, "network_calls": 0}
+    for cell, days in by_cell.items():
+        keys = {day: cache_key(cell[0], cell[1], day) for day in days}
+        cached = dal.kv_get_many(CACHE_NAMESPACE, keys.values())
+        missing = sorted(day for day in days if not _valid(cached.get(keys[day])))
+        if not missing:
+            continue
+        report["cells"] += 1
+
+        pending = [day for day in missing if _is_recent(day)]
+        archived = [day for day in missing if not _is_recent(day)]
+        if archived:
+            report["network_calls"] += 1
+            series = _fetch(ARCHIVE_URL, cell, archived[0], archived[-1])
+            by_day = _split_days(series) if series is not None else {}
+            for day in archived:
+                if by_day.get(day) and _complete(by_day[day]):
+                    _store(keys[day], by_day[day], permanent=True)
+                    report["days"] += 1
+                else:
+                    pending.append(day)  # archive pas encore disponible pour ce jour
+        if pending:
+            pending.sort()
+            report["network_calls"] += 1
+            series = _fetch(FORECAST_URL, cell, pending[0], pending[-1])
+            by_day = _split_days(series) if series is not None else {}
+            for day in pending:
+                if by_day.get(day):
+                    _store(keys[day], by_day[day], permanent=False)
+                    report["days"] += 1
+    _dbg(f"prefetch: {report}")
+    return report
+
+
+def _hours(day_series: List[Optional[Dict[str, Any]]]) -> Tuple[List[datetime], List[Any], List[Any]]:
+    hours, temps, codes = [], [], []
+    for series in day_series:
+        if not series:
+            continue
+        hours.extend(datetime.fromisoformat(h) for h in series.get("time", []))
+        temps.extend(series.get("temperature_2m", []))
+        codes.extend(series.get("weathercode", []))
+    n = min(len(hours), len(temps), len(codes)) if codes else min(len(hours), len(temps))
+    return hours[:n], temps[:n], (codes[:n] if codes else [None] * n)
+
+
+def daily_summary(lat: float, lng: float, date_str: str) -> Tuple[Optional[float], Optional[int]]:
+    """
+    (température max, code météo du jour) pour la date (ISO, seul le jour compte).
+    Code du jour = code horaire le plus élevé (le plus sévère), comme le daily d'Open-Meteo.
+    """
+    _, temps, codes = _hours([hourly(lat, lng, date_str[:10])])
+    temps = [t for t in temps if t is not None]
+    codes = [c for c in codes if c is not None]
+    return (max(temps) if temps else None), (max(codes) if codes else None)
+
+
+def run_weather(lat: float, lng: float, start_dt: datetime,
+                duration_minutes: float) -> Tuple[Optional[float], Optional[float], Optional[float], Optional[int]]:
+    """
+    Météo d'une sortie (start_dt naïf, heure locale) :
+    (température moyenne, au départ, à l'arrivée, code météo dominant ±30 min).
+    """
+    end_dt = start_dt + timedelta(minutes=duration_minutes)
+    days = sorted({start_dt.date().isoformat(), end_dt.date().isoformat()})
+    hours_dt, temps, weathercodes = _hours([hourly(lat, lng, day) for day in days])
+    if not hours_dt or not temps:
+        print("⚠️ Aucune donnée horaire trouvée.")
+        return None, None, None, None
+
+    # Température la plus proche pour début et fin
+    def closest_temp(target_dt):
+        diffs = [abs((dt - target_dt).total_seconds()) for dt in hours_dt]
+        return temps[diffs.index(min(diffs))]
+
+    temp_debut = closest_temp(start_dt)
+    temp_fin = closest_temp(end_dt)
+
+    # Moyenne sur la fenêtre de course, sinon au moins temp_debut ou temp_fin
+    temp_values = [temp for dt, temp in zip(hours_dt, temps) if start_dt <= dt <= end_dt and temp is not None]
+    avg_temp = round(sum(temp_values) / len(temp_values), 1) if temp_values else temp_debut or temp_fin
+
+    # Code météo le plus fréquent avec une marge de 30 min, sinon le plus proche du départ
+    margin = timedelta(minutes=30)
+    weather_in_window = [
+        wc for dt, wc in zip(hours_dt, weathercodes)
+        if (start_dt - margin) <= dt <= (end_dt + margin) and wc is not None
+    ]
+    if weather_in_window:
+        most_common_code = Counter(weather_in_window).most_common(1)[0][0]
+    else:
+        diffs = [abs((dt - start_dt).total_seconds()) for dt in hours_dt]
+        most_common_code = weathercodes[diffs.index(min(diffs))]
+
+    return avg_temp, temp_debut, temp_fin, most_common_code